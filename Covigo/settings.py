@@ -170,3 +170,11 @@ LOGIN_REDIRECT_URL = '/accounts/two_factor_authentication'
 LOGOUT_REDIRECT_URL = '/accounts/login'
 
 ENCRYPTION_KEY_DIRECTORY = BASE_DIR / 'keys'
+
+# Rendered patient qr codes, which are served by accounts.views.patient_qr_code rather than as static files
+QR_CODE_DIRECTORY = Path(getenv("QR_CODE_DIRECTORY", BASE_DIR / 'qrs'))
+
+# Where the external case data shown in the dashboard is fetched from, which can also be a file:// url, and the file it
+# is cached in between two refreshes
+EXTERNAL_CASE_DATA_SOURCE = getenv("EXTERNAL_CASE_DATA_SOURCE", "https://api.opencovid.ca/summary?loc=QC")
+EXTERNAL_CASE_DATA_FILE = Path(getenv("EXTERNAL_CASE_DATA_FILE", BASE_DIR / 'external_case_data.json'))
@@ -0,0 +1,317 @@
+import datetime
+import json
+import re
+
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import BooleanField, Q
+from django.db.models.query import QuerySet
+from django.http import StreamingHttpResponse
+
+TABLE_PAGE_LENGTH = 10
+TABLE_MAX_PAGE_LENGTH = 100
+
+# Separator of the values of a column filter that matches any one of several values, e.g. "2|6"
+COLUMN_FILTER_SEPARATOR = "|"
+
+COLUMN_DATA_PARAMETER = re.compile(r"columns\[(\d+)]\[data]")
+
+
+def table_response(request, rows, columns, search_columns=(), default_order=(), key="id", format_row=None):
+    """
+    Builds the response of a server-side DataTables endpoint. Only the page requested by the table is fetched, encoded
+    and sent, after applying its search box, column filters and ordering, so that the cost of a request depends on
+    the page length rather than on the size of the table.
+    Querysets are filtered, ordered and paged by the database. When the table asks for the page that follows the last
+    one it received, the page is found by seeking past that page's last row instead of counting past every preceding
+    row. Lists are filtered, ordered and paged in memory, for tables that are not backed by the database.
+    @param request: http request from the table, with the DataTables server-side parameters
+    @param rows: queryset or list of dicts to show in the table
+    @param columns: dict of the DataTables data names sent to the table, to the queryset lookups (or list keys) that
+    their values come from
+    @param search_columns: data names of the columns matched against the search box
+    @param default_order: data names to order by when the table does not specify an order, prefixed with "-" to order
+    in descending order
+    @param key: lookup of a unique value of each row, which is used to order rows with equal values and to seek to the
+    next page, or None if there is none
+    @param format_row: optional function that returns the row to send for each row dict of the page
+    @return: json response of the page, with the total and filtered row counts and the cursor of the next page
+    """
+
+    draw = _get_int(request, "draw", 0)
+    start = max(_get_int(request, "start", 0), 0)
+    length = _get_int(request, "length", TABLE_PAGE_LENGTH)
+    length = min(length, TABLE_MAX_PAGE_LENGTH) if length > 0 else TABLE_MAX_PAGE_LENGTH
+
+    column_names = _get_column_names(request)
+    search = request.GET.get("search[value]", "").strip()
+    column_filters = {
+        name: value.split(COLUMN_FILTER_SEPARATOR)
+        for name, value in (
+            (name, request.GET.get(f"columns[{i}][search][value]", "")) for i, name in column_names.items()
+        )
+        if name in columns and value
+    }
+    order = _get_order(request, column_names, columns) or [
+        (name.lstrip("-"), name.startswith("-")) for name in default_order
+    ]
+
+    if isinstance(rows, QuerySet):
+        records_total = rows.count()
+        page, records_filtered, next_page = _get_queryset_page(
+            request, rows, columns, search, search_columns, column_filters, order, key, start, length
+        )
+    else:
+        records_total = len(rows)
+        page, records_filtered = _get_list_page(rows, columns, search, search_columns, column_filters, order, start,
+                                                length)
+        next_page = None
+
+    if format_row:
+        page = map(format_row, page)
+
+    return StreamingHttpResponse(
+        _encode_table(draw, records_total, records_filtered, page, next_page),
+        content_type='application/json'
+    )
+
+
+def _get_int(request, name, default):
+    try:
+        return int(request.GET.get(name, default))
+    except ValueError:
+        return default
+
+
+def _get_column_names(request):
+    column_names = {}
+    for parameter, value in request.GET.items():
+        match = COLUMN_DATA_PARAMETER.fullmatch(parameter)
+        if match:
+            column_names[int(match.group(1))] = value
+    return column_names
+
+
+def _get_order(request, column_names, columns):
+    order = []
+    i = 0
+    while f"order[{i}][column]" in request.GET:
+        name = column_names.get(_get_int(request, f"order[{i}][column]", -1))
+        if name in columns:
+            order.append((name, request.GET.get(f"order[{i}][dir]") == "desc"))
+        i += 1
+    return order
+
+
+def _get_queryset_page(request, queryset, columns, search, search_columns, column_filters, order, key, start,
+                       length):
+    if search and search_columns:
+        queryset = queryset.filter(reduce(or_, (
+            Q(**{f"{columns[name]}__icontains": search}) for name in search_columns
+        )))
+
+    for name, values in column_filters.items():
+        values = _get_filter_values(queryset, columns[name], values)
+        if not values:
+            # None of the values can be stored in the column, so no row matches
+            queryset = queryset.none()
+        elif len(values) == 1:
+            queryset = queryset.filter(**{columns[name]: values[0]})
+        else:
+            queryset = queryset.filter(**{f"{columns[name]}__in": values})
+
+    records_filtered = queryset.count()
+
+    order_fields = [(columns[name], descending) for name, descending in order]
+    if key and key not in [lookup for lookup, _ in order_fields]:
+        order_fields.append((key, order_fields[0][1] if order_fields else False))
+    if order_fields:
+        queryset = queryset.order_by(*(f"-{lookup}" if descending else lookup for lookup, descending in order_fields))
+
+    # Seeking compares the ordered values of the rows, which is only possible if they are unique and not aggregated.
+    # Rows whose value is NULL can't be compared, so they would be skipped.
+    can_seek = (
+        bool(key)
+        and queryset.query.group_by is None
+        and not any(_is_nullable(queryset, lookup) for lookup, _ in order_fields)
+    )
+
+    cursor = _get_cursor(request, queryset, order_fields) if can_seek else None
+    seek_filter = _get_seek_filter(queryset, order_fields, cursor) if cursor is not None else None
+    if seek_filter is not None:
+        queryset = seek_filter[:length]
+    else:
+        queryset = queryset[start:start + length]
+
+    lookups = list(dict.fromkeys([*columns.values(), *(lookup for lookup, _ in order_fields)]))
+    page = list(queryset.values(*lookups))
+
+    next_page = None
+    if can_seek and len(page) == length:
+        values = [page[-1][lookup] for lookup, _ in order_fields]
+        if None not in values:
+            next_page = {"start": start + length, "cursor": _encode_cursor(values)}
+
+    return [{name: row[lookup] for name, lookup in columns.items()} for row in page], records_filtered, next_page
+
+
+def _get_filter_values(queryset, lookup, values):
+    """
+    Converts the values of a column filter to the type of the column, leaving out those that it can't hold, e.g. "abc"
+    for an integer column. Values of annotations are kept as they are.
+    @return: the list of converted values
+    """
+
+    field = _get_field(queryset, lookup)
+    if field is None:
+        return values
+
+    converted = []
+    for value in values:
+        try:
+            converted.append(field.to_python(value))
+        except (TypeError, ValueError, ValidationError):
+            pass
+    return converted
+
+
+def _encode_cursor(values):
+    # DjangoJSONEncoder cuts times down to milliseconds, which would make the seek filter compare against a value that
+    # is before the last row of the page
+    return json.dumps([
+        value.isoformat() if isinstance(value, (datetime.datetime, datetime.time)) else value for value in values
+    ], cls=DjangoJSONEncoder)
+
+
+def _get_cursor(request, queryset, order_fields):
+    """
+    Reads the cursor of the page to seek to, which holds the ordered values of the last row of the previous page, and
+    converts them to the types of the ordered fields
+    @return: the list of values, or None if there is no cursor or it is malformed, in which case the page is found by
+    its offset
+    """
+
+    try:
+        values = json.loads(request.GET.get("cursor", ""))
+    except ValueError:
+        return None
+
+    if not isinstance(values, list) or len(values) != len(order_fields):
+        return None
+
+    converted = []
+    for value, (lookup, _) in zip(values, order_fields):
+        field = _get_field(queryset, lookup)
+        if not isinstance(value, (str, int, float)) or field is None:
+            return None
+        # Booleans are ints in Python, but are only a valid cursor value for boolean fields
+        if isinstance(value, bool) != isinstance(field, BooleanField):
+            return None
+
+        try:
+            converted.append(field.to_python(value))
+        except (TypeError, ValueError, ValidationError):
+            return None
+
+    return converted
+
+
+def _get_field(queryset, lookup):
+    """
+    Finds the model field that the values of a lookup come from, following its relations
+    @return: the field, or None if the lookup is not a field with a column of its own, e.g. an annotation
+    """
+
+    model = queryset.model
+    field = None
+    for name in lookup.split("__"):
+        if model is None:
+            return None
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        model = field.related_model
+
+    # Reverse and many-to-many relations have no column of their own to convert values to
+    return field if field.concrete and not field.many_to_many else None
+
+
+def _is_nullable(queryset, lookup):
+    """
+    Checks whether the values of a lookup can be NULL, which is assumed of annotations and of values reached through a
+    relation that can be missing
+    """
+
+    model = queryset.model
+    for name in lookup.split("__"):
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return True
+
+        if field.null or not field.concrete or field.many_to_many:
+            return True
+        model = field.related_model
+
+    return False
+
+
+def _get_seek_filter(queryset, order_fields, values):
+    """
+    Filters the rows that come after a row in the given order, e.g. for an order on (a, id) the rows with a greater a,
+    or with an equal a and a greater id
+    @return: the filtered queryset, or None if the values can't be compared with the ordered fields
+    """
+
+    conditions = []
+    for i, (lookup, descending) in enumerate(order_fields):
+        equal_before = {previous: value for (previous, _), value in zip(order_fields[:i], values)}
+        after = {f"{lookup}__{'lt' if descending else 'gt'}": values[i]}
+        conditions.append(Q(**equal_before, **after))
+
+    try:
+        return queryset.filter(reduce(or_, conditions))
+    except (TypeError, ValueError, ValidationError):
+        return None
+
+
+def _get_list_page(rows, columns, search, search_columns, column_filters, order, start, length):
+    if search and search_columns:
+        search = search.casefold()
+        rows = [
+            row for row in rows
+            if any(search in str(row[columns[name]]).casefold() for name in search_columns)
+        ]
+
+    for name, values in column_filters.items():
+        rows = [row for row in rows if _format_filter_value(row[columns[name]]) in values]
+
+    # Sort by the least significant column first, relying on the sorts being stable
+    rows = list(rows)
+    for name, descending in reversed(order):
+        lookup = columns[name]
+        rows.sort(key=lambda row: (row[lookup] is None, row[lookup]), reverse=descending)
+
+    page = [{name: row[lookup] for name, lookup in columns.items()} for row in rows[start:start + length]]
+
+    return page, len(rows)
+
+
+def _format_filter_value(value):
+    # Booleans are filtered with "1" and "0", like boolean fields in querysets
+    if isinstance(value, bool):
+        return str(int(value))
+    return str(value)
+
+
+def _encode_table(draw, records_total, records_filtered, rows, next_page):
+    yield f'{{"draw":{draw},"recordsTotal":{records_total},"recordsFiltered":{records_filtered},"data":['
+
+    for i, row in enumerate(rows):
+        yield ("," if i else "") + json.dumps(row, cls=DjangoJSONEncoder, separators=(",", ":"))
+
+    yield f'],"next":{json.dumps(next_page, separators=(",", ":"))}}}'
@@ -0,0 +1,26 @@
+"""
+Settings for running the tests, which use an in-memory SQLite database instead of the MySQL server so that they need
+no setup and can run in parallel:
+
+    python manage.py test --settings=Covigo.test_settings --parallel
+"""
+
+from Covigo.settings import *  # noqa
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }
+}
+
+# Hashing passwords with a fast hasher saves most of the time of the tests that create users
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.MD5PasswordHasher',
+]
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
@@ -0,0 +1,111 @@
+import datetime
+import json
+
+from django.contrib.auth.models import User
+from django.test import RequestFactory, TestCase
+
+from Covigo.tables import table_response
+
+
+class TableResponseTests(TestCase):
+    def setUp(self):
+        for i, name in enumerate(["alice", "bert", "carl", "dave", "emma"]):
+            # Two of the users never logged in, and the users joined less than a millisecond apart in reverse order
+            last_login = datetime.datetime(2022, 4, 1 + i) if name not in ["bert", "dave"] else None
+            date_joined = datetime.datetime(2022, 3, 1, 12) + datetime.timedelta(microseconds=100 * (4 - i))
+            User.objects.create(username=name, last_login=last_login, date_joined=date_joined, is_staff=i % 2 == 0)
+
+    def get_table(self, **params):
+        columns = ["username", "last_login", "date_joined", "is_staff"]
+        request = RequestFactory().get("/", {
+            "draw": 1,
+            **{f"columns[{i}][data]": name for i, name in enumerate(columns)},
+            **params,
+        })
+        response = table_response(request, User.objects.all(), columns={name: name for name in columns})
+        return json.loads(b"".join(response.streaming_content))
+
+    def get_all_pages(self, **params):
+        """
+        Gets every page of the table, following the cursor of each page to the next one
+        @return: list of the usernames of the rows, in the order they were sent
+        """
+
+        page = self.get_table(start=0, **params)
+        usernames = [row["username"] for row in page["data"]]
+        # A cursor that doesn't move past the rows it was sent with would otherwise be followed forever
+        while page["next"] and len(usernames) <= page["recordsFiltered"]:
+            page = self.get_table(start=page["next"]["start"], cursor=page["next"]["cursor"], **params)
+            usernames += [row["username"] for row in page["data"]]
+        return usernames
+
+    def test_malformed_cursor_falls_back_to_offset(self):
+        """
+        Test that a cursor that can't be read or compared is ignored, and the page is found by its offset
+        @return: void
+        """
+
+        order = {"order[0][column]": 0, "length": 2, "start": 2}
+        offset_page = self.get_table(**order)
+
+        for cursor in ["not json", "{}", '["bert"]', '[true, 1]', '["bert", "x"]', "[[1], 2]"]:
+            self.assertEqual(offset_page["data"], self.get_table(cursor=cursor, **order)["data"])
+
+    def test_null_sort_values_are_not_skipped(self):
+        """
+        Test that paging over a column with NULL values returns every row, even when a cursor is sent
+        @return: void
+        """
+
+        order = {"order[0][column]": 1, "order[0][dir]": "desc", "length": 2}
+
+        first_page = self.get_table(start=0, **order)
+        self.assertIsNone(first_page["next"])
+        last_row = first_page["data"][-1]
+        cursor = json.dumps([last_row["last_login"], User.objects.get(username=last_row["username"]).id])
+
+        usernames = [row["username"] for row in first_page["data"]]
+        for start in [2, 4]:
+            usernames += [row["username"] for row in self.get_table(start=start, cursor=cursor, **order)["data"]]
+
+        self.assertEqual(["alice", "bert", "carl", "dave", "emma"], sorted(usernames))
+
+    def test_cursor_keeps_the_full_precision_of_times(self):
+        """
+        Test that following the cursors of a table ordered by times less than a millisecond apart returns every row
+        once and in order
+        @return: void
+        """
+
+        for direction, usernames in [("asc", ["emma", "dave", "carl", "bert", "alice"]),
+                                     ("desc", ["alice", "bert", "carl", "dave", "emma"])]:
+            self.assertEqual(usernames, self.get_all_pages(**{"order[0][column]": 2, "order[0][dir]": direction,
+                                                              "length": 2}))
+
+    def test_boolean_order_seeks_to_the_next_page(self):
+        """
+        Test that a table ordered by a boolean column pages with its cursor
+        @return: void
+        """
+
+        order = {"order[0][column]": 3, "length": 2}
+
+        first_page = self.get_table(start=0, **order)
+        self.assertIs(False, json.loads(first_page["next"]["cursor"])[0])
+        # The offset is ignored when the page is found with the cursor
+        second_page = self.get_table(start=0, cursor=first_page["next"]["cursor"], **order)
+        self.assertEqual(["alice", "carl"], [row["username"] for row in second_page["data"]])
+
+        self.assertEqual(["bert", "dave", "alice", "carl", "emma"], self.get_all_pages(**order))
+
+    def test_invalid_column_filter_matches_no_rows(self):
+        """
+        Test that a column filter with values the column can't hold matches no rows instead of failing
+        @return: void
+        """
+
+        self.assertEqual(0, self.get_table(**{"columns[3][search][value]": "abc"})["recordsFiltered"])
+        self.assertEqual(0, self.get_table(**{"columns[2][search][value]": "yesterday"})["recordsFiltered"])
+        self.assertEqual(3, self.get_table(**{"columns[3][search][value]": "1"})["recordsFiltered"])
+        # Only the values the column can hold are matched
+        self.assertEqual(5, self.get_table(**{"columns[3][search][value]": "0|1|abc"})["recordsFiltered"])
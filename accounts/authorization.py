@@ -0,0 +1,178 @@
+from functools import cached_property
+
+from accounts.models import Patient
+
+
+class AuthorizationContext:
+    """
+    What the logged-in user is allowed to do, loaded once per request. The user's permissions and the ids of their
+    assigned patients are fetched the first time they are needed and kept in sets, so that every permission check of
+    a view is answered without querying the database again.
+    Build it with get_authorization_context(request) rather than directly, so that it is shared by the whole request.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    @cached_property
+    def permissions(self):
+        """
+        The "app_label.codename" strings of the user's own and group permissions
+        """
+
+        return frozenset(self.user.get_all_permissions())
+
+    @cached_property
+    def assigned_patient_ids(self):
+        """
+        The user ids of the patients assigned to the user, which is empty if the user is not a staff member
+        """
+
+        return frozenset(Patient.objects.filter(assigned_staff__user=self.user).values_list("user_id", flat=True))
+
+    @cached_property
+    def assigned_staff_user_id(self):
+        """
+        The user id of the doctor assigned to the user, or None if the user is not a patient or has no doctor
+        """
+
+        return Patient.objects.filter(user=self.user).values_list("assigned_staff__user_id", flat=True).first()
+
+    def has_perm(self, perm):
+        """
+        Same as User.has_perm, without querying the database after the first check
+        @param perm: the "app_label.codename" of the permission
+        @return: whether the user has the permission
+        """
+
+        if not self.user.is_active:
+            return False
+        return self.user.is_superuser or perm in self.permissions
+
+    def has_any_perm(self, *perms):
+        return any(self.has_perm(perm) for perm in perms)
+
+    def is_self(self, target):
+        return target.id == self.user.id
+
+    def is_assigned(self, target):
+        """
+        Checks whether a user is one of the logged-in user's assigned patients
+        @param target: any user
+        @return: whether the user is assigned to the logged-in user
+        """
+
+        return target.id in self.assigned_patient_ids
+
+    def is_assigned_doctor(self, target):
+        """
+        Checks whether a user is the doctor assigned to the logged-in user
+        @param target: any user
+        @return: whether the user is the logged-in user's assigned doctor
+        """
+
+        return self.assigned_staff_user_id is not None and target.id == self.assigned_staff_user_id
+
+    def can_edit(self, target):
+        if self.is_self(target):
+            return self.has_perm("accounts.edit_self")
+
+        return (
+                self.has_perm("accounts.edit_user")
+                or self.has_perm("accounts.edit_patient") and not target.is_staff
+                or self.has_perm("accounts.edit_assigned") and self.is_assigned(target)
+        )
+
+    def can_view_appointments(self, target):
+        return (
+                self.is_self(target)
+                or self.has_perm("accounts.view_user_appointment")
+                or self.has_perm("accounts.view_patient_appointment") and not target.is_staff
+                or self.has_perm("accounts.is_doctor") and self.is_assigned(target)
+        )
+
+    def can_flag(self, target):
+        if not self.user.is_staff:
+            return False
+
+        return (
+                self.has_perm("accounts.flag_patients") and not target.is_staff
+                or self.has_perm("accounts.flag_assigned") and self.is_assigned(target)
+        )
+
+    def can_view_code(self, target):
+        return (
+                self.is_self(target) and self.has_perm("accounts.view_own_code")
+                or self.has_perm("accounts.view_patient_code")
+                or self.has_perm("accounts.view_assigned_code") and self.is_assigned(target)
+        )
+
+    def can_view_test_report(self, target):
+        return (
+                self.is_self(target)
+                or self.has_perm("accounts.view_patient_test_report")
+                or self.has_perm("accounts.view_assigned_test_report") and self.is_assigned(target)
+        )
+
+    def can_view_assigned_doctor(self, target):
+        return (
+                self.is_self(target)
+                or self.has_perm("accounts.view_assigned_doctor")
+                or self.is_assigned(target)
+        )
+
+    def can_view_assigned_patients(self, target):
+        return self.is_self(target) or self.has_perm("accounts.view_assigned_patients")
+
+    def can_assign_symptoms(self, target):
+        return not target.is_staff and (
+                self.has_perm("accounts.assign_symptom_patient")
+                or self.has_perm("accounts.assign_symptom_assigned") and self.is_assigned(target)
+        )
+
+    def can_edit_case(self, target):
+        return not target.is_staff and (
+                self.has_any_perm("accounts.set_patient_case", "accounts.set_patient_quarantine")
+                or (
+                        self.has_perm("accounts.is_doctor")
+                        and self.is_assigned(target)
+                        and self.has_any_perm("accounts.set_assigned_case", "accounts.set_assigned_quarantine")
+                )
+        )
+
+    def can_submit_location(self, user_id):
+        """
+        Checks whether the logged-in user may send the location pings of a user, which is checked by id since a batch
+        of pings only has the ids of their users
+        @param user_id: id of any user
+        @return: whether the user's location pings are accepted from the logged-in user
+        """
+
+        return (
+                user_id == self.user.id
+                or self.has_perm("accounts.set_patient_quarantine")
+                or self.has_perm("accounts.set_assigned_quarantine") and user_id in self.assigned_patient_ids
+        )
+
+    def can_message(self, target):
+        return not self.is_self(target) and (
+                self.has_perm("accounts.message_user")
+                or self.has_perm("accounts.message_patient") and not target.is_staff
+                or self.has_perm("accounts.message_assigned") and self.is_assigned(target)
+                or self.has_perm("accounts.message_doctor") and self.is_assigned_doctor(target)
+        )
+
+
+def get_authorization_context(request):
+    """
+    Gets the authorization context of the logged-in user, which is built on the first call of a request and reused by
+    the following ones
+    @param request: http request from the client
+    @return: the AuthorizationContext of the request's user
+    """
+
+    context = getattr(request, "_authorization_context", None)
+    if context is None or context.user is not request.user:
+        context = AuthorizationContext(request.user)
+        request._authorization_context = context
+    return context
@@ -0,0 +1,101 @@
+import datetime
+
+import numpy as np
+
+from accounts.models import PatientCaseEvent
+
+# Number of events saved by each insert
+PATIENT_CASE_EVENT_BATCH_SIZE = 1000
+
+# Case statuses of the rebuilt series, computed from the (is_confirmed, is_negative, is_quarantining) status of events
+CASE_SERIES_STATUSES = {
+    "confirmed": lambda confirmed, negative, quarantining: confirmed,
+    "positive": lambda confirmed, negative, quarantining: confirmed & ~negative,
+    "recovered": lambda confirmed, negative, quarantining: confirmed & negative,
+    "negative": lambda confirmed, negative, quarantining: negative,
+    "unconfirmed_negative": lambda confirmed, negative, quarantining: ~confirmed & negative,
+    "quarantining": lambda confirmed, negative, quarantining: quarantining,
+}
+
+
+def record_case_events(patients, timestamp=None):
+    """
+    Logs the case status of the patients whose status changed since they were loaded, in a single insert. It is meant
+    to be called after the patients are saved.
+    @param patients: iterable of Patient objects
+    @param timestamp: datetime of the change, which defaults to now
+    @return: the number of events recorded
+    """
+
+    timestamp = timestamp or datetime.datetime.now()
+    events = []
+
+    for patient in patients:
+        status = patient.get_case_status()
+        # A new patient starts with the default status, which is not logged
+        if status == getattr(patient, "loaded_case_status", (False, False, False)):
+            continue
+
+        events.append(PatientCaseEvent(
+            patient_id=patient.user_id,
+            timestamp=timestamp,
+            **dict(zip(patient.CASE_STATUS_FIELDS, status)),
+        ))
+        patient.loaded_case_status = status
+
+    PatientCaseEvent.objects.bulk_create(events, batch_size=PATIENT_CASE_EVENT_BATCH_SIZE)
+    return len(events)
+
+
+def build_case_series(start_date, end_date, events=None):
+    """
+    Rebuilds the number of patients of each case status at the end of every day of a date range, from the case events.
+    Each event adds to the count of the statuses it enters and removes from the ones the patient leaves, so the counts
+    of every day are read from the cumulative sums of the events sorted by time.
+    @param start_date: first date of the series
+    @param end_date: last date of the series
+    @param events: optional queryset of the PatientCaseEvent rows to count, by default every one
+    @return: dict with the numpy array of the "dates" and the array of the counts of each case status of the series
+    """
+
+    if events is None:
+        events = PatientCaseEvent.objects.all()
+
+    day_ends = np.arange(
+        np.datetime64(start_date, "D"), np.datetime64(end_date, "D") + 1, dtype="datetime64[D]"
+    ) + np.timedelta64(1, "D")
+
+    rows = list(
+        events.filter(timestamp__lt=end_date + datetime.timedelta(days=1))
+        .order_by("patient_id", "timestamp", "id")
+        .values_list("patient_id", "timestamp", "is_confirmed", "is_negative", "is_quarantining")
+    )
+    if not rows:
+        return {
+            "dates": day_ends - np.timedelta64(1, "D"),
+            **{status: np.zeros(len(day_ends), dtype=np.int64) for status in CASE_SERIES_STATUSES},
+        }
+
+    patient_ids, timestamps, confirmed, negative, quarantining = zip(*rows)
+    patient_ids = np.array(patient_ids)
+    timestamps = np.array(timestamps, dtype="datetime64[us]")
+    confirmed, negative, quarantining = (np.array(flags, dtype=bool) for flags in (confirmed, negative, quarantining))
+
+    # Events are sorted by patient, so the previous event of the same patient is the previous row, unless it is their
+    # first event
+    first_events = np.ones(len(rows), dtype=bool)
+    first_events[1:] = patient_ids[1:] != patient_ids[:-1]
+    order = np.argsort(timestamps, kind="stable")
+    positions = np.searchsorted(timestamps[order], day_ends.astype("datetime64[us]"), side="left")
+
+    series = {"dates": day_ends - np.timedelta64(1, "D")}
+    for status, get_status in CASE_SERIES_STATUSES.items():
+        statuses = get_status(confirmed, negative, quarantining).astype(np.int64)
+        changes = statuses.copy()
+        changes[1:] -= statuses[:-1]
+        changes[first_events] = statuses[first_events]
+
+        counts = np.concatenate([[0], np.cumsum(changes[order])])
+        series[status] = counts[positions]
+
+    return series
@@ -0,0 +1,142 @@
+import heapq
+import math
+
+import numpy as np
+
+from django.db import transaction
+from django.db.models import F
+
+from accounts.doctor_locations import DoctorLocationIndex
+from accounts.models import Patient
+from accounts.postal_codes import get_postal_code_index, haversine_distances
+
+
+class DoctorAssignmentPlan:
+    """
+    Doctors chosen for a batch of patients. Each patient is given the closest doctor that still has room, and the pairs
+    of patient and doctor that are the closest overall are chosen first, so that no doctor fills up with the patients
+    of another doctor's area.
+    """
+
+    def __init__(self, capacity):
+        # Maximum number of patients of each doctor, including the patients they already had
+        self.capacity = capacity
+        # List of (patient, doctor, distance in meters) tuples
+        self.assignments = []
+        # Patients whose postal code is missing or unknown
+        self.unlocated = []
+        # Patients left unassigned because every doctor was full
+        self.unassigned = []
+        # Number of patients of each doctor before and after the assignment, keyed by doctor
+        self.loads = {}
+
+    def get_distance_percentile(self, percentile):
+        """
+        Gets a percentile of the distances between the assigned patients and their doctor
+        @param percentile: percentile between 0 and 100
+        @return: distance in meters, or None if no patient was assigned
+        """
+
+        if not self.assignments:
+            return None
+        return float(np.percentile([distance for _, _, distance in self.assignments], percentile))
+
+
+def get_balanced_capacity(doctor_patient_counts, patient_count):
+    """
+    Gets the number of patients that every doctor would have if all the patients were shared evenly between them
+    @param doctor_patient_counts: number of patients that each doctor already has
+    @param patient_count: number of patients to assign
+    @return: the maximum number of patients of each doctor
+    """
+
+    if not doctor_patient_counts:
+        return 0
+    return math.ceil((sum(doctor_patient_counts) + patient_count) / len(doctor_patient_counts))
+
+
+def plan_doctor_assignment(patients, doctor_index, capacity=None, postal_code_index=None):
+    """
+    Chooses a doctor for each patient of a batch, without saving anything
+    @param patients: patients to assign, each with a postal_code attribute
+    @param doctor_index: DoctorLocationIndex of the doctors to choose from
+    @param capacity: maximum number of patients of each doctor, which defaults to an even share of all the patients
+    @param postal_code_index: index the patients' postal codes are looked up in, which defaults to the process' index
+    @return: the DoctorAssignmentPlan
+    """
+
+    if postal_code_index is None:
+        postal_code_index = get_postal_code_index()
+
+    patients = list(patients)
+    doctor_patient_counts = [doctor.patient_count for doctor in doctor_index.doctors]
+
+    latitudes, longitudes, found = postal_code_index.get_many(patient.postal_code for patient in patients)
+    located = [patient for patient, is_found in zip(patients, found) if is_found]
+
+    if capacity is None:
+        capacity = get_balanced_capacity(doctor_patient_counts, len(located))
+
+    plan = DoctorAssignmentPlan(capacity)
+    plan.unlocated = [patient for patient, is_found in zip(patients, found) if not is_found]
+    plan.loads = {doctor: [count, count] for doctor, count in zip(doctor_index.doctors, doctor_patient_counts)}
+
+    if not len(doctor_index):
+        plan.unassigned = located
+        return plan
+
+    # Matrix of the distances from every patient (rows) to every doctor (columns), and each patient's doctors from the
+    # closest to the farthest
+    distances = haversine_distances(
+        latitudes[found][:, np.newaxis], longitudes[found][:, np.newaxis],
+        doctor_index.latitudes, doctor_index.longitudes,
+    )
+    preferences = np.argsort(distances, axis=1, kind="stable")
+    remaining = np.maximum(capacity - np.array(doctor_patient_counts), 0)
+
+    # Each patient is in the heap with the distance to their closest doctor that was not full when they were last
+    # pushed, so the closest remaining pair of patient and doctor is always on top
+    heap = [(distances[i, preferences[i, 0]], i, 0) for i in range(len(located))]
+    heapq.heapify(heap)
+
+    while heap:
+        distance, i, rank = heapq.heappop(heap)
+        doctor_position = preferences[i, rank]
+
+        if remaining[doctor_position]:
+            remaining[doctor_position] -= 1
+            doctor = doctor_index.doctors[doctor_position]
+            plan.assignments.append((located[i], doctor, int(distance)))
+            plan.loads[doctor][1] += 1
+
+        elif rank + 1 < preferences.shape[1]:
+            heapq.heappush(heap, (distances[i, preferences[i, rank + 1]], i, rank + 1))
+
+        else:
+            plan.unassigned.append(located[i])
+
+    return plan
+
+
+def assign_unassigned_patients(capacity=None, dry_run=False):
+    """
+    Assigns a doctor to every patient without one, in a single update
+    @param capacity: maximum number of patients of each doctor, which defaults to an even share of all the patients
+    @param dry_run: whether to only plan the assignment, without saving it
+    @return: the DoctorAssignmentPlan
+    """
+
+    with transaction.atomic():
+        # The patients stay locked until they are saved, so that nobody assigns them a doctor in the meantime
+        patients = (
+            Patient.objects.select_for_update(of=("self",)).select_related("user").filter(assigned_staff__isnull=True)
+            .annotate(postal_code=F("user__profile__postal_code")).order_by("id")
+        )
+        plan = plan_doctor_assignment(patients, DoctorLocationIndex.from_database(), capacity)
+
+        if not dry_run:
+            for patient, doctor, _ in plan.assignments:
+                patient.assigned_staff = doctor.staff
+            Patient.objects.bulk_update([patient for patient, _, _ in plan.assignments], ["assigned_staff"])
+
+    return plan
@@ -0,0 +1,81 @@
+import numpy as np
+
+from django.contrib.auth.models import User
+from django.db.models import Count, F
+
+from accounts.postal_codes import get_postal_code_index, haversine_distances
+
+
+class DoctorLocationIndex:
+    """
+    Coordinates of every doctor in numpy arrays, so that the distances from a patient to all of them are computed at
+    once instead of one geodesic at a time. Doctors whose postal code is unknown are left out.
+    """
+
+    def __init__(self, doctors, postal_code_index=None):
+        """
+        @param doctors: doctor users, each with postal_code and patient_count attributes
+        @param postal_code_index: index the doctors' postal codes are looked up in, which defaults to the process' index
+        """
+
+        if postal_code_index is None:
+            postal_code_index = get_postal_code_index()
+        doctors = list(doctors)
+        latitudes, longitudes, found = postal_code_index.get_many(doctor.postal_code for doctor in doctors)
+
+        self.doctors = [doctor for doctor, is_found in zip(doctors, found) if is_found]
+        self.latitudes = latitudes[found]
+        self.longitudes = longitudes[found]
+
+    @classmethod
+    def from_database(cls, postal_code_index=None):
+        """
+        Loads every doctor with their postal code and number of assigned patients, in a single query
+        @param postal_code_index: index the doctors' postal codes are looked up in, which defaults to the process' index
+        @return: the loaded index
+        """
+
+        doctors = User.objects.filter(user_permissions__codename="is_doctor").select_related("staff").annotate(
+            postal_code=F("profile__postal_code"),
+            patient_count=Count("staff__assigned_patients"),
+        )
+        return cls(doctors, postal_code_index)
+
+    def __len__(self):
+        return len(self.doctors)
+
+    def nearest(self, latitude, longitude, count=None):
+        """
+        Gets the doctors nearest to a point
+        @param latitude: latitude of the point
+        @param longitude: longitude of the point
+        @param count: maximum number of doctors to return, or None for all of them
+        @return: list of (doctor, distance in meters, number of assigned patients) tuples, from the closest doctor
+        """
+
+        distances = haversine_distances(latitude, longitude, self.latitudes, self.longitudes)
+
+        # Only the closest doctors need to be sorted when few of them are asked for
+        if count is not None and count < len(distances):
+            closest = np.argpartition(distances, count - 1)[:count] if count > 0 else np.empty(0, dtype=int)
+            order = closest[np.argsort(distances[closest], kind="stable")]
+        else:
+            order = np.argsort(distances, kind="stable")
+
+        return [(self.doctors[i], int(distances[i]), self.doctors[i].patient_count) for i in order]
+
+
+def get_nearest_doctors(postal_code, count=None):
+    """
+    Gets the doctors nearest to a postal code
+    @param postal_code: the patient's postal code
+    @param count: maximum number of doctors to return, or None for all of them
+    @return: list of (doctor, distance in meters, number of assigned patients) tuples, from the closest doctor, which is
+    empty if the postal code is unknown
+    """
+
+    location = get_postal_code_index().get(postal_code)
+    if location is None:
+        return []
+
+    return DoctorLocationIndex.from_database().nearest(*location, count=count)
@@ -4,11 +4,11 @@ from django.contrib.auth.forms import SetPasswordForm, PasswordChangeForm
 from django.core.exceptions import ValidationError
 from django.forms import ModelForm, TextInput, CheckboxSelectMultiple, Select, CharField, Form, MultipleChoiceField, \
     ChoiceField
-from django.db import connection
 from django.contrib.auth.models import User
 
 from Covigo.form_field_classes import *
 from accounts.models import Profile
+from accounts.postal_codes import get_postal_code_index
 
 from re import match, sub
 
@@ -280,9 +280,7 @@ class RegisterProfileForm(ModelForm):
             raise forms.ValidationError(
                 "Please enter a valid postal code."
             )
-        c = connection.cursor()
-        r = c.execute('SELECT id from postal_codes where POSTAL_CODE = %s', [subbed_postal_code])
-        if r != 1:
+        if not get_postal_code_index().is_valid(subbed_postal_code):
             raise forms.ValidationError(
                 "The postal code entered may not exist; check spelling and try again"
             )
@@ -431,9 +429,7 @@ class EditProfileForm(ModelForm):
             raise forms.ValidationError(
                 "Please enter a valid postal code."
             )
-        c = connection.cursor()
-        r = c.execute('SELECT id from Covigo.postal_codes where POSTAL_CODE = %s', [subbed_postal_code])
-        if r != 1:
+        if not get_postal_code_index().is_valid(subbed_postal_code):
             raise forms.ValidationError(
                 "The postal code entered may not exist; check its spelling and try again."
             )
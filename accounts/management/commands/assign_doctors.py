@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+
+from accounts.doctor_assignment import assign_unassigned_patients
+
+
+class Command(BaseCommand):
+    """
+    This command assigns a doctor to every patient without one, such as the traced contacts of an import. The patients
+    are shared between the doctors so that none of them has more than their share, each patient going to the closest
+    doctor that still has room.
+    """
+    help = 'Assigns the closest doctor with room to every patient without a doctor'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--capacity',
+            type=int,
+            help='Specify the maximum number of patients of each doctor, which defaults to an even share',
+            required=False
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report the assignment, without saving it',
+        )
+
+    def handle(self, *args, **options):
+        """
+        Assign the doctors and report the assignment.
+        @param args: None for now
+        @param options: The specified capacity, if it exists, and whether this is a dry run.
+        @return: None
+        """
+
+        plan = assign_unassigned_patients(capacity=options['capacity'], dry_run=options['dry_run'])
+
+        if options['verbosity'] > 1:
+            for patient, doctor, distance in plan.assignments:
+                self.stdout.write(f"{patient.user.username} -> {doctor.username} ({distance / 1000:.1f} km)")
+
+        for doctor, (before, after) in sorted(plan.loads.items(), key=lambda item: item[0].username):
+            self.stdout.write(f"{doctor.username}: {before} -> {after} patient(s)")
+
+        median = plan.get_distance_percentile(50)
+        if median is not None:
+            self.stdout.write(
+                f"Distance to the doctor: {median / 1000:.1f} km median, "
+                f"{plan.get_distance_percentile(95) / 1000:.1f} km 95th percentile"
+            )
+
+        action = "Would assign" if options['dry_run'] else "Assigned"
+        self.stdout.write(f"{action} {len(plan.assignments)} patient(s) with a capacity of {plan.capacity} per doctor")
+
+        if plan.unlocated:
+            self.stdout.write(f"Skipped {len(plan.unlocated)} patient(s) without a known postal code")
+        if plan.unassigned:
+            self.stdout.write(f"Skipped {len(plan.unassigned)} patient(s) because every doctor was full")
@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.models import Patient
+from accounts.qr_codes import has_cached_qr_code, render_qr_codes
+from accounts.utils import assign_patient_codes
+
+
+class Command(BaseCommand):
+    """
+    This command renders the qr codes of every patient that does not have one yet, so that their first profile view
+    does not have to. It is meant to be run after bulk imports of patients, and can be stopped and run again at any time.
+    """
+    help = 'Generates the missing patient codes and qr code images'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes',
+            type=int,
+            help='Specify the number of worker processes rendering the images, which defaults to the number of cpus',
+            required=False
+        )
+
+    def handle(self, *args, **options):
+        """
+        Generate the missing codes and render the missing images.
+        @param args: None for now
+        @param options: The specified number of processes, if it exists.
+        @return: None
+        """
+
+        patients = assign_patient_codes(Patient.objects.filter(code__isnull=True).only("id", "code"))
+        self.stdout.write(f"Generated {len(patients)} patient code(s)")
+
+        codes = [
+            code for code in Patient.objects.exclude(code__isnull=True).values_list("code", flat=True).iterator()
+            if not has_cached_qr_code(code)
+        ]
+        self.stdout.write(f"Rendering {len(codes)} qr code(s)")
+
+        started = time.monotonic()
+        rendered = render_qr_codes(codes, processes=options['processes'], on_progress=self.write_progress)
+        elapsed = time.monotonic() - started
+
+        self.stdout.write(f"Rendered {rendered} qr code(s) in {elapsed:.1f}s ({self.get_rate(rendered, elapsed)})")
+
+    def write_progress(self, rendered, elapsed):
+        self.stdout.write(f"Rendered {rendered} qr code(s) ({self.get_rate(rendered, elapsed)})")
+
+    @staticmethod
+    def get_rate(rendered, elapsed):
+        return f"{rendered / elapsed if elapsed else 0:.1f} codes/s"
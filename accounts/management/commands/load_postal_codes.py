@@ -0,0 +1,118 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from accounts.models import DataVersion, PostalCode
+from accounts.postal_codes import POSTAL_CODE_VERSION, clear_postal_code_index, encode_geohashes
+
+# Number of rows read from the file and inserted at once
+POSTAL_CODE_CHUNK_SIZE = 5000
+
+POSTAL_CODE_COLUMNS = ["POSTAL_CODE", "LATITUDE", "LONGITUDE"]
+
+
+def format_postal_code(postal_code):
+    """
+    Formats a postal code the way the forms do, e.g. "h3g1m8" becomes "H3G 1M8"
+    @param postal_code: any postal code
+    @return: the formatted postal code
+    """
+
+    postal_code = "".join(postal_code.split()).upper()
+    return f"{postal_code[:3]} {postal_code[3:]}" if len(postal_code) == 6 else postal_code
+
+
+def read_postal_codes(file, chunk_size=POSTAL_CODE_CHUNK_SIZE):
+    """
+    Reads the postal codes of a csv file with POSTAL_CODE, LATITUDE and LONGITUDE columns, such as the Canada Post
+    dataset, one chunk at a time so that the whole file is never in memory. Codes that appear more than once are only
+    read the first time.
+    @param file: the opened csv file
+    @param chunk_size: number of postal codes of each chunk
+    @return: generator of lists of (postal code, latitude, longitude) tuples
+    @raise CommandError: if a column is missing or a row is malformed
+    """
+
+    reader = csv.reader(file)
+    header = [column.strip().upper() for column in next(reader, [])]
+
+    missing = [column for column in POSTAL_CODE_COLUMNS if column not in header]
+    if missing:
+        raise CommandError(f"Missing column(s): {', '.join(missing)}")
+    positions = [header.index(column) for column in POSTAL_CODE_COLUMNS]
+
+    seen = set()
+    chunk = []
+
+    for row in reader:
+        try:
+            postal_code, latitude, longitude = (row[position] for position in positions)
+            postal_code, latitude, longitude = format_postal_code(postal_code), float(latitude), float(longitude)
+        except (IndexError, ValueError):
+            raise CommandError(f"Malformed row {reader.line_num}: {row}")
+
+        if not postal_code or postal_code in seen:
+            continue
+        seen.add(postal_code)
+
+        chunk.append((postal_code, latitude, longitude))
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+
+class Command(BaseCommand):
+    """
+    This command replaces the postal codes with the content of a csv file. The rows are inserted in chunks inside a
+    single transaction, so the table keeps its previous content until the whole file is loaded.
+    """
+    help = 'Loads the postal codes and their coordinates from a csv file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='Path of the csv file, with POSTAL_CODE, LATITUDE and LONGITUDE columns')
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=POSTAL_CODE_CHUNK_SIZE,
+            help='Specify the number of rows inserted at once',
+        )
+
+    def handle(self, *args, **options):
+        """
+        Load the postal codes.
+        @param args: None for now
+        @param options: The path of the file and the specified chunk size.
+        @return: None
+        """
+
+        started = time.monotonic()
+        loaded = 0
+
+        with open(options['file'], newline='', encoding='utf-8-sig') as file, transaction.atomic():
+            PostalCode.objects.all().delete()
+
+            for chunk in read_postal_codes(file, options['chunk_size']):
+                postal_codes, latitudes, longitudes = zip(*chunk)
+                geohashes = encode_geohashes(latitudes, longitudes)
+
+                PostalCode.objects.bulk_create([
+                    PostalCode(postal_code=postal_code, latitude=latitude, longitude=longitude, geohash=geohash)
+                    for postal_code, latitude, longitude, geohash in zip(postal_codes, latitudes, longitudes, geohashes)
+                ], batch_size=options['chunk_size'])
+
+                loaded += len(chunk)
+                if options['verbosity'] > 1:
+                    self.stdout.write(f"Loaded {loaded} postal code(s)")
+
+            # Other processes notice the new table content the next time they check its version, which is committed
+            # along with it
+            DataVersion.bump(POSTAL_CODE_VERSION)
+
+        clear_postal_code_index()
+
+        self.stdout.write(f"Loaded {loaded} postal code(s) in {time.monotonic() - started:.1f}s")
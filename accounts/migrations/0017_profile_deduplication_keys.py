@@ -0,0 +1,48 @@
+# Generated by Django 4.0.10 on 2026-10-17 17:02
+
+from django.db import migrations, models
+
+from accounts.normalization import get_phonetic_name_key, normalize_email, normalize_phone_number
+
+
+def backfill_deduplication_keys(apps, schema_editor):
+    Profile = apps.get_model('accounts', 'Profile')
+
+    profiles = []
+    for profile in Profile.objects.select_related('user').iterator(chunk_size=1000):
+        profile.phone_number_key = normalize_phone_number(profile.phone_number)
+        profile.email_key = normalize_email(profile.user.email)
+        profile.name_key = get_phonetic_name_key(profile.user.first_name, profile.user.last_name)
+        profiles.append(profile)
+
+        if len(profiles) == 1000:
+            Profile.objects.bulk_update(profiles, ['phone_number_key', 'email_key', 'name_key'])
+            profiles = []
+
+    Profile.objects.bulk_update(profiles, ['phone_number_key', 'email_key', 'name_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0016_alter_profile_options_alter_staff_options'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='email_key',
+            field=models.CharField(blank=True, db_index=True, max_length=254),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='name_key',
+            field=models.CharField(blank=True, db_index=True, max_length=8),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='phone_number_key',
+            field=models.CharField(blank=True, db_index=True, max_length=255),
+        ),
+        migrations.RunPython(backfill_deduplication_keys, migrations.RunPython.noop),
+    ]
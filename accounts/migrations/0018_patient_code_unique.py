@@ -0,0 +1,46 @@
+# Generated by Django 4.0.10 on 2026-10-17 18:40
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def clear_blank_and_duplicate_codes(apps, schema_editor):
+    Patient = apps.get_model('accounts', 'Patient')
+
+    Patient.objects.filter(code='').update(code=None)
+
+    # A code shared by several patients could not be looked up anyway, so all but the first patient get a new code
+    # the next time one is needed
+    duplicate_codes = (
+        Patient.objects.exclude(code=None).values('code').annotate(count=Count('id')).filter(count__gt=1)
+        .values_list('code', flat=True)
+    )
+    for code in list(duplicate_codes):
+        first_id = Patient.objects.filter(code=code).order_by('id').values_list('id', flat=True).first()
+        Patient.objects.filter(code=code).exclude(id=first_id).update(code=None)
+
+
+def restore_blank_codes(apps, schema_editor):
+    Patient = apps.get_model('accounts', 'Patient')
+    Patient.objects.filter(code=None).update(code='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0017_profile_deduplication_keys'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='patient',
+            name='code',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.RunPython(clear_blank_and_duplicate_codes, restore_blank_codes),
+        migrations.AlterField(
+            model_name='patient',
+            name='code',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 4.0.10 on 2026-10-17 19:05
+
+import json
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils.dateparse import parse_datetime
+
+BATCH_SIZE = 1000
+
+
+def load_violations(violation):
+    # Violations were saved as a JSON string inside the JSON field
+    if isinstance(violation, str):
+        violation = json.loads(violation)
+    return violation or []
+
+
+def copy_violations_to_table(apps, schema_editor):
+    Profile = apps.get_model('accounts', 'Profile')
+    QuarantineViolation = apps.get_model('accounts', 'QuarantineViolation')
+
+    violations = []
+    profiles = Profile.objects.exclude(violation=None).values_list('user_id', 'violation')
+    for user_id, violation in profiles.iterator(chunk_size=BATCH_SIZE):
+        for entry in load_violations(violation):
+            timestamp = parse_datetime(str(entry.get('date-time', '')))
+            if timestamp is not None:
+                violations.append(QuarantineViolation(patient_id=user_id, timestamp=timestamp))
+
+        if len(violations) >= BATCH_SIZE:
+            QuarantineViolation.objects.bulk_create(violations, batch_size=BATCH_SIZE)
+            violations = []
+
+    QuarantineViolation.objects.bulk_create(violations, batch_size=BATCH_SIZE)
+
+
+def copy_violations_to_profiles(apps, schema_editor):
+    Profile = apps.get_model('accounts', 'Profile')
+    QuarantineViolation = apps.get_model('accounts', 'QuarantineViolation')
+
+    violations_by_user = {}
+    for user_id, timestamp in QuarantineViolation.objects.order_by('patient_id', 'timestamp').values_list(
+            'patient_id', 'timestamp').iterator(chunk_size=BATCH_SIZE):
+        violations_by_user.setdefault(user_id, []).append({
+            'type': 'quarantine non-compliance',
+            'date-time': timestamp,
+        })
+
+    profiles = list(Profile.objects.filter(user_id__in=violations_by_user))
+    for profile in profiles:
+        profile.violation = json.dumps(violations_by_user[profile.user_id], indent=4, sort_keys=True, default=str)
+    Profile.objects.bulk_update(profiles, ['violation'], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('accounts', '0018_patient_code_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuarantineViolation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField()),
+                ('distance', models.FloatField(blank=True, null=True)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quarantine_violations', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='quarantineviolation',
+            index=models.Index(fields=['patient', 'timestamp'], name='quarantine_violation_time'),
+        ),
+        migrations.RunPython(copy_violations_to_table, copy_violations_to_profiles),
+        migrations.RemoveField(
+            model_name='profile',
+            name='violation',
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 4.0.10 on 2026-10-17 19:30
+
+from django.db import migrations, models
+
+
+def create_or_complete_postal_code_table(apps, schema_editor):
+    # The postal_codes table used to be created outside of the migrations, so it may already exist, possibly without
+    # the geohash column or the indexes
+    PostalCode = apps.get_model('accounts', 'PostalCode')
+    connection = schema_editor.connection
+
+    with connection.cursor() as c:
+        if PostalCode._meta.db_table not in connection.introspection.table_names(c):
+            schema_editor.create_model(PostalCode)
+            return
+
+        columns = [column.name.upper() for column in connection.introspection.get_table_description(c, 'postal_codes')]
+        indexed_columns = [
+            ([column.upper() for column in index['columns']], index['unique'])
+            for index in connection.introspection.get_constraints(c, 'postal_codes').values()
+        ]
+
+    if 'GEOHASH' not in columns:
+        # The index is created below, along with the index of the tables that already had the column
+        field = models.CharField(blank=True, db_column='GEOHASH', max_length=7, null=True)
+        field.set_attributes_from_name('geohash')
+        schema_editor.add_field(PostalCode, field)
+
+    if (['POSTAL_CODE'], True) not in indexed_columns:
+        schema_editor.execute('CREATE UNIQUE INDEX postal_codes_postal_code ON postal_codes (POSTAL_CODE)')
+    if not any(columns == ['GEOHASH'] for columns, _ in indexed_columns):
+        schema_editor.execute('CREATE INDEX postal_codes_geohash ON postal_codes (GEOHASH)')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0019_quarantine_violation'),
+    ]
+
+    operations = [
+        # The table is created or completed by the next operation, since it may already exist
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='PostalCode',
+                    fields=[
+                        ('id', models.AutoField(primary_key=True, serialize=False)),
+                        ('postal_code', models.CharField(db_column='POSTAL_CODE', max_length=7, unique=True)),
+                        ('latitude', models.FloatField(db_column='LATITUDE')),
+                        ('longitude', models.FloatField(db_column='LONGITUDE')),
+                        ('geohash', models.CharField(blank=True, db_column='GEOHASH', db_index=True, max_length=7, null=True)),
+                    ],
+                    options={
+                        'db_table': 'postal_codes',
+                    },
+                ),
+            ],
+        ),
+        # An existing table is left in place when going back, since it was not created by this migration
+        migrations.RunPython(create_or_complete_postal_code_table, migrations.RunPython.noop),
+    ]
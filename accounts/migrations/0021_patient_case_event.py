@@ -0,0 +1,58 @@
+# Generated by Django 4.0.10 on 2026-10-17 19:55
+
+import datetime
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+
+
+def log_current_case_statuses(apps, schema_editor):
+    # The history before this migration is lost, so it starts with the current status of every patient that is not
+    # the default one
+    Patient = apps.get_model('accounts', 'Patient')
+    PatientCaseEvent = apps.get_model('accounts', 'PatientCaseEvent')
+
+    now = datetime.datetime.now()
+    patients = Patient.objects.filter(
+        models.Q(is_confirmed=True) | models.Q(is_negative=True) | models.Q(is_quarantining=True)
+    ).values_list('user_id', 'is_confirmed', 'is_negative', 'is_quarantining')
+
+    PatientCaseEvent.objects.bulk_create([
+        PatientCaseEvent(
+            patient_id=user_id,
+            timestamp=now,
+            is_confirmed=is_confirmed,
+            is_negative=is_negative,
+            is_quarantining=is_quarantining,
+        )
+        for user_id, is_confirmed, is_negative, is_quarantining in patients.iterator(chunk_size=BATCH_SIZE)
+    ], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('accounts', '0020_postal_code'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientCaseEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(default=datetime.datetime.now)),
+                ('is_confirmed', models.BooleanField()),
+                ('is_negative', models.BooleanField()),
+                ('is_quarantining', models.BooleanField()),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='case_events', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='patientcaseevent',
+            index=models.Index(fields=['patient', 'timestamp'], name='patient_case_event_time'),
+        ),
+        migrations.RunPython(log_current_case_statuses, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,13 @@
+import datetime
+
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 import random
 
+from accounts.normalization import get_phonetic_name_key, normalize_email, normalize_phone_number
+
 
 class Profile(models.Model):
     user = models.OneToOneField(
@@ -14,7 +18,12 @@ class Profile(models.Model):
     address = models.TextField(blank=True)
     postal_code = models.CharField(max_length=255, blank=True)
     preferences = models.JSONField(blank=True, null=True)
-    violation = models.JSONField(blank=True, null=True)
+    # Normalized copies of the user's contact details, indexed so that duplicate users can be found by key lookups
+    phone_number_key = models.CharField(max_length=255, blank=True, db_index=True)
+    email_key = models.CharField(max_length=254, blank=True, db_index=True)
+    name_key = models.CharField(max_length=8, blank=True, db_index=True)
+
+    DEDUPLICATION_KEY_FIELDS = ["phone_number_key", "email_key", "name_key"]
 
     class Meta:
         permissions = [
@@ -30,9 +39,36 @@ class Profile(models.Model):
             ("appointment_reminder_preference", "Can edit their appointment reminder preference"),
         ]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the postal code as loaded, so that what depends on it is only refreshed when it changes
+        if "postal_code" in field_names:
+            instance.loaded_postal_code = instance.postal_code
+        return instance
+
     def __str__(self):
         return f"{self.user}_profile"
 
+    def save(self, *args, **kwargs):
+        self.set_deduplication_keys()
+
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = set(update_fields) | set(self.DEDUPLICATION_KEY_FIELDS)
+
+        super().save(*args, **kwargs)
+
+    def set_deduplication_keys(self):
+        """
+        Recomputes the normalized keys from the profile's phone number and the user's email and name
+        @return: void
+        """
+
+        self.phone_number_key = normalize_phone_number(self.phone_number)
+        self.email_key = normalize_email(self.user.email)
+        self.name_key = get_phonetic_name_key(self.user.first_name, self.user.last_name)
+
 
 class Staff(models.Model):
     user = models.OneToOneField(
@@ -127,7 +163,8 @@ class Patient(models.Model):
     is_confirmed = models.BooleanField(default=False)
     is_negative = models.BooleanField(default=False)
     is_quarantining = models.BooleanField(default=False)
-    code = models.CharField(max_length=255)
+    # Null until a code is generated for the patient, since several patients can't share the same blank code
+    code = models.CharField(max_length=255, unique=True, null=True, blank=True)
     test_results = models.JSONField(blank=True, null=True)
 
     class Meta:
@@ -138,6 +175,20 @@ class Patient(models.Model):
             ("view_own_code", "Can view their own QR and patient code"),
         ]
 
+    # Fields of the case status, which are logged by a PatientCaseEvent whenever they change
+    CASE_STATUS_FIELDS = ("is_confirmed", "is_negative", "is_quarantining")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the case status as loaded, so that its changes can be logged after the patient is saved
+        if all(field in field_names for field in cls.CASE_STATUS_FIELDS):
+            instance.loaded_case_status = instance.get_case_status()
+        return instance
+
+    def get_case_status(self):
+        return tuple(getattr(self, field) for field in self.CASE_STATUS_FIELDS)
+
     def get_assigned_staff_user(self):
         try:
             return self.assigned_staff.user
@@ -182,6 +233,72 @@ class Flag(models.Model):
         return f"{self.patient}_flaggedby_{self.staff}"
 
 
+class PostalCode(models.Model):
+    """
+    A Canadian postal code and the coordinates of its center, loaded from the postal code dataset by the
+    load_postal_codes command. The table keeps the column names of the dataset.
+    """
+    id = models.AutoField(primary_key=True)
+    postal_code = models.CharField(max_length=7, unique=True, db_column='POSTAL_CODE')
+    latitude = models.FloatField(db_column='LATITUDE')
+    longitude = models.FloatField(db_column='LONGITUDE')
+    # Geohash of the coordinates, which is shared by nearby postal codes up to the length of their common prefix
+    geohash = models.CharField(max_length=7, blank=True, null=True, db_index=True, db_column='GEOHASH')
+
+    class Meta:
+        db_table = 'postal_codes'
+
+    def __str__(self):
+        return self.postal_code
+
+
+class QuarantineViolation(models.Model):
+    """
+    A location ping of a patient that was too far from their home. Violations are only ever added, so they are saved
+    in their own rows instead of in a list that would be rewritten with each new one.
+    """
+    patient = models.ForeignKey(
+        User,
+        related_name="quarantine_violations",
+        on_delete=models.CASCADE
+    )
+    timestamp = models.DateTimeField()
+    # Distance from home in meters, which is unknown for the violations recorded before it was saved
+    distance = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'timestamp'], name='quarantine_violation_time'),
+        ]
+
+    def __str__(self):
+        return f"{self.patient}_violation_{self.timestamp}"
+
+
+class PatientCaseEvent(models.Model):
+    """
+    The case status a patient was given at some time. Events are only ever added, so the case status of any past day can
+    be rebuilt from them even though the status of the patient is overwritten.
+    """
+    patient = models.ForeignKey(
+        User,
+        related_name="case_events",
+        on_delete=models.CASCADE
+    )
+    timestamp = models.DateTimeField(default=datetime.datetime.now)
+    is_confirmed = models.BooleanField()
+    is_negative = models.BooleanField()
+    is_quarantining = models.BooleanField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'timestamp'], name='patient_case_event_time'),
+        ]
+
+    def __str__(self):
+        return f"{self.patient}_case_{self.timestamp}"
+
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
@@ -214,3 +331,43 @@ class Code(models.Model):
         code_string = "".join(str(item) for item in code_items)
         self.number = code_string
         super().save(*args, **kwargs)
+
+
+class DataVersion(models.Model):
+    """
+    A counter that is bumped whenever some data changes, so that every process can tell whether its own copy of that
+    data, e.g. in its local cache, is out of date with a single query.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}_version_{self.version}"
+
+    @classmethod
+    def get(cls, name):
+        """
+        Gets the current version of some data
+        @param name: name of the data
+        @return: the version, which is 0 until the data is first changed
+        """
+
+        return cls.objects.filter(name=name).values_list("version", flat=True).first() or 0
+
+    @classmethod
+    def bump(cls, name):
+        """
+        Increments the version of some data, which is only seen by the other processes once the current transaction is
+        committed
+        @param name: name of the data
+        @return: void
+        """
+
+        if cls.objects.filter(name=name).update(version=models.F("version") + 1):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(name=name, version=1)
+        except IntegrityError:
+            # Another process created it first
+            cls.objects.filter(name=name).update(version=models.F("version") + 1)
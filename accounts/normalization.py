@@ -0,0 +1,78 @@
+import re
+import unicodedata
+
+# Letters that share a soundex digit sound alike. Vowels and "y" are separators, while "h" and "w" are ignored.
+SOUNDEX_CODES = {
+    **dict.fromkeys("bfpv", "1"),
+    **dict.fromkeys("cgjkqsxz", "2"),
+    **dict.fromkeys("dt", "3"),
+    "l": "4",
+    **dict.fromkeys("mn", "5"),
+    "r": "6",
+}
+
+
+def normalize_phone_number(phone_number):
+    """
+    Reduces a phone number to its digits, so that "+1 (514) 555-0000" and "5145550000" compare equal
+    @param phone_number: the phone number as it was entered
+    @return: the digits of the phone number without the North American country code, or "" if there are none
+    """
+
+    digits = re.sub(r"\D", "", phone_number or "")
+
+    if len(digits) == 11 and digits.startswith("1"):
+        return digits[1:]
+    return digits
+
+
+def normalize_email(email):
+    """
+    Normalizes an email address for comparison
+    @param email: the email address as it was entered
+    @return: the stripped and lowercased email address
+    """
+
+    return (email or "").strip().lower()
+
+
+def soundex(name):
+    """
+    Computes the American soundex code of a name, which is the same for most spellings of a name that sound alike
+    @param name: any name
+    @return: a letter followed by three digits, or "" if the name has no letters
+    """
+
+    letters = [
+        c for c in unicodedata.normalize("NFKD", name or "").lower()
+        if "a" <= c <= "z"
+    ]
+    if not letters:
+        return ""
+
+    code = letters[0].upper()
+    previous = SOUNDEX_CODES.get(letters[0], "")
+
+    for letter in letters[1:]:
+        if letter in "hw":
+            continue
+
+        digit = SOUNDEX_CODES.get(letter, "")
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        previous = digit
+
+    return code.ljust(4, "0")
+
+
+def get_phonetic_name_key(first_name, last_name):
+    """
+    Builds a key that is shared by names which sound alike, e.g. "Jon Smyth" and "John Smith"
+    @param first_name: the first name
+    @param last_name: the last name
+    @return: the soundex codes of both names, or "" if neither has any letters
+    """
+
+    return soundex(first_name) + soundex(last_name)
@@ -0,0 +1,265 @@
+import time
+
+import numpy as np
+
+from functools import cached_property
+from threading import Lock
+
+from django.db.models import Count, Max
+
+from accounts.models import DataVersion, PostalCode
+
+# Seconds between two checks of whether the postal_codes table changed since the index was loaded
+POSTAL_CODE_INDEX_CHECK_INTERVAL = 60
+
+# Name of the DataVersion bumped by the load_postal_codes command, whose reloads can leave the number of rows and their
+# largest id as they were while changing the coordinates
+POSTAL_CODE_VERSION = "postal_codes"
+
+# Mean radius of the earth, in meters
+EARTH_RADIUS = 6371008.8
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# Number of characters of the geohash of each postal code, which makes cells of about 150 by 150 meters
+GEOHASH_PRECISION = 7
+
+
+class PostalCodeIndex:
+    """
+    Read-only index of the coordinates of every postal code. The codes are kept sorted in a fixed-width byte array next
+    to float32 arrays of their latitudes and longitudes, which takes a few bytes per code and finds any code with a
+    binary search, instead of a database query per lookup.
+    """
+
+    def __init__(self, codes, latitudes, longitudes, version=None):
+        """
+        @param codes: postal codes, in any order
+        @param latitudes: latitude of each postal code
+        @param longitudes: longitude of each postal code
+        @param version: version of the postal_codes table the index was loaded from, if it was
+        """
+
+        codes = np.array([normalize_postal_code(code) for code in codes], dtype=bytes)
+        order = np.argsort(codes, kind="stable")
+
+        self.codes = codes[order]
+        self.latitudes = np.asarray(latitudes, dtype=np.float32)[order]
+        self.longitudes = np.asarray(longitudes, dtype=np.float32)[order]
+        self.version = version
+
+    @classmethod
+    def from_database(cls):
+        """
+        Loads the index from the PostalCode table
+        @return: the loaded index
+        """
+
+        version = get_postal_code_table_version()
+
+        rows = list(PostalCode.objects.values_list("postal_code", "latitude", "longitude").iterator())
+
+        codes, latitudes, longitudes = zip(*rows) if rows else ((), (), ())
+        return cls(codes, latitudes, longitudes, version)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __contains__(self, postal_code):
+        return self._find(normalize_postal_code(postal_code)) is not None
+
+    def _find(self, code):
+        i = np.searchsorted(self.codes, code)
+        if i < len(self.codes) and self.codes[i] == code:
+            return i
+        return None
+
+    def get(self, postal_code):
+        """
+        Gets the coordinates of a postal code
+        @param postal_code: any postal code, e.g. "H3G 1M8"
+        @return: (latitude, longitude) tuple of floats, or None if the postal code doesn't exist
+        """
+
+        i = self._find(normalize_postal_code(postal_code))
+        if i is None:
+            return None
+        return float(self.latitudes[i]), float(self.longitudes[i])
+
+    def is_valid(self, postal_code):
+        """
+        Checks whether a postal code exists
+        @param postal_code: any postal code
+        @return: whether the postal code is in the index
+        """
+
+        return postal_code in self
+
+    def get_many(self, postal_codes):
+        """
+        Gets the coordinates of many postal codes at once
+        @param postal_codes: iterable of postal codes
+        @return: tuple of the latitude and longitude arrays, which are nan for unknown postal codes, and of the boolean
+        array of which postal codes were found
+        """
+
+        codes = np.array([normalize_postal_code(code) for code in postal_codes], dtype=bytes)
+        if not len(self.codes):
+            missing = np.full(len(codes), np.nan, dtype=np.float32)
+            return missing, missing.copy(), np.zeros(len(codes), dtype=bool)
+
+        positions = np.minimum(np.searchsorted(self.codes, codes), len(self.codes) - 1)
+        found = self.codes[positions] == codes
+
+        latitudes = np.where(found, self.latitudes[positions], np.nan).astype(np.float32)
+        longitudes = np.where(found, self.longitudes[positions], np.nan).astype(np.float32)
+        return latitudes, longitudes, found
+
+    @cached_property
+    def fsa_centroids(self):
+        """
+        The forward sortation areas (the first three characters of a postal code) of the index, with the mean
+        coordinates of their postal codes. The codes are sorted, so the codes of an area are contiguous.
+        @return: tuple of the sorted areas, as bytes, and of the arrays of their latitudes and longitudes
+        """
+
+        fsas, starts, counts = np.unique(self.codes.astype("S3"), return_index=True, return_counts=True)
+        if not len(fsas):
+            return fsas, np.empty(0, dtype=np.float32), np.empty(0, dtype=np.float32)
+
+        latitudes = np.add.reduceat(self.latitudes.astype(np.float64), starts) / counts
+        longitudes = np.add.reduceat(self.longitudes.astype(np.float64), starts) / counts
+        return fsas, latitudes.astype(np.float32), longitudes.astype(np.float32)
+
+    def get_fsa_centroid(self, fsa):
+        """
+        Gets the center of a forward sortation area
+        @param fsa: the first three characters of a postal code, e.g. "H3G"
+        @return: (latitude, longitude) tuple of floats, or None if no postal code of the index is in the area
+        """
+
+        fsas, latitudes, longitudes = self.fsa_centroids
+        code = normalize_postal_code(fsa)[:3]
+
+        i = np.searchsorted(fsas, code)
+        if i < len(fsas) and fsas[i] == code:
+            return float(latitudes[i]), float(longitudes[i])
+        return None
+
+
+def normalize_postal_code(postal_code):
+    """
+    Normalizes a postal code the way they are stored in the postal_codes table
+    @param postal_code: any postal code
+    @return: the stripped and uppercased postal code, as ascii bytes
+    """
+
+    return (postal_code or "").strip().upper().encode("ascii", errors="replace")
+
+
+def haversine_distances(latitude, longitude, latitudes, longitudes):
+    """
+    Computes the great-circle distances from one point to many points at once. The arguments are broadcast against each
+    other, so passing columns of points as the first two arguments computes a whole distance matrix.
+    @param latitude: latitude of the point, in degrees
+    @param longitude: longitude of the point, in degrees
+    @param latitudes: array of the latitudes of the other points, in degrees
+    @param longitudes: array of the longitudes of the other points, in degrees
+    @return: float64 array of the distances, in meters
+    """
+
+    latitude = np.radians(np.asarray(latitude, dtype=np.float64))
+    longitude = np.radians(np.asarray(longitude, dtype=np.float64))
+    latitudes = np.radians(np.asarray(latitudes, dtype=np.float64))
+    longitudes = np.radians(np.asarray(longitudes, dtype=np.float64))
+
+    a = (
+        np.sin((latitudes - latitude) / 2) ** 2
+        + np.cos(latitude) * np.cos(latitudes) * np.sin((longitudes - longitude) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1)))
+
+
+def encode_geohashes(latitudes, longitudes, precision=GEOHASH_PRECISION):
+    """
+    Computes the geohashes of many points at once. Points that are close to each other share a prefix of their
+    geohashes, so the neighbours of a point can be found with a prefix search.
+    @param latitudes: array of the latitudes, in degrees
+    @param longitudes: array of the longitudes, in degrees
+    @param precision: number of characters of each geohash
+    @return: list of the geohashes, as strings
+    """
+
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+
+    # The bits of a geohash alternate between halving the longitude range and halving the latitude range, starting
+    # with the longitude, and every five bits make a character
+    bounds = {
+        "longitude": (longitudes, np.full(len(longitudes), -180.0), np.full(len(longitudes), 180.0)),
+        "latitude": (latitudes, np.full(len(latitudes), -90.0), np.full(len(latitudes), 90.0)),
+    }
+    characters = np.zeros((len(latitudes), precision), dtype=np.uint8)
+
+    for bit in range(precision * 5):
+        values, lows, highs = bounds["longitude" if bit % 2 == 0 else "latitude"]
+        middles = (lows + highs) / 2
+        is_upper_half = values >= middles
+        np.copyto(lows, middles, where=is_upper_half)
+        np.copyto(highs, middles, where=~is_upper_half)
+        characters[:, bit // 5] = (characters[:, bit // 5] << 1) | is_upper_half
+
+    alphabet = np.frombuffer(GEOHASH_ALPHABET.encode("ascii"), dtype=np.uint8)
+    return [geohash.decode("ascii") for geohash in alphabet[characters].view(f"S{precision}").ravel()]
+
+
+def get_postal_code_table_version():
+    """
+    Gets a value that changes whenever postal codes are added to or removed from the postal_codes table, or the table
+    is reloaded by the load_postal_codes command
+    @return: the number of rows and the largest id of the table, and the version bumped by each reload
+    """
+
+    version = PostalCode.objects.aggregate(count=Count("id"), max_id=Max("id"))
+    return version["count"], version["max_id"], DataVersion.get(POSTAL_CODE_VERSION)
+
+
+_postal_code_index = None
+_postal_code_index_checked = 0
+_postal_code_index_lock = Lock()
+
+
+def get_postal_code_index():
+    """
+    Gets the postal code index of this process. It is loaded on the first call, and reloaded when the postal_codes
+    table changed, which is checked at most once every POSTAL_CODE_INDEX_CHECK_INTERVAL seconds.
+    @return: the PostalCodeIndex
+    """
+
+    global _postal_code_index, _postal_code_index_checked
+
+    with _postal_code_index_lock:
+        now = time.monotonic()
+
+        if _postal_code_index is None:
+            _postal_code_index = PostalCodeIndex.from_database()
+            _postal_code_index_checked = now
+
+        elif now - _postal_code_index_checked >= POSTAL_CODE_INDEX_CHECK_INTERVAL:
+            _postal_code_index_checked = now
+            if get_postal_code_table_version() != _postal_code_index.version:
+                _postal_code_index = PostalCodeIndex.from_database()
+
+        return _postal_code_index
+
+
+def clear_postal_code_index():
+    """
+    Discards the postal code index of this process, so that the next call to get_postal_code_index loads it again
+    @return: void
+    """
+
+    global _postal_code_index
+
+    with _postal_code_index_lock:
+        _postal_code_index = None
@@ -0,0 +1,213 @@
+import django
+import hashlib
+import io
+import multiprocessing
+import os
+import tempfile
+import time
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from threading import Lock
+
+from django.conf import settings
+from qrcode.main import make
+
+# The worker processes of render_qr_codes import this module before django is set up, so it must not import any model
+
+# Number of rendered qr codes kept in memory by each process
+QR_CODE_MEMORY_CACHE_SIZE = 512
+
+# Number of codes sent to a worker process at once when rendering in bulk
+QR_CODE_RENDER_CHUNK_SIZE = 64
+
+
+class QrCodeMemoryCache:
+    """
+    Least recently used cache of rendered qr code images, keyed by their content key
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._images = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+            return image
+
+    def set(self, key, image):
+        with self._lock:
+            self._images[key] = image
+            self._images.move_to_end(key)
+            while len(self._images) > self.max_size:
+                self._images.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+
+
+qr_code_memory_cache = QrCodeMemoryCache(QR_CODE_MEMORY_CACHE_SIZE)
+
+
+def get_patient_profile_link(code):
+    """
+    Gets the link that a patient's qr code points to
+    @param code: the patient's code
+    @return: the absolute link to the patient's public profile
+    """
+
+    return f"{settings.HOST_NAME}/accounts/profile/{code}"
+
+
+def get_qr_code_key(code):
+    """
+    Gets the content key of a patient's qr code image, which is the hash of the link it encodes. The key changes
+    whenever the image would, so it is used both as the name of the cached file and as the image's ETag.
+    @param code: the patient's code
+    @return: the hex digest identifying the qr code image
+    """
+
+    return hashlib.sha256(get_patient_profile_link(code).encode()).hexdigest()
+
+
+def get_qr_code_path(key):
+    """
+    Gets the path of the cached qr code image with the given content key, in a subdirectory named after the key's
+    first two characters so that no directory grows too large
+    @param key: content key of the image
+    @return: path of the image file
+    """
+
+    return Path(settings.QR_CODE_DIRECTORY) / key[:2] / f"{key}.png"
+
+
+def render_qr_code(code):
+    """
+    Renders the qr code of a patient
+    @param code: the patient's code
+    @return: the png image of the qr code, as bytes
+    """
+
+    image = make(get_patient_profile_link(code))
+    buffer = io.BytesIO()
+    image.save(buffer)
+    return buffer.getvalue()
+
+
+def write_qr_code(path, image):
+    """
+    Writes a qr code image to a temporary file that is then renamed to its path, so that a partially written image is
+    never served or mistaken for a cached one
+    @param path: path of the image file
+    @param image: png image, as bytes
+    @return: void
+    """
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(file_descriptor, "wb") as file:
+            file.write(image)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+
+def get_cached_qr_code(code):
+    """
+    Gets a patient's qr code image from the memory cache, or from the disk cache
+    @param code: the patient's code
+    @return: the png image as bytes, or None if it was never rendered
+    """
+
+    key = get_qr_code_key(code)
+
+    image = qr_code_memory_cache.get(key)
+    if image is None:
+        try:
+            image = get_qr_code_path(key).read_bytes()
+        except FileNotFoundError:
+            return None
+        qr_code_memory_cache.set(key, image)
+
+    return image
+
+
+def get_or_render_qr_code(code):
+    """
+    Gets a patient's qr code image from the caches, or renders it and stores it in both caches
+    @param code: the patient's code
+    @return: the png image, as bytes
+    """
+
+    image = get_cached_qr_code(code)
+
+    if image is None:
+        key = get_qr_code_key(code)
+        image = render_qr_code(code)
+        write_qr_code(get_qr_code_path(key), image)
+        qr_code_memory_cache.set(key, image)
+
+    return image
+
+
+def has_cached_qr_code(code):
+    """
+    Checks whether a patient's qr code image is cached on disk
+    @param code: the patient's code
+    @return: whether the image exists
+    """
+
+    return get_qr_code_path(get_qr_code_key(code)).exists()
+
+
+def _initialize_render_worker(host_name, qr_code_directory):
+    django.setup()
+
+    # Render the same images as the parent process, even if its settings were changed after startup
+    settings.HOST_NAME = host_name
+    settings.QR_CODE_DIRECTORY = qr_code_directory
+
+
+def _render_qr_code_file(code):
+    key = get_qr_code_key(code)
+    path = get_qr_code_path(key)
+
+    # Another run may have rendered the image since the code was listed
+    if not path.exists():
+        write_qr_code(path, render_qr_code(code))
+
+
+def render_qr_codes(codes, processes=None, on_progress=None):
+    """
+    Renders the qr code images of many patients to the disk cache, in a pool of worker processes. Each image is written
+    atomically, so an interrupted run can be resumed by rendering the codes that are still missing an image.
+    @param codes: iterable of patient codes to render
+    @param processes: number of worker processes, which defaults to the number of cpus
+    @param on_progress: optional function called with the number of images rendered so far and the elapsed seconds
+    @return: the number of images rendered
+    """
+
+    rendered = 0
+    started = time.monotonic()
+
+    # Spawned workers start from a fresh interpreter, so they never share the database connections of this process
+    with ProcessPoolExecutor(
+            max_workers=processes or os.cpu_count(),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_initialize_render_worker,
+            initargs=(settings.HOST_NAME, settings.QR_CODE_DIRECTORY),
+    ) as executor:
+        for _ in executor.map(_render_qr_code_file, codes, chunksize=QR_CODE_RENDER_CHUNK_SIZE):
+            rendered += 1
+            if on_progress and rendered % QR_CODE_RENDER_CHUNK_SIZE == 0:
+                on_progress(rendered, time.monotonic() - started)
+
+    return rendered
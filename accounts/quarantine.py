@@ -0,0 +1,170 @@
+import datetime
+
+import numpy as np
+
+from django.db.models import Count, Max
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import is_aware, make_naive
+
+from accounts.models import Profile, QuarantineViolation
+from accounts.postal_codes import get_postal_code_index, haversine_distances
+
+# Distance from home, in meters, past which a quarantining patient is not complying with their quarantine
+QUARANTINE_RADIUS = 1000
+
+# Maximum number of location pings accepted in a single request
+LOCATION_PING_BATCH_SIZE = 5000
+
+# Number of violations saved by each insert
+QUARANTINE_VIOLATION_BATCH_SIZE = 1000
+
+# Number of days of quarantine violations shown to the staff, which matches the length of a quarantine
+QUARANTINE_VIOLATION_DAYS = 14
+
+
+def get_home_postal_codes(user_ids):
+    """
+    Gets the postal code of the home of many users, in a single query
+    @param user_ids: ids of the users
+    @return: dict of the postal codes, keyed by user id
+    """
+
+    return dict(Profile.objects.filter(user_id__in=set(user_ids)).values_list("user_id", "postal_code"))
+
+
+def get_distances_from_home(user_ids, latitudes, longitudes, home_postal_codes, postal_code_index=None):
+    """
+    Computes the distance between each location ping and the home of the user who sent it, all at once
+    @param user_ids: id of the user of each ping
+    @param latitudes: latitude of each ping
+    @param longitudes: longitude of each ping
+    @param home_postal_codes: postal code of each user's home, keyed by user id
+    @param postal_code_index: index the postal codes are looked up in, which defaults to the process' index
+    @return: float64 array of the distances in meters, which are nan when the user's home is unknown
+    """
+
+    if postal_code_index is None:
+        postal_code_index = get_postal_code_index()
+
+    home_latitudes, home_longitudes, _ = postal_code_index.get_many(
+        home_postal_codes.get(user_id) for user_id in user_ids
+    )
+    return haversine_distances(home_latitudes, home_longitudes, latitudes, longitudes)
+
+
+def get_violating_pings(distances):
+    """
+    Gets which location pings are too far from home
+    @param distances: array of the distances from home, as returned by get_distances_from_home
+    @return: boolean array of the pings that violate the quarantine, which is never true for an unknown home
+    """
+
+    with np.errstate(invalid="ignore"):
+        return np.asarray(distances) > QUARANTINE_RADIUS
+
+
+def record_quarantine_violations(violations):
+    """
+    Saves quarantine violations, in as few inserts as possible
+    @param violations: iterable of (user id, datetime, distance from home in meters) tuples
+    @return: the number of violations recorded
+    """
+
+    violations = [
+        QuarantineViolation(patient_id=user_id, timestamp=timestamp, distance=distance)
+        for user_id, timestamp, distance in violations
+    ]
+    QuarantineViolation.objects.bulk_create(violations, batch_size=QUARANTINE_VIOLATION_BATCH_SIZE)
+    return len(violations)
+
+
+def get_recent_violations(days, user_ids=None):
+    """
+    Gets the quarantine violations of the last days
+    @param days: number of days to look back
+    @param user_ids: ids of the users to get the violations of, or None for every user
+    @return: queryset of the QuarantineViolation rows
+    """
+
+    violations = QuarantineViolation.objects.filter(
+        timestamp__gte=datetime.datetime.now() - datetime.timedelta(days=days)
+    )
+    if user_ids is not None:
+        violations = violations.filter(patient_id__in=user_ids)
+    return violations
+
+
+def get_violation_counts(days, user_ids=None):
+    """
+    Counts the quarantine violations of each user in the last days, in a single query
+    @param days: number of days to look back
+    @param user_ids: ids of the users to count the violations of, or None for every user
+    @return: dict of the number of violations, keyed by user id, without the users who have none
+    """
+
+    return dict(
+        get_recent_violations(days, user_ids).order_by().values("patient_id").annotate(count=Count("id"))
+        .values_list("patient_id", "count")
+    )
+
+
+def get_violation_summary(days, user_ids=None):
+    """
+    Summarizes the quarantine violations of the last days, in a single query
+    @param days: number of days to look back
+    @param user_ids: ids of the users to summarize the violations of, or None for every user
+    @return: dict with the number of violations, of users with violations, and the largest distance from home
+    """
+
+    return get_recent_violations(days, user_ids).aggregate(
+        violations=Count("id"),
+        patients=Count("patient_id", distinct=True),
+        max_distance=Max("distance"),
+    )
+
+
+def parse_location_pings(data, default_user_id):
+    """
+    Reads the location pings of a batch sent as JSON, e.g. {"pings": [{"latitude": 45.5, "longitude": -73.6}]}. Each
+    ping may also have the "user" id it was sent for, which defaults to the sender, and the ISO "timestamp" it was taken
+    at, which defaults to now.
+    @param data: the decoded JSON body
+    @param default_user_id: id of the user of the pings without one
+    @return: tuple of the list of user ids, the latitude and longitude arrays and the list of datetimes of the pings
+    @raise ValueError: if the batch is malformed or too large
+    """
+
+    pings = data.get("pings") if isinstance(data, dict) else None
+    if not isinstance(pings, list):
+        raise ValueError("Expected a list of pings")
+    if len(pings) > LOCATION_PING_BATCH_SIZE:
+        raise ValueError(f"Expected at most {LOCATION_PING_BATCH_SIZE} pings")
+
+    now = datetime.datetime.now()
+    user_ids, latitudes, longitudes, timestamps = [], [], [], []
+
+    for ping in pings:
+        try:
+            user_id = ping.get("user", default_user_id)
+            # JSON booleans are ints in Python, so the type is checked exactly rather than with isinstance
+            if type(user_id) is not int:
+                raise TypeError(f"Expected an integer user id, got {user_id!r}")
+            user_ids.append(user_id)
+            latitudes.append(float(ping["latitude"]))
+            longitudes.append(float(ping["longitude"]))
+            timestamp = ping.get("timestamp")
+            timestamp = parse_datetime(timestamp) if timestamp else now
+        except (AttributeError, KeyError, TypeError, ValueError):
+            raise ValueError(f"Malformed ping: {ping}")
+
+        if timestamp is None:
+            raise ValueError(f"Malformed timestamp: {ping['timestamp']}")
+
+        # Datetimes are saved in local time, without a time zone
+        timestamps.append(make_naive(timestamp) if is_aware(timestamp) else timestamp)
+
+    latitudes, longitudes = np.array(latitudes, dtype=np.float64), np.array(longitudes, dtype=np.float64)
+    if not (np.all(np.abs(latitudes) <= 90) and np.all(np.abs(longitudes) <= 180)):
+        raise ValueError("Expected latitudes between -90 and 90 and longitudes between -180 and 180")
+
+    return user_ids, latitudes, longitudes, timestamps
@@ -0,0 +1,76 @@
+from django.contrib.auth.models import User, Permission
+from django.test import TestCase, RequestFactory
+
+from accounts.authorization import AuthorizationContext, get_authorization_context
+from accounts.models import Staff, Patient
+
+
+class AuthorizationContextTests(TestCase):
+    def setUp(self):
+        self.doctor = User.objects.create(username="doctor", is_staff=True)
+        self.staff = Staff.objects.create(user=self.doctor)
+        self.doctor.user_permissions.add(*Permission.objects.filter(
+            codename__in=["is_doctor", "edit_assigned", "view_assigned_code", "message_assigned"]
+        ))
+
+        self.assigned_patient = User.objects.create(username="assigned_patient")
+        Patient.objects.create(user=self.assigned_patient, assigned_staff=self.staff)
+        self.other_patient = User.objects.create(username="other_patient")
+        Patient.objects.create(user=self.other_patient)
+
+    def test_permission_checks_of_assigned_patients(self):
+        """
+        Test that the permissions limited to assigned patients only apply to the doctor's assigned patients
+        @return: void
+        """
+
+        authorization = AuthorizationContext(self.doctor)
+
+        self.assertTrue(authorization.can_edit(self.assigned_patient))
+        self.assertTrue(authorization.can_view_code(self.assigned_patient))
+        self.assertTrue(authorization.can_message(self.assigned_patient))
+        self.assertTrue(authorization.can_view_appointments(self.assigned_patient))
+        self.assertFalse(authorization.can_edit(self.other_patient))
+        self.assertFalse(authorization.can_view_code(self.other_patient))
+        self.assertFalse(authorization.can_message(self.other_patient))
+        self.assertFalse(authorization.can_edit(self.doctor))
+
+    def test_patient_can_message_assigned_doctor(self):
+        """
+        Test that a patient with the message_doctor permission can only message their own doctor
+        @return: void
+        """
+
+        self.assigned_patient.user_permissions.add(Permission.objects.get(codename="message_doctor"))
+        other_doctor = User.objects.create(username="other_doctor", is_staff=True)
+
+        authorization = AuthorizationContext(User.objects.get(id=self.assigned_patient.id))
+
+        self.assertTrue(authorization.can_message(self.doctor))
+        self.assertFalse(authorization.can_message(other_doctor))
+        self.assertFalse(authorization.can_view_code(self.assigned_patient))
+
+    def test_checks_are_loaded_once(self):
+        """
+        Test that the permissions and assigned patients are only queried once, however many checks are made
+        @return: void
+        """
+
+        authorization = AuthorizationContext(self.doctor)
+
+        with self.assertNumQueries(3):
+            for _ in range(5):
+                authorization.can_edit(self.assigned_patient)
+                authorization.can_edit_case(self.assigned_patient)
+                authorization.can_assign_symptoms(self.other_patient)
+
+    def test_context_is_shared_by_request(self):
+        """
+        Test that the context of a request is built once and reused
+        @return: void
+        """
+
+        request = RequestFactory().get("/")
+        request.user = self.doctor
+
+        self.assertIs(get_authorization_context(request), get_authorization_context(request))
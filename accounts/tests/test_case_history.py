@@ -0,0 +1,84 @@
+import datetime
+
+import numpy as np
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from accounts.case_history import build_case_series, record_case_events
+from accounts.models import Patient, PatientCaseEvent
+
+
+class RecordCaseEventsTests(TestCase):
+    def test_record_case_events(self):
+        """
+        Test that only the patients whose case status changed are logged, in a single insert
+        @return: void
+        """
+
+        for i in range(3):
+            Patient.objects.create(user=User.objects.create(username=f"patient{i}"))
+        first, second, third = Patient.objects.order_by("user__username")
+
+        first.is_confirmed = True
+        second.is_quarantining = True
+        with self.assertNumQueries(1):
+            self.assertEqual(2, record_case_events([first, second, third]))
+
+        self.assertEqual(0, record_case_events([first, second, third]))
+        self.assertEqual(
+            [(first.user_id, True, False, False), (second.user_id, False, False, True)],
+            list(PatientCaseEvent.objects.order_by("patient_id").values_list(
+                "patient_id", "is_confirmed", "is_negative", "is_quarantining"
+            )),
+        )
+
+
+class BuildCaseSeriesTests(TestCase):
+    def setUp(self):
+        self.first = User.objects.create(username="first")
+        self.second = User.objects.create(username="second")
+
+        PatientCaseEvent.objects.bulk_create([
+            # The first patient quarantines, tests positive and recovers
+            PatientCaseEvent(patient=self.first, timestamp=datetime.datetime(2022, 4, 1, 9), is_confirmed=False,
+                             is_negative=False, is_quarantining=True),
+            PatientCaseEvent(patient=self.first, timestamp=datetime.datetime(2022, 4, 2, 15), is_confirmed=True,
+                             is_negative=False, is_quarantining=True),
+            PatientCaseEvent(patient=self.first, timestamp=datetime.datetime(2022, 4, 5, 8), is_confirmed=True,
+                             is_negative=True, is_quarantining=False),
+            # The second patient tests positive before the series starts
+            PatientCaseEvent(patient=self.second, timestamp=datetime.datetime(2022, 3, 20), is_confirmed=True,
+                             is_negative=False, is_quarantining=False),
+            PatientCaseEvent(patient=self.second, timestamp=datetime.datetime(2022, 4, 3, 23, 59), is_confirmed=True,
+                             is_negative=False, is_quarantining=True),
+        ])
+
+    def test_build_case_series(self):
+        """
+        Test that the number of patients of each case status at the end of every day is rebuilt in a single query
+        @return: void
+        """
+
+        with self.assertNumQueries(1):
+            series = build_case_series(datetime.date(2022, 3, 31), datetime.date(2022, 4, 5))
+
+        self.assertEqual(
+            [str(datetime.date(2022, 3, 31) + datetime.timedelta(days=i)) for i in range(6)],
+            [str(date) for date in series["dates"]],
+        )
+        np.testing.assert_array_equal([1, 1, 2, 2, 2, 2], series["confirmed"])
+        np.testing.assert_array_equal([1, 1, 2, 2, 2, 1], series["positive"])
+        np.testing.assert_array_equal([0, 0, 0, 0, 0, 1], series["recovered"])
+        np.testing.assert_array_equal([0, 1, 1, 2, 2, 1], series["quarantining"])
+
+    def test_build_case_series_without_events(self):
+        """
+        Test that the series of a date range before any event is all zeros
+        @return: void
+        """
+
+        series = build_case_series(datetime.date(2022, 1, 1), datetime.date(2022, 1, 3))
+
+        self.assertEqual(3, len(series["dates"]))
+        np.testing.assert_array_equal([0, 0, 0], series["positive"])
@@ -0,0 +1,121 @@
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from accounts.models import DataVersion, Patient, PostalCode
+from accounts.postal_codes import POSTAL_CODE_VERSION, clear_postal_code_index, get_postal_code_index
+from accounts.qr_codes import get_qr_code_key, get_qr_code_path
+
+
+class GenerateQrCodesCommandTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        override = override_settings(QR_CODE_DIRECTORY=Path(self.directory.name))
+        override.enable()
+        self.addCleanup(override.disable)
+
+        for i in range(3):
+            Patient.objects.create(user=User.objects.create(username=f"patient{i}"), code=f"CODE{i}" if i else None)
+
+    def test_missing_codes_and_images_are_generated(self):
+        """
+        Test that the command gives a code to every patient and renders each of their qr codes once
+        @return: void
+        """
+
+        output = StringIO()
+        call_command("generate_qr_codes", processes=2, stdout=output)
+
+        codes = list(Patient.objects.values_list("code", flat=True))
+        self.assertNotIn(None, codes)
+        self.assertTrue(all(get_qr_code_path(get_qr_code_key(code)).exists() for code in codes))
+        self.assertIn("Rendered 3 qr code(s)", output.getvalue())
+
+        # Running the command again only renders the images that are still missing
+        get_qr_code_path(get_qr_code_key("CODE1")).unlink()
+        output = StringIO()
+        call_command("generate_qr_codes", processes=1, stdout=output)
+
+        self.assertIn("Rendered 1 qr code(s)", output.getvalue())
+
+
+class LoadPostalCodesCommandTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.addCleanup(clear_postal_code_index)
+
+    def write_csv(self, content):
+        path = Path(self.directory.name) / "postal_codes.csv"
+        path.write_text(content)
+        return str(path)
+
+    def test_postal_codes_are_loaded(self):
+        """
+        Test that the postal codes of the file replace the content of the table, with their geohash
+        @return: void
+        """
+
+        call_command("load_postal_codes", self.write_csv(
+            "POSTAL_CODE,CITY,LATITUDE,LONGITUDE\n"
+            "H3G 1M8,Montreal,45.4972,-73.5788\n"
+        ), stdout=StringIO())
+
+        output = StringIO()
+        call_command("load_postal_codes", self.write_csv(
+            "POSTAL_CODE,CITY,LATITUDE,LONGITUDE\n"
+            "h2x1y4,Montreal,45.5087,-73.5617\n"
+            "G1R 4P5,Quebec,46.8123,-71.2145\n"
+            "H2X 1Y4,Montreal,45.5087,-73.5617\n"
+        ), chunk_size=1, stdout=output)
+
+        self.assertEqual(
+            [("G1R 4P5", "f2m673z"), ("H2X 1Y4", "f25dyhd")],
+            list(PostalCode.objects.order_by("postal_code").values_list("postal_code", "geohash")),
+        )
+        self.assertIn("Loaded 2 postal code(s)", output.getvalue())
+        self.assertAlmostEqual(46.8123, get_postal_code_index().get("G1R 4P5")[0], places=4)
+        self.assertIsNone(get_postal_code_index().get("H3G 1M8"))
+
+    def test_reloaded_coordinates_are_noticed_by_other_processes(self):
+        """
+        Test that reloading the postal codes with new coordinates reloads the index of the processes that did not run
+        the command, even though the number of rows and their largest id may be unchanged
+        @return: void
+        """
+
+        call_command("load_postal_codes", self.write_csv(
+            "POSTAL_CODE,LATITUDE,LONGITUDE\nH3G 1M8,45.4972,-73.5788\n"
+        ), stdout=StringIO())
+        self.assertAlmostEqual(45.4972, get_postal_code_index().get("H3G 1M8")[0], places=4)
+
+        # The index of this process is left as it is, like that of the other processes
+        with mock.patch("accounts.management.commands.load_postal_codes.clear_postal_code_index"):
+            call_command("load_postal_codes", self.write_csv(
+                "POSTAL_CODE,LATITUDE,LONGITUDE\nH3G 1M8,45.5000,-73.5788\n"
+            ), stdout=StringIO())
+
+        with mock.patch("accounts.postal_codes.POSTAL_CODE_INDEX_CHECK_INTERVAL", 0):
+            self.assertAlmostEqual(45.5, get_postal_code_index().get("H3G 1M8")[0], places=4)
+
+            # The coordinates are changed in place, and the version bumped as the command does
+            PostalCode.objects.update(latitude=45.6)
+            self.assertAlmostEqual(45.5, get_postal_code_index().get("H3G 1M8")[0], places=4)
+            DataVersion.bump(POSTAL_CODE_VERSION)
+            self.assertAlmostEqual(45.6, get_postal_code_index().get("H3G 1M8")[0], places=4)
+
+    def test_missing_column(self):
+        """
+        Test that a file without coordinates is rejected
+        @return: void
+        """
+
+        with self.assertRaisesMessage(CommandError, "Missing column(s): LONGITUDE"):
+            call_command("load_postal_codes", self.write_csv("POSTAL_CODE,LATITUDE\nH3G 1M8,45.4972\n"))
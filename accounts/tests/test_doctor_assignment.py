@@ -0,0 +1,135 @@
+from types import SimpleNamespace
+from unittest import mock
+
+from django.contrib.auth.models import User, Permission
+from django.core.management import call_command
+from django.test import TestCase, SimpleTestCase
+from io import StringIO
+
+from accounts.doctor_assignment import plan_doctor_assignment
+from accounts.doctor_locations import DoctorLocationIndex
+from accounts.models import Staff, Patient
+from accounts.postal_codes import PostalCodeIndex
+
+POSTAL_CODE_INDEX = PostalCodeIndex(
+    ["H3G 1M8", "H2X 1Y4", "H3A 0G4", "H2L 2C4", "G1R 4P5", "G1K 3G8"],
+    [45.4972, 45.5087, 45.5048, 45.5188, 46.8123, 46.8139],
+    [-73.5788, -73.5617, -73.5772, -73.5632, -71.2145, -71.2080],
+)
+
+
+class Doctor:
+    def __init__(self, username, postal_code, patient_count):
+        self.username = username
+        self.postal_code = postal_code
+        self.patient_count = patient_count
+
+
+class PlanDoctorAssignmentTests(SimpleTestCase):
+    def setUp(self):
+        self.montreal = Doctor("montreal", "H3G 1M8", 1)
+        self.quebec = Doctor("quebec", "G1R 4P5", 0)
+        self.doctor_index = DoctorLocationIndex([self.montreal, self.quebec], POSTAL_CODE_INDEX)
+
+    def get_patients(self, *postal_codes):
+        return [SimpleNamespace(id=i, postal_code=postal_code) for i, postal_code in enumerate(postal_codes)]
+
+    def test_closest_doctor_with_room(self):
+        """
+        Test that patients get the closest doctor until that doctor has their share, and the farthest patients of a full
+        doctor are the ones given to another doctor
+        @return: void
+        """
+
+        patients = self.get_patients("H2X 1Y4", "H3A 0G4", "H2L 2C4", "G1K 3G8", "Z9Z 9Z9")
+
+        plan = plan_doctor_assignment(patients, self.doctor_index, postal_code_index=POSTAL_CODE_INDEX)
+
+        doctors = {patient.postal_code: doctor.username for patient, doctor, _ in plan.assignments}
+        self.assertEqual(plan.capacity, 3)
+        self.assertEqual(doctors, {
+            "H3A 0G4": "montreal",
+            "H2X 1Y4": "montreal",
+            "H2L 2C4": "quebec",
+            "G1K 3G8": "quebec",
+        })
+        self.assertEqual(plan.loads, {self.montreal: [1, 3], self.quebec: [0, 2]})
+        self.assertEqual([patient.postal_code for patient in plan.unlocated], ["Z9Z 9Z9"])
+        self.assertEqual(plan.unassigned, [])
+
+    def test_capacity(self):
+        """
+        Test that patients are left unassigned once every doctor has reached the given capacity
+        @return: void
+        """
+
+        patients = self.get_patients("H2X 1Y4", "H3A 0G4", "G1K 3G8")
+
+        plan = plan_doctor_assignment(patients, self.doctor_index, capacity=1, postal_code_index=POSTAL_CODE_INDEX)
+
+        self.assertEqual([patient.postal_code for patient, _, _ in plan.assignments], ["G1K 3G8"])
+        self.assertEqual(len(plan.unassigned), 2)
+
+    def test_no_doctors(self):
+        """
+        Test that no patient is assigned when there are no doctors
+        @return: void
+        """
+
+        patients = self.get_patients("H2X 1Y4")
+
+        doctor_index = DoctorLocationIndex([], POSTAL_CODE_INDEX)
+
+        plan = plan_doctor_assignment(patients, doctor_index, postal_code_index=POSTAL_CODE_INDEX)
+
+        self.assertEqual(plan.assignments, [])
+        self.assertEqual(plan.unassigned, patients)
+
+
+@mock.patch("accounts.doctor_locations.get_postal_code_index", return_value=POSTAL_CODE_INDEX)
+@mock.patch("accounts.doctor_assignment.get_postal_code_index", return_value=POSTAL_CODE_INDEX)
+class AssignDoctorsCommandTests(TestCase):
+    def setUp(self):
+        is_doctor = Permission.objects.get(codename="is_doctor")
+        self.staffs = []
+        for username, postal_code in [("montreal", "H3G 1M8"), ("quebec", "G1R 4P5")]:
+            doctor = User.objects.create(username=username, is_staff=True)
+            doctor.user_permissions.add(is_doctor)
+            doctor.profile.postal_code = postal_code
+            doctor.profile.save()
+            self.staffs.append(Staff.objects.create(user=doctor))
+
+        self.patients = []
+        for i, postal_code in enumerate(["H2X 1Y4", "G1K 3G8"]):
+            patient = User.objects.create(username=f"patient{i}")
+            patient.profile.postal_code = postal_code
+            patient.profile.save()
+            self.patients.append(Patient.objects.create(user=patient))
+
+    def test_assign_doctors(self, *mocks):
+        """
+        Test that the command saves the closest doctor of every unassigned patient
+        @return: void
+        """
+
+        output = StringIO()
+        call_command("assign_doctors", stdout=output)
+
+        self.assertEqual(
+            [patient.assigned_staff for patient in Patient.objects.order_by("id")],
+            self.staffs,
+        )
+        self.assertIn("Assigned 2 patient(s) with a capacity of 1 per doctor", output.getvalue())
+
+    def test_dry_run(self, *mocks):
+        """
+        Test that the command only reports the assignment in a dry run
+        @return: void
+        """
+
+        output = StringIO()
+        call_command("assign_doctors", dry_run=True, verbosity=2, stdout=output)
+
+        self.assertFalse(Patient.objects.filter(assigned_staff__isnull=False).exists())
+        self.assertIn("patient0 -> montreal", output.getvalue())
+        self.assertIn("Would assign 2 patient(s)", output.getvalue())
@@ -0,0 +1,66 @@
+from django.contrib.auth.models import User, Permission
+from django.test import TestCase
+
+from accounts.doctor_locations import DoctorLocationIndex
+from accounts.models import Staff, Patient
+from accounts.postal_codes import PostalCodeIndex
+
+
+class DoctorLocationIndexTests(TestCase):
+    def setUp(self):
+        self.postal_code_index = PostalCodeIndex(
+            ["H3G 1M8", "H2X 1Y4", "J7G 2M2", "G1R 4P5"],
+            [45.4972, 45.5087, 45.59, 46.8123],
+            [-73.5788, -73.5617, -73.79, -71.2145],
+        )
+        is_doctor = Permission.objects.get(codename="is_doctor")
+
+        self.doctors = {}
+        for username, postal_code, patient_count in [
+            ("downtown", "H2X 1Y4", 2),
+            ("suburbs", "J7G 2M2", 0),
+            ("quebec", "G1R 4P5", 1),
+            ("unknown", "Z9Z 9Z9", 0),
+        ]:
+            doctor = User.objects.create(username=username, is_staff=True)
+            doctor.user_permissions.add(is_doctor)
+            doctor.profile.postal_code = postal_code
+            doctor.profile.save()
+            staff = Staff.objects.create(user=doctor)
+            for i in range(patient_count):
+                patient = User.objects.create(username=f"{username}_patient_{i}")
+                Patient.objects.create(user=patient, assigned_staff=staff)
+            self.doctors[username] = doctor
+
+        # Staff without the doctor permission are never suggested
+        Staff.objects.create(user=User.objects.create(username="officer", is_staff=True))
+
+    def test_nearest(self):
+        """
+        Test that doctors are loaded in one query and sorted by distance, without the doctors of unknown postal codes
+        @return: void
+        """
+
+        with self.assertNumQueries(1):
+            index = DoctorLocationIndex.from_database(self.postal_code_index)
+
+        nearest = index.nearest(*self.postal_code_index.get("H3G 1M8"))
+
+        self.assertEqual([doctor.username for doctor, _, _ in nearest], ["downtown", "suburbs", "quebec"])
+        self.assertEqual([patient_count for _, _, patient_count in nearest], [2, 0, 1])
+        self.assertAlmostEqual(nearest[0][1], 1849, delta=20)
+        self.assertAlmostEqual(nearest[2][1], 233900, delta=1000)
+
+    def test_nearest_count(self):
+        """
+        Test that only the given number of closest doctors is returned, still sorted by distance
+        @return: void
+        """
+
+        index = DoctorLocationIndex.from_database(self.postal_code_index)
+
+        nearest = index.nearest(*self.postal_code_index.get("G1R 4P5"), count=2)
+
+        self.assertEqual([doctor.username for doctor, _, _ in nearest], ["quebec", "downtown"])
+        self.assertEqual(nearest[0][1], 0)
+        self.assertEqual(index.nearest(45.5, -73.5, count=0), [])
@@ -30,7 +30,7 @@ class PatientTests(TestCase):
         self.assertFalse(self.patient2.is_confirmed)
         self.assertFalse(self.patient2.is_negative)
         self.assertFalse(self.patient2.is_quarantining)
-        self.assertEqual(self.patient2.code, "")
+        self.assertIsNone(self.patient2.code)
 
 
 class PatientStaffTests(TestCase):
@@ -55,3 +55,21 @@ class PatientStaffTests(TestCase):
     def test_staff_patient_set_relationship(self):
         #
         self.assertEqual(set(self.staff.assigned_patients.all()), set(self.patients))
+
+
+class ProfileDeduplicationKeyTests(TestCase):
+    def test_keys_follow_user_and_profile_changes(self):
+        user = User.objects.create(username="jon", email=" Jon@Smyth.com", first_name="Jon", last_name="Smyth")
+        user.profile.phone_number = "+1 (514) 555-0000"
+        user.profile.save()
+
+        user.refresh_from_db()
+        self.assertEqual(user.profile.phone_number_key, "5145550000")
+        self.assertEqual(user.profile.email_key, "jon@smyth.com")
+        self.assertEqual(user.profile.name_key, get_phonetic_name_key("John", "Smith"))
+
+        user.email = "jon@smith.com"
+        user.save()
+
+        user.refresh_from_db()
+        self.assertEqual(user.profile.email_key, "jon@smith.com")
@@ -0,0 +1,77 @@
+import math
+
+from django.test import SimpleTestCase
+
+from accounts.postal_codes import PostalCodeIndex, haversine_distances
+
+
+class PostalCodeIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = PostalCodeIndex(
+            ["J7G 2M2", "H3G 1M8", "H2X 1Y4"],
+            [45.59, 45.4972, 45.5087],
+            [-73.79, -73.5788, -73.5617],
+        )
+
+    def test_get(self):
+        """
+        Test that a postal code is found regardless of its case and surrounding whitespace
+        @return: void
+        """
+
+        latitude, longitude = self.index.get(" h3g 1m8 ")
+
+        self.assertAlmostEqual(latitude, 45.4972, places=4)
+        self.assertAlmostEqual(longitude, -73.5788, places=4)
+        self.assertIsNone(self.index.get("Z9Z 9Z9"))
+        self.assertIsNone(self.index.get(""))
+
+    def test_is_valid(self):
+        """
+        Test that only the postal codes of the index are valid
+        @return: void
+        """
+
+        self.assertTrue(self.index.is_valid("J7G 2M2"))
+        self.assertFalse(self.index.is_valid("J7G 2M3"))
+        self.assertFalse(self.index.is_valid(None))
+        self.assertEqual(len(self.index), 3)
+
+    def test_get_many(self):
+        """
+        Test that many postal codes are looked up at once, with nan coordinates for the unknown ones
+        @return: void
+        """
+
+        latitudes, longitudes, found = self.index.get_many(["H2X 1Y4", "Z9Z 9Z9", "J7G 2M2", "ZZZ ZZZ"])
+
+        self.assertEqual(found.tolist(), [True, False, True, False])
+        self.assertAlmostEqual(float(latitudes[0]), 45.5087, places=4)
+        self.assertAlmostEqual(float(longitudes[2]), -73.79, places=4)
+        self.assertTrue(math.isnan(latitudes[1]))
+        self.assertTrue(math.isnan(longitudes[3]))
+
+    def test_empty_index(self):
+        """
+        Test that an empty index finds nothing
+        @return: void
+        """
+
+        index = PostalCodeIndex([], [], [])
+
+        self.assertIsNone(index.get("H3G 1M8"))
+        self.assertEqual(index.get_many(["H3G 1M8"])[2].tolist(), [False])
+
+
+class HaversineDistancesTests(SimpleTestCase):
+    def test_haversine_distances(self):
+        """
+        Test that the distances to many points are computed at once
+        @return: void
+        """
+
+        distances = haversine_distances(45.4972, -73.5788, [45.4972, 45.5087, 46.8123], [-73.5788, -73.5617, -71.2145])
+
+        self.assertEqual(distances[0], 0)
+        self.assertAlmostEqual(distances[1], 1849, delta=20)
+        self.assertAlmostEqual(distances[2], 233900, delta=1000)
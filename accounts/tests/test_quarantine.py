@@ -0,0 +1,58 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from accounts.models import QuarantineViolation
+from accounts.quarantine import get_violation_counts, get_violation_summary, record_quarantine_violations
+
+
+class QuarantineViolationQueryTests(TestCase):
+    def setUp(self):
+        self.first = User.objects.create(username="first")
+        self.second = User.objects.create(username="second")
+
+        now = datetime.datetime.now()
+        record_quarantine_violations([
+            (self.first.id, now - datetime.timedelta(hours=1), 1500),
+            (self.first.id, now - datetime.timedelta(days=2), 4000),
+            (self.first.id, now - datetime.timedelta(days=10), 90000),
+            (self.second.id, now - datetime.timedelta(days=3), 1200),
+        ])
+
+    def test_record_quarantine_violations(self):
+        """
+        Test that all the violations of a batch are saved in a single insert
+        @return: void
+        """
+
+        with self.assertNumQueries(1):
+            count = record_quarantine_violations([
+                (self.second.id, datetime.datetime.now(), 2000),
+                (self.second.id, datetime.datetime.now(), 2500),
+            ])
+
+        self.assertEqual(2, count)
+        self.assertEqual(6, QuarantineViolation.objects.count())
+
+    def test_get_violation_counts(self):
+        """
+        Test that the violations of each user are counted over the given number of days
+        @return: void
+        """
+
+        with self.assertNumQueries(1):
+            counts = get_violation_counts(7)
+
+        self.assertEqual({self.first.id: 2, self.second.id: 1}, counts)
+        self.assertEqual({self.first.id: 1}, get_violation_counts(1))
+        self.assertEqual({self.second.id: 1}, get_violation_counts(30, [self.second.id]))
+
+    def test_get_violation_summary(self):
+        """
+        Test that the violations of the last days are summarized
+        @return: void
+        """
+
+        self.assertEqual({"violations": 3, "patients": 2, "max_distance": 4000}, get_violation_summary(7))
+        self.assertEqual({"violations": 0, "patients": 0, "max_distance": None}, get_violation_summary(7, []))
@@ -4,14 +4,17 @@ from django.test import TestCase
 from unittest import mock
 
 from Covigo.messages import Messages
-from accounts.models import Flag, Staff
+from accounts.models import Flag, Patient, Staff
 from accounts.utils import (
     get_flag,
     get_superuser_staff_model,
     _send_system_message_from_template,
     send_email_to_user,
     get_or_generate_patient_code,
-    get_or_generate_patient_profile_qr
+    assign_patient_codes,
+    get_patient_profile_qr_url,
+    get_case_counts,
+    get_current_positive_case_count,
 )
 
 
@@ -176,17 +179,22 @@ class GetOrGenerateCodeTests(TestCase):
     @mock.patch('accounts.utils.shortuuid.set_alphabet')
     def test_set_alphabet(self, m_shortuuid_set_alphabet, m_patient):
         """
-        Check that the custom alphabet is set correctly
+        Check that codes use the custom alphabet without changing the global alphabet of shortuuid
         @param m_shortuuid_set_alphabet: set_alphabet() function mock
         @param m_patient: mock patient object
         @return: void
         """
 
+        # Arrange
+        m_instance = m_patient.return_value
+        m_instance.code = None
+
         # Act
-        get_or_generate_patient_code(m_patient)
+        code = get_or_generate_patient_code(m_instance)
 
         # Assert
-        m_shortuuid_set_alphabet.assert_called_once_with('23456789ABCDEFGHJKLMNPQRSTUVWXYZ')
+        m_shortuuid_set_alphabet.assert_not_called()
+        self.assertTrue(set(code[1:]) <= set('23456789ABCDEFGHJKLMNPQRSTUVWXYZ'))
 
     @mock.patch('accounts.utils.shortuuid.set_alphabet')
     @mock.patch('accounts.utils.Patient')
@@ -229,6 +237,49 @@ class GetOrGenerateCodeTests(TestCase):
         self.assertIsNotNone(get_or_generate_patient_code(m_instance))
 
 
+class AssignPatientCodesTests(TestCase):
+    def setUp(self):
+        self.taken = Patient.objects.create(user=User.objects.create(username="taken"), code="A222222222")
+        self.patients = [
+            Patient.objects.create(user=User.objects.create(username=f"patient{i}")) for i in range(3)
+        ]
+
+    @mock.patch('accounts.utils.patient_code_generator.random')
+    def test_collisions_are_regenerated(self, m_random):
+        """
+        Check that candidates already used by a patient are regenerated with a single query per round
+        @param m_random: mock code generator, which first proposes the code that is already taken
+        @return: void
+        """
+
+        # Arrange
+        m_random.side_effect = ["222222222", "333333333", "444444444", "555555555"]
+
+        # Act
+        # Two rounds of candidates, then a single update within its savepoint
+        with self.assertNumQueries(5):
+            assign_patient_codes(self.patients)
+
+        # Assert
+        codes = set(Patient.objects.filter(id__in=[p.id for p in self.patients]).values_list("code", flat=True))
+        self.assertEqual({"A333333333", "A444444444", "A555555555"}, codes)
+
+    def test_patients_with_codes_are_kept(self):
+        """
+        Check that only the patients without a code are given one
+        @return: void
+        """
+
+        # Act
+        assigned = assign_patient_codes([self.taken, *self.patients])
+
+        # Assert
+        self.assertEqual(self.patients, assigned)
+        self.taken.refresh_from_db()
+        self.assertEqual("A222222222", self.taken.code)
+        self.assertEqual(4, Patient.objects.exclude(code=None).values("code").distinct().count())
+
+
 class GenerateProfileQrTests(TestCase):
     def setUp(self):
         self.user = User.objects.create(username='testuser', is_staff=False)
@@ -245,52 +296,58 @@ class GenerateProfileQrTests(TestCase):
         self.user.refresh_from_db()
 
         # Act & Assert
-        self.assertIsNone(get_or_generate_patient_profile_qr(self.user.id))
+        self.assertIsNone(get_patient_profile_qr_url(self.user.id))
 
-    @mock.patch('accounts.utils.Path.mkdir')
-    @mock.patch('accounts.utils.PilImage')
-    @mock.patch('accounts.utils.make')
-    @mock.patch('accounts.utils.os.path.exists')
     @mock.patch('accounts.utils.get_or_generate_patient_code')
     @mock.patch('accounts.utils.Patient.objects')
-    def test_user_is_not_staff_returns_image_path(self, m_patient_objects, m_code_generator, m_os_path_exists,
-                                                  m_qrcode_make, m_pil_image, _):
+    def test_user_is_not_staff_returns_image_url(self, m_patient_objects, m_code_generator):
         """
-        Check that passing a patient user with an existing qr image returns the path to the image
+        Check that passing a patient user returns the url of the qr code endpoint for their code
         @param m_patient_objects: Mock patient object
         @param m_code_generator: Mock patient code generator utility function
-        @param m_os_path_exists: Mock os path
-        @param m_qrcode_make: Mock qrcode make function that returns a mocked PilImage
-        @param m_pil_image: Mock PilImage save function
-        @param _:
         @return: void
         """
 
-        cases = [
-            {'path_exists': False, 'msg': 'When the qr image does not exist'},
-            {'path_exists': True, 'msg': 'When the qr image exists'}
-        ]
-        for case in cases:
-            with self.subTest(case.get('msg')):
-                # Arrange
-                m_code_generator.return_value = 'boxxy'
-                m_patient_objects.get.return_value = None
-                m_generated_image = m_pil_image.return_value  # Mock image returned by PilImage
-                m_qrcode_make.return_value = m_generated_image  # Making the qrcode returns the mocked PilImage
-                m_os_path_exists.return_value = case.get('path_exists')
-
-                # Reset the calls between the test cases
-                # (else the fact that it was called will "leak into"
-                # the other test case and assert_not_called() will fail)
-                m_generated_image.reset_mock()
-
-                # Act
-                returned_path = get_or_generate_patient_profile_qr(self.user.id)
-
-                # Assert
-                if not case.get('path_exists'):
-                    m_generated_image.save.assert_called_once_with('accounts/static/accounts/qrs/boxxy.png')
-                else:
-                    m_generated_image.save.assert_not_called()
-
-                self.assertEqual('accounts/qrs/boxxy.png', returned_path)
+        # Arrange
+        m_code_generator.return_value = 'boxxy'
+        m_patient_objects.get.return_value = None
+
+        # Act & Assert
+        self.assertEqual('/accounts/qr/boxxy.png', get_patient_profile_qr_url(self.user.id))
+
+
+class GetCaseCountsTests(TestCase):
+    def setUp(self):
+        for i, (is_confirmed, is_negative, is_quarantining) in enumerate([
+            (True, False, True),
+            (True, True, False),
+            (False, True, False),
+            (False, False, True),
+            (False, False, False),
+        ]):
+            Patient.objects.create(
+                user=User.objects.create(username=f"patient{i}"),
+                is_confirmed=is_confirmed,
+                is_negative=is_negative,
+                is_quarantining=is_quarantining,
+            )
+
+    def test_get_case_counts(self):
+        """
+        Test that the patients of every case status are counted in a single query
+        @return: void
+        """
+
+        with self.assertNumQueries(1):
+            counts = get_case_counts()
+
+        self.assertEqual({
+            "confirmed": 2,
+            "positive": 1,
+            "recovered": 1,
+            "negative": 2,
+            "unconfirmed_negative": 1,
+            "unconfirmed_untested": 2,
+            "quarantining": 2,
+        }, counts)
+        self.assertEqual(counts["positive"], get_current_positive_case_count())
@@ -1,15 +1,19 @@
+import datetime
 import json
+import tempfile
 
 from django.contrib.auth.models import User, Group, Permission
-from django.test import TestCase, TransactionTestCase, RequestFactory, Client
+from django.test import TestCase, TransactionTestCase, RequestFactory, Client, override_settings
 from django.urls import reverse
 from unittest import mock
-from django.db import connection
 
 from Covigo.messages import Messages
-from accounts.utils import get_flag, dictfetchall
+from accounts.utils import get_flag
 from accounts.views import flag_user, unflag_user, profile_from_code, convert_permission_name_to_id
-from accounts.models import Flag, Patient, Staff
+from accounts.models import Flag, Patient, PatientCaseEvent, Staff, PostalCode, QuarantineViolation
+from accounts.postal_codes import PostalCodeIndex, clear_postal_code_index
+from accounts.qr_codes import get_qr_code_key, get_qr_code_path, qr_code_memory_cache, render_qr_code
+from pathlib import Path
 
 
 class EditCaseTests(TestCase):
@@ -62,6 +66,10 @@ class EditCaseTests(TestCase):
         self.assertEqual(self.edited_mocked_case_data1['is_negative'], self.patient.is_negative)
         self.assertEqual(self.edited_mocked_case_data1['is_quarantining'], self.patient.is_quarantining)
 
+        # Assert/verify that the new case status was logged
+        event = PatientCaseEvent.objects.get(patient=self.patient_user)
+        self.assertEqual((False, False, True), (event.is_confirmed, event.is_negative, event.is_quarantining))
+
     def test_edit_case_info_error(self):
         """
         test to check if a staff user can't submit an unchanged/unedited case info/data of a patient successfully
@@ -121,7 +129,8 @@ class ChangePasswordTests(TestCase):
         self.assertEqual('This field is required.', list(response.context['form'].errors.values())[1][0])
         self.assertEqual('This field is required.', list(response.context['form'].errors.values())[2][0])
 
-    def test_user_can_change_password_successfully_and_is_redirected_to_done(self):
+    @mock.patch('accounts.views.send_system_message_to_user')
+    def test_user_can_change_password_successfully_and_is_redirected_to_done(self, mock_send_system_message):
         """
         test to check if a user can change their account password successfully
         @return: void
@@ -136,6 +145,7 @@ class ChangePasswordTests(TestCase):
 
         # Assert
         self.assertRedirects(response, '/accounts/change_password/done/')
+        mock_send_system_message.assert_called_once()
 
     def test_change_password_errors(self):
         """
@@ -490,8 +500,8 @@ class ListOrViewAccountTests(TestCase):
         # Assert
         self.assertTemplateNotUsed(response, 'accounts/profile/profile.html')
 
-    @mock.patch('accounts.views.get_or_generate_patient_profile_qr')
-    def test_profile_logged_in(self, m_get_or_generate_patient_profile_qr_function):
+    @mock.patch('accounts.views.get_patient_profile_qr_url')
+    def test_profile_logged_in(self, m_get_patient_profile_qr_url_function):
         """
         Test that checks if logged-in users can view user profiles
         @return: void
@@ -502,10 +512,44 @@ class ListOrViewAccountTests(TestCase):
 
         # Assert
         self.assertTemplateUsed(response, 'accounts/profile/profile.html')
-        m_get_or_generate_patient_profile_qr_function.assert_called_once()
+        m_get_patient_profile_qr_url_function.assert_called_once()
 
-    @mock.patch('accounts.views.get_or_generate_patient_profile_qr')
-    def test_profile_from_code(self, m_get_or_generate_patient_profile_qr_function):
+    @mock.patch('accounts.views.get_patient_profile_qr_url')
+    def test_profile_shows_recent_quarantine_violations_to_staff(self, m_get_patient_profile_qr_url_function):
+        """
+        Test that the staff are shown the quarantine violations of the last days of a patient, and of each patient
+        assigned to a doctor
+        @return: void
+        """
+
+        # Arrange
+        now = datetime.datetime.now()
+        QuarantineViolation.objects.bulk_create([
+            QuarantineViolation(patient_id=1, timestamp=now - datetime.timedelta(days=1), distance=1500),
+            QuarantineViolation(patient_id=1, timestamp=now - datetime.timedelta(hours=1), distance=2500),
+            QuarantineViolation(patient_id=1, timestamp=now - datetime.timedelta(days=30), distance=9000),
+        ])
+        User.objects.get(id=2).user_permissions.add(Permission.objects.get(codename="is_doctor"))
+        staff_client = create_test_client(User.objects.create_user("admin", password="secret", is_staff=True,
+                                                                   is_superuser=True), "secret")
+
+        # Act
+        patient_response = staff_client.get(reverse('accounts:profile', args=[1]))
+        doctor_response = staff_client.get(reverse('accounts:profile', args=[2]))
+        own_response = self.client.get(reverse('accounts:profile', args=[1]))
+
+        # Assert
+        self.assertEqual(2, patient_response.context["violation_summary"]["violations"])
+        self.assertContains(patient_response, "2, up to 2500 m")
+        self.assertEqual(
+            [2], [patient_user.violation_count for patient_user in doctor_response.context["assigned_patients"]]
+        )
+        self.assertContains(doctor_response, "2 violations")
+        self.assertIsNone(own_response.context["violation_summary"])
+        self.assertNotContains(own_response, "Quarantine Violations")
+
+    @mock.patch('accounts.views.get_patient_profile_qr_url')
+    def test_profile_from_code(self, m_get_patient_profile_qr_url_function):
         """
         Test that checks if not logged-in users can view user profiles qr codes using the profile codes
         @return: void
@@ -521,7 +565,63 @@ class ListOrViewAccountTests(TestCase):
         profile_from_code(request, 1)
 
         # Assert
-        m_get_or_generate_patient_profile_qr_function.assert_called_once()
+        m_get_patient_profile_qr_url_function.assert_called_once()
+
+
+class PatientQrCodeTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        override = override_settings(QR_CODE_DIRECTORY=Path(self.directory.name))
+        override.enable()
+        self.addCleanup(override.disable)
+        qr_code_memory_cache.clear()
+
+        user = User.objects.create(username="patient")
+        Patient.objects.create(user=user, code="ABCD2345")
+        self.url = reverse('accounts:patient_qr_code', args=["ABCD2345"])
+
+    def test_qr_code_is_rendered_once_and_cached(self):
+        """
+        Test that the qr code is rendered on the first request, stored on disk, and served from the caches afterwards
+        @return: void
+        """
+
+        with mock.patch('accounts.qr_codes.render_qr_code', wraps=render_qr_code) as m_render:
+            first = self.client.get(self.url)
+            qr_code_memory_cache.clear()
+            second = self.client.get(self.url)
+
+        self.assertEqual(200, first.status_code)
+        self.assertEqual("image/png", first["Content-Type"])
+        self.assertEqual(first.content, second.content)
+        self.assertTrue(first.content.startswith(b"\x89PNG"))
+        m_render.assert_called_once_with("ABCD2345")
+        self.assertTrue(get_qr_code_path(get_qr_code_key("ABCD2345")).exists())
+
+    def test_qr_code_caching_headers(self):
+        """
+        Test that the qr code is sent with a long-lived Cache-Control and an ETag that browsers can revalidate
+        @return: void
+        """
+
+        response = self.client.get(self.url)
+        revalidated = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+
+        self.assertIn("max-age=31536000", response["Cache-Control"])
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertEqual(304, revalidated.status_code)
+
+    def test_unknown_code_is_not_rendered(self):
+        """
+        Test that no qr code is rendered for a code that no patient has
+        @return: void
+        """
+
+        response = self.client.get(reverse('accounts:patient_qr_code', args=["UNKNOWN99"]))
+
+        self.assertEqual(404, response.status_code)
+        self.assertFalse(any(Path(self.directory.name).iterdir()))
 
 
 class AccountsTestCase(TransactionTestCase):
@@ -549,9 +649,10 @@ class AccountsTestCase(TransactionTestCase):
         self.mocked_group2 = Group.objects.create(name='Doctor')
         self.mocked_group3 = Group.objects.create(name='Officer')
 
-        c = connection.cursor()
-        c.execute('SELECT * FROM Covigo.postal_codes WHERE POSTAL_CODE = %s', ['J7G 2M2'])
-        r = dictfetchall(c)
+        postal_code = PostalCode.objects.create(postal_code='J7G 2M2', latitude=45.5876, longitude=-73.8345)
+        # The postal code index of the process may have been loaded before the postal code was created
+        clear_postal_code_index()
+        self.addCleanup(clear_postal_code_index)
 
         self.mocked_form_data1 = {'email': '', 'phone_number': '', 'user_type': "Staff", 'groups': self.mocked_group1.id}
         self.mocked_form_data2 = {'email': 'my_brother@gmail.com', 'phone_number': '', 'user_type': "Staff",
@@ -568,31 +669,31 @@ class AccountsTestCase(TransactionTestCase):
                                   'groups': [self.mocked_group2.id, self.mocked_group3.id]}
         self.edited_mocked_form_data2 = {'username': 'my_brother@gmail.com', 'email': 'my_mother@gmail.com',
                                          'phone_number': '', 'user_type': "Staff", 'groups': self.mocked_group2.id,
-                                         'postal_code': r[0]['POSTAL_CODE']}
+                                         'postal_code': postal_code.postal_code}
         self.edited_mocked_form_data3 = {'username': '5145639236', 'email': 'my_otter@gmail.com',
                                          'phone_number': '5145639236', 'user_type': "Staff",
-                                         'groups': self.mocked_group2.id, 'postal_code': r[0]['POSTAL_CODE']}
+                                         'groups': self.mocked_group2.id, 'postal_code': postal_code.postal_code}
         self.edited_mocked_form_data4 = {'username': 'my_sister@gmail.com', 'email': 'my_sister@gmail.com',
                                          'phone_number': '5140398275', 'user_type': "Staff",
-                                         'groups': self.mocked_group3.id, 'postal_code': r[0]['POSTAL_CODE']}
+                                         'groups': self.mocked_group3.id, 'postal_code': postal_code.postal_code}
         self.edited_mocked_form_data5 = {'username': 'my_sister@gmail.com', 'email': 'my_sister@gmail.com',
                                          'phone_number': '5149067845', 'user_type': "Staff",
-                                         'groups': self.mocked_group2.id, 'postal_code': r[0]['POSTAL_CODE']}
+                                         'groups': self.mocked_group2.id, 'postal_code': postal_code.postal_code}
         self.edited_mocked_form_data6 = {'username': '', 'email': 'my_sister@gmail.com', 'phone_number': '5140398275',
                                          'user_type': "Staff", 'groups': self.mocked_group3.id,
-                                         'postal_code': r[0]['POSTAL_CODE']}
+                                         'postal_code': postal_code.postal_code}
         self.edited_mocked_form_data7 = {'username': 'my_sister;', 'email': 'my_sister@gmail.com',
                                          'phone_number': '5140398275', 'user_type': "Staff",
-                                         'groups': self.mocked_group3.id, 'postal_code': r[0]['POSTAL_CODE']}
+                                         'groups': self.mocked_group3.id, 'postal_code': postal_code.postal_code}
         self.edited_mocked_form_data8 = {'username': 'my_sister@gmail.com', 'email': 'y', 'phone_number': '5149067845',
                                          'user_type': "Staff", 'groups': self.mocked_group3.id,
-                                         'postal_code': r[0]['POSTAL_CODE']}
+                                         'postal_code': postal_code.postal_code}
         self.edited_mocked_form_data9 = {'username': 'my_sister@gmail.com', 'email': 'my_sister@gmail.com',
                                          'phone_number': 'h', 'user_type': "Staff", 'groups': self.mocked_group3.id,
-                                         'postal_code': r[0]['POSTAL_CODE']}
+                                         'postal_code': postal_code.postal_code}
         self.edited_mocked_form_data10 = {'username': 'my_sister@gmail.com', 'email': '', 'phone_number': '',
                                           'user_type': "Staff", 'groups': self.mocked_group3.id,
-                                          'postal_code': r[0]['POSTAL_CODE']}
+                                          'postal_code': postal_code.postal_code}
         self.edited_mocked_form_data11 = {'username': 'my_sister@gmail.com', 'email': 'my_sister@gmail.com',
                                           'phone_number': '5149067845', 'user_type': "Staff",
                                           'groups': self.mocked_group3.id, 'postal_code': ''}
@@ -605,10 +706,10 @@ class AccountsTestCase(TransactionTestCase):
         self.edited_mocked_form_data14 = {'username': 'my_sister@gmail.com', 'email': 'my_father@gmail.com',
                                           'phone_number': '5149067845', 'user_type': "Staff",
                                           'groups': [self.mocked_group2.id, self.mocked_group3.id],
-                                          'postal_code': r[0]['POSTAL_CODE']}
+                                          'postal_code': postal_code.postal_code}
         self.edited_mocked_form_data15 = {'username': 'my_brother@gmail.com', 'email': 'my_mother@gmail.com',
                                           'phone_number': '5145639236', 'user_type': "Staff",
-                                          'groups': self.mocked_group3.id, 'postal_code': r[0]['POSTAL_CODE']}
+                                          'groups': self.mocked_group3.id, 'postal_code': postal_code.postal_code}
 
         self.response = self.client.get(reverse('accounts:create_user'))
 
@@ -909,7 +1010,7 @@ class AccountsTestCase(TransactionTestCase):
         # as new users/accounts in the database entirely
         self.assertTrue(User.objects.all().count() == 4)
         self.response = self.client.get(reverse('accounts:list_users_table'))
-        loaded_response = json.loads(self.response.content)['data']
+        loaded_response = json.loads(self.response.getvalue())['data']
 
         usernames_list = set(map(lambda x: (x['username']), loaded_response))
         emails_list = set(map(lambda x: (x['email']), loaded_response))
@@ -934,6 +1035,169 @@ class AccountsTestCase(TransactionTestCase):
         self.assertEqual(groups_list, groups_from_db)
 
 
+class RecordLocationPingsTests(TestCase):
+    def setUp(self):
+        self.postal_code_index = PostalCodeIndex(["H3G 1M8", "G1R 4P5"], [45.4972, 46.8123], [-73.5788, -71.2145])
+        patcher = mock.patch("accounts.quarantine.get_postal_code_index", return_value=self.postal_code_index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.doctor = User.objects.create(username="doctor", is_staff=True)
+        self.doctor.set_password("doctor")
+        self.doctor.save()
+        self.doctor.user_permissions.add(Permission.objects.get(codename="set_assigned_quarantine"))
+        staff = Staff.objects.create(user=self.doctor)
+
+        self.patients = []
+        for username, postal_code, assigned_staff in [("montreal", "H3G 1M8", staff), ("quebec", "G1R 4P5", None)]:
+            patient = User.objects.create(username=username)
+            patient.set_password(username)
+            patient.save()
+            patient.profile.postal_code = postal_code
+            patient.profile.save()
+            Patient.objects.create(user=patient, assigned_staff=assigned_staff)
+            self.patients.append(patient)
+
+        self.url = reverse("accounts:record_location_pings")
+
+    def post_pings(self, user, password, pings):
+        self.client.login(username=user.username, password=password)
+        return self.client.post(self.url, json.dumps({"pings": pings}), content_type="application/json")
+
+    def test_own_pings(self):
+        """
+        Test that only the pings too far from the patient's home are saved as violations
+        @return: void
+        """
+
+        response = self.post_pings(self.patients[0], "montreal", [
+            {"latitude": 45.4975, "longitude": -73.5790},
+            {"latitude": 45.5087, "longitude": -73.5617, "timestamp": "2022-04-01T10:30:00"},
+            {"latitude": 46.8123, "longitude": -71.2145, "timestamp": "2022-04-01T11:00:00"},
+        ])
+
+        self.assertEqual(200, response.status_code)
+        data = response.json()
+        self.assertEqual(2, data["violations"])
+        self.assertLess(data["distances"][0], 100)
+        self.assertAlmostEqual(data["distances"][1], 1849, delta=20)
+
+        violations = QuarantineViolation.objects.filter(patient=self.patients[0]).order_by("timestamp")
+        self.assertEqual(
+            [datetime.datetime(2022, 4, 1, 10, 30), datetime.datetime(2022, 4, 1, 11)],
+            [violation.timestamp for violation in violations],
+        )
+        self.assertAlmostEqual(violations[0].distance, 1849, delta=20)
+
+    def test_pings_of_assigned_patients(self):
+        """
+        Test that a doctor can send the pings of their assigned patients but not of other patients
+        @return: void
+        """
+
+        response = self.post_pings(self.doctor, "doctor", [
+            {"user": self.patients[0].id, "latitude": 46.8123, "longitude": -71.2145},
+        ])
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, response.json()["violations"])
+
+        response = self.post_pings(self.doctor, "doctor", [
+            {"user": self.patients[0].id, "latitude": 46.8123, "longitude": -71.2145},
+            {"user": self.patients[1].id, "latitude": 45.4972, "longitude": -73.5788},
+        ])
+        self.assertEqual(403, response.status_code)
+
+    def test_unknown_home(self):
+        """
+        Test that a ping of a user whose home is unknown is never a violation
+        @return: void
+        """
+
+        self.doctor.profile.postal_code = "Z9Z 9Z9"
+        self.doctor.profile.save()
+
+        response = self.post_pings(self.doctor, "doctor", [{"latitude": 46.8123, "longitude": -71.2145}])
+
+        self.assertEqual({"distances": [None], "violations": 0}, response.json())
+
+    def test_malformed_pings(self):
+        """
+        Test that a malformed batch is rejected without saving anything
+        @return: void
+        """
+
+        for pings in [
+            None,
+            [{"latitude": 45.5}],
+            [{"latitude": 95, "longitude": 0}],
+            [{"latitude": 45.5, "longitude": -73.6, "timestamp": "yesterday"}],
+            [{"user": True, "latitude": 45.5, "longitude": -73.6}],
+            [{"user": 1.5, "latitude": 45.5, "longitude": -73.6}],
+        ]:
+            response = self.post_pings(self.patients[0], "montreal", pings)
+            self.assertEqual(400, response.status_code)
+
+        self.assertFalse(QuarantineViolation.objects.exists())
+
+
+class ListUsersTableTests(TestCase):
+    def setUp(self):
+        self.client = create_test_client()
+        self.group = Group.objects.create(name="Nurses")
+
+        for name in ["carl", "alice", "dave", "bert"]:
+            user = User.objects.create(username=name, email=f"{name}@covigo.com")
+            if name in ["alice", "carl"]:
+                user.groups.add(self.group)
+
+    def get_table(self, **params):
+        response = self.client.get(reverse('accounts:list_users_table'), {"draw": 1, **params})
+        self.assertEqual(200, response.status_code)
+        return json.loads(response.getvalue())
+
+    def test_pages_are_ordered_and_counted(self):
+        """
+        Test that the table returns one ordered page of users along with the total and filtered counts
+        @return: void
+        """
+
+        table = self.get_table(**{"start": 1, "length": 2, "order[0][column]": 1, "columns[1][data]": "username"})
+
+        self.assertEqual(5, table["recordsTotal"])
+        self.assertEqual(5, table["recordsFiltered"])
+        self.assertEqual(["bert", "bob"], [row["username"] for row in table["data"]])
+
+    def test_next_page_cursor_seeks_past_previous_page(self):
+        """
+        Test that following the returned cursor gives the same page as paging by offset, in both directions
+        @return: void
+        """
+
+        for direction in ["asc", "desc"]:
+            order = {"order[0][column]": 1, "columns[1][data]": "username", "order[0][dir]": direction, "length": 2}
+
+            first_page = self.get_table(start=0, **order)
+            cursor = first_page["next"]
+            seek_page = self.get_table(start=cursor["start"], cursor=cursor["cursor"], **order)
+            offset_page = self.get_table(start=2, **order)
+
+            self.assertEqual(offset_page["data"], seek_page["data"])
+
+    def test_search_and_group_filter(self):
+        """
+        Test that the search term and the group filter restrict the rows and the filtered count
+        @return: void
+        """
+
+        searched = self.get_table(**{"search[value]": "ER"})
+        grouped = self.get_table(**{"columns[6][data]": "groups", "columns[6][search][value]": "Nurses"})
+
+        self.assertEqual(["bert"], [row["username"] for row in searched["data"]])
+        self.assertEqual(1, searched["recordsFiltered"])
+        self.assertEqual({"alice", "carl"}, {row["username"] for row in grouped["data"]})
+        self.assertEqual({"Nurses"}, {row["groups"] for row in grouped["data"]})
+
+
 class ListGroupTests(TestCase):
     def test_list_groups_not_logged_in(self):
         """
@@ -964,12 +1228,15 @@ class ListGroupTests(TestCase):
         new_group_name = 'test groups lol'
         second_new_group_name = 'second test groups lol'
 
+        # The ids of the created permissions depend on the database, so they are looked up
+        permissions = list(Permission.objects.order_by('codename'))
+
         group1 = Group.objects.create(name=new_group_name)
-        group1.permissions.set([1, 2])
+        group1.permissions.set(permissions[0:2])
         group1.save()
 
         group2 = Group.objects.create(name=second_new_group_name)
-        group2.permissions.set([2, 3])
+        group2.permissions.set(permissions[1:3])
         group2.save()
 
         # Act
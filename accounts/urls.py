@@ -22,6 +22,7 @@ urlpatterns = [
     path('verify_otp/<int:user_id>/', views.verify_otp, name='verify_otp'),
     path('profile/<int:user_id>/', views.profile, name='profile'),
     path('profile/<code>/', views.profile_from_code, name='profile_from_code'),
+    path('qr/<code>.png', views.patient_qr_code, name='patient_qr_code'),
     path('edit_case/<int:user_id>/', views.edit_case, name='edit_case'),
 
     path(
@@ -98,5 +99,6 @@ urlpatterns = [
     ),
 
     path('get_distance/<postal_code>/<current_lat>/<current_long>/',
-         views.verify_quarantine_compliance, name='get_distance')
+         views.verify_quarantine_compliance, name='get_distance'),
+    path('location_pings/', views.record_location_pings, name='record_location_pings'),
 ]
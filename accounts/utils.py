@@ -1,27 +1,46 @@
-import os.path
 import random
 import shortuuid
 import smtplib
 
 from django.contrib.auth.models import User, Permission
-from django.core.management import call_command
-from django.db import IntegrityError, connection
-from django.db.models import Q
+from django.db import IntegrityError, transaction
+from django.db.models import Case, CharField, Count, Exists, OuterRef, Q, Value, When
 from django.template.loader import render_to_string
+from django.urls import reverse
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 
-from Covigo.settings import HOST_NAME, PRODUCTION_MODE
+from Covigo.settings import HOST_NAME
+from accounts.doctor_locations import get_nearest_doctors
 from accounts.models import Flag, Staff, Patient, Profile
 from accounts.preferences import SystemMessagesPreference
 
-from geopy import distance
-from pathlib import Path
-from qrcode.image.pil import PilImage
-from qrcode.main import make
 from twilio.base.exceptions import TwilioRestException
 from twilio.rest import Client
 
+# Shortuuid docs recommends removing characters (like 0 and O) that can be confused.
+# It sounds reasonable so I decided to do that.
+PATIENT_CODE_ALPHABET = "23456789ABCDEFGHJKLMNPQRSTUVWXYZ"
+PATIENT_CODE_LENGTH = 9
+PATIENT_CODE_BATCH_SIZE = 1000
+
+# Number of times a batch of codes is regenerated when another process took one of them first
+PATIENT_CODE_ATTEMPTS = 3
+
+# Generator with its own alphabet, which leaves the global alphabet of shortuuid untouched
+patient_code_generator = shortuuid.ShortUUID(alphabet=PATIENT_CODE_ALPHABET)
+
+# Filter of the patients of each case status, which are described by the get_..._count functions below
+CASE_STATUS_FILTERS = {
+    "confirmed": Q(is_confirmed=True),
+    "positive": Q(is_confirmed=True, is_negative=False),
+    "recovered": Q(is_confirmed=True, is_negative=True),
+    "negative": Q(is_negative=True),
+    "unconfirmed_negative": Q(is_confirmed=False, is_negative=True),
+    "unconfirmed_untested": Q(is_confirmed=False, is_negative=False),
+    "quarantining": Q(is_quarantining=True),
+}
+
 
 def _send_system_message_from_template(user, template, c=None, is_email=True):
     """
@@ -161,30 +180,69 @@ def get_or_generate_patient_code(patient, prefix="A"):
     @return: The patient's profile code
     """
 
-    # Shortuuid docs recommends removing characters (like 0 and O) that can be confused.
-    # It sounds reasonable so I decided to do that.
-    shortuuid.set_alphabet("23456789ABCDEFGHJKLMNPQRSTUVWXYZ")
     if not patient.code:
-        code = shortuuid.uuid()[:9]
+        assign_patient_codes([patient], prefix)
 
-        # Regenerate the code if it exists
-        while Patient.objects.filter(code=code).exists():
-            code = shortuuid.uuid()[:9]
+    return patient.code
 
-        code = prefix + code
 
-        patient.code = code
-        patient.save()
-        return patient.code
-    else:
-        return patient.code
+def generate_unique_patient_codes(count, prefix="A"):
+    """
+    Generate a batch of patient codes that no existing patient uses yet.
+    Candidates are checked against the database with a single query per round, and only collisions are regenerated.
+    @param count: The number of codes to generate
+    @param prefix: The prefix to give to the codes. A is the default prefix
+    @return: A list of unique patient codes
+    """
+
+    codes = set()
+
+    while len(codes) < count:
+        candidates = {
+            prefix + patient_code_generator.random(length=PATIENT_CODE_LENGTH) for _ in range(count - len(codes))
+        } - codes
+        taken = set(Patient.objects.filter(code__in=candidates).values_list("code", flat=True))
+        codes |= candidates - taken
+
+    return list(codes)
 
 
-def get_or_generate_patient_profile_qr(user_id):
+def assign_patient_codes(patients, prefix="A"):
     """
-    Get the path to a patient's qr code image, or generate the image if it doesn't exist.
+    Give a unique code to each of the patients that don't have one yet, with a single update query per batch.
+    If another process takes one of the codes in the meantime, the unique index on the code rejects the update and
+    new codes are generated.
+    @param patients: The patients whose codes are to be generated
+    @param prefix: The prefix to give to the codes. A is the default prefix
+    @return: The patients that were given a code
+    """
+
+    patients = [patient for patient in patients if not patient.code]
+
+    for attempt in range(PATIENT_CODE_ATTEMPTS):
+        codes = generate_unique_patient_codes(len(patients), prefix)
+
+        try:
+            with transaction.atomic():
+                for patient, code in zip(patients, codes):
+                    patient.code = code
+                Patient.objects.bulk_update(patients, ["code"], batch_size=PATIENT_CODE_BATCH_SIZE)
+            return patients
+
+        except IntegrityError:
+            for patient in patients:
+                patient.code = None
+
+            if attempt == PATIENT_CODE_ATTEMPTS - 1:
+                raise
+
+
+def get_patient_profile_qr_url(user_id):
+    """
+    Get the url of a patient's qr code image, generating the patient's code if it doesn't exist.
+    The image itself is rendered by the qr code endpoint the first time it is requested.
     @param user_id: The patient whose qr code is to be fetched
-    @return: Path to the qr code image file
+    @return: Url of the qr code image, or None if the user is not a patient
     """
 
     user = User.objects.get(id=user_id)
@@ -195,22 +253,7 @@ def get_or_generate_patient_profile_qr(user_id):
         patient = Patient.objects.get(user=user)
         patient_code = get_or_generate_patient_code(patient)
 
-        # Link to store in the qr code
-        data = f"{HOST_NAME}/accounts/profile/{str(patient_code)}"
-
-        # Create path to store generated qr code image
-        path = f"accounts/qrs/{str(patient_code)}.png"
-        Path("accounts/static/accounts/qrs").mkdir(parents=True, exist_ok=True)
-
-        if os.path.exists(path):
-            return path
-        else:
-            # Generate the qr code
-            img: PilImage = make(data)
-            img.save("accounts/static/" + path)
-            if PRODUCTION_MODE:
-                call_command('collectstatic', '--noinput')
-            return path
+        return reverse("accounts:patient_qr_code", args=[patient_code])
     else:
         return None
 
@@ -255,9 +298,7 @@ def get_current_recovered_case_count():
     @return: The number of confirmed cases who tested negative and recovered
     """
 
-    confirmed = Q(is_confirmed=True)
-    negative = Q(is_negative=True)
-    return Patient.objects.filter(confirmed & negative).count()
+    return Patient.objects.filter(CASE_STATUS_FILTERS["recovered"]).count()
 
 
 def get_current_positive_case_count():
@@ -266,9 +307,7 @@ def get_current_positive_case_count():
     @return: The number of confirmed cases who tested positive
     """
 
-    confirmed = Q(is_confirmed=True)
-    not_negative = Q(is_negative=False)
-    return Patient.objects.filter(confirmed & not_negative).count()
+    return Patient.objects.filter(CASE_STATUS_FILTERS["positive"]).count()
 
 
 def get_unconfirmed_and_negative_case_count():
@@ -277,9 +316,7 @@ def get_unconfirmed_and_negative_case_count():
     @return: The number of unconfirmed cases who tested negative
     """
 
-    not_confirmed = Q(is_confirmed=False)
-    negative = Q(is_negative=True)
-    return Patient.objects.filter(not_confirmed & negative).count()
+    return Patient.objects.filter(CASE_STATUS_FILTERS["unconfirmed_negative"]).count()
 
 
 def get_unconfirmed_and_untested_count():
@@ -289,9 +326,7 @@ def get_unconfirmed_and_untested_count():
     @return: The number of unconfirmed cases who are still untested
     """
 
-    not_confirmed = Q(is_confirmed=False)
-    not_negative = Q(is_negative=False)
-    return Patient.objects.filter(not_confirmed & not_negative).count()
+    return Patient.objects.filter(CASE_STATUS_FILTERS["unconfirmed_untested"]).count()
 
 
 def get_current_negative_case_count():
@@ -301,7 +336,7 @@ def get_current_negative_case_count():
     @return: The number of cases whose most recent test was negative
     """
 
-    return Patient.objects.filter(is_negative=True).count()
+    return Patient.objects.filter(CASE_STATUS_FILTERS["negative"]).count()
 
 
 def get_current_confirmed_case_count():
@@ -311,7 +346,19 @@ def get_current_confirmed_case_count():
     @return: The total number of confirmed Covid cases
     """
 
-    return Patient.objects.filter(is_confirmed=True).count()
+    return Patient.objects.filter(CASE_STATUS_FILTERS["confirmed"]).count()
+
+
+def get_case_counts():
+    """
+    Counts the patients of every case status at once, in a single pass over the patients rather than one query per
+    status
+    @return: dict of the number of patients of each status of CASE_STATUS_FILTERS, keyed by status
+    """
+
+    return Patient.objects.aggregate(**{
+        status: Count("id", filter=status_filter) for status, status_filter in CASE_STATUS_FILTERS.items()
+    })
 
 
 def get_assigned_staff_id_by_patient_id(patient_id):
@@ -376,31 +423,20 @@ def dictfetchall(cursor):
     ]
 
 
-def get_distance_of_all_doctors_to_postal_code(postal_code):
-    doc_dict = []
-    # This wwon't work anymore (refactored to doctor permission en lieu of doctor group
-    all_doctors = User.objects.raw(
-        "SELECT * FROM `auth_user` INNER JOIN `auth_user_user_permissions` ON (`auth_user`.`id` = `auth_user_user_permissions`.`user_id`) INNER JOIN `auth_permission` ON (`auth_user_user_permissions`.`permission_id` = `auth_permission`.`id`) LEFT OUTER JOIN `accounts_profile` ON (`auth_user`.`id` = `accounts_profile`.`user_id`) JOIN `postal_codes` ON (`accounts_profile`.`postal_code` = `postal_codes`.POSTAL_CODE) WHERE `auth_permission`.`codename` = %s",
-        ['is_doctor'])
-
-    c = connection.cursor()
-    c.execute('SELECT * FROM postal_codes WHERE POSTAL_CODE = %s', [postal_code])
-    r = dictfetchall(c)
-    patient_postal_code_lat_long = (float(r[0]['LATITUDE']), float(r[0]['LONGITUDE']))
+def get_distance_of_all_doctors_to_postal_code(postal_code, count=None):
+    """
+    Gets the doctors nearest to a postal code, skipping doctors whose postal code is unknown
+    @param postal_code: the patient's postal code
+    @param count: maximum number of doctors to return, or None for all of them
+    @return: list of (doctor, distance in meters, number of assigned patients) tuples, from the closest doctor
+    """
 
-    for docs in all_doctors:
-        doctor_postal_code_lat_long = (float(docs.LATITUDE), float(docs.LONGITUDE))
-        distance_patient_to_doctor = distance.distance(patient_postal_code_lat_long, doctor_postal_code_lat_long).m
-        doctor_number_of_patients = docs.staff.assigned_patients.count()
-        doc_dict.append((docs, int(distance_patient_to_doctor), doctor_number_of_patients))
-    sorted_doc_dict = sorted(doc_dict, key=lambda tup: tup[1])
-    return sorted_doc_dict
+    return get_nearest_doctors(postal_code, count)
 
 
 def return_closest_with_least_patients_doctor(postal_code):
-    docs_list = get_distance_of_all_doctors_to_postal_code(postal_code)
-    sliced_list = docs_list[0:4]
-    sorted_sliced_doc_list = sorted(sliced_list, key=lambda tup: tup[2])
+    docs_list = get_distance_of_all_doctors_to_postal_code(postal_code, 4)
+    sorted_sliced_doc_list = sorted(docs_list, key=lambda tup: tup[2])
     closest_with_least_patients = sorted_sliced_doc_list[0]
     return closest_with_least_patients[0]
 
@@ -455,6 +491,24 @@ def get_profile_permissions():
     return Permission.objects.filter(codename__in=get_profile_permission_codenames())
 
 
+def annotate_group_types(groups):
+    """
+    Annotates each group of a queryset with the same type as get_group_type, computed by the database
+    @param groups: queryset of groups
+    @return: the queryset with a group_type annotation
+    """
+
+    def has_permission_in(codenames):
+        return Exists(Permission.objects.filter(group=OuterRef("pk"), codename__in=codenames))
+
+    return groups.annotate(group_type=Case(
+        When(has_permission_in(get_patient_permission_codenames()), then=Value("Patient")),
+        When(has_permission_in(get_staff_permission_codenames()), then=Value("Staff")),
+        default=Value("Any"),
+        output_field=CharField(),
+    ))
+
+
 def get_group_type(group):
     group_perms = group.permissions.values_list("codename", flat=True)
 
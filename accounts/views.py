@@ -1,6 +1,8 @@
 import datetime
 import json
 
+import numpy as np
+
 from django.contrib import messages
 from django.contrib.auth import logout, login
 from django.contrib.auth.decorators import login_required
@@ -9,36 +11,55 @@ from django.contrib.auth.models import Group, Permission
 from django.contrib.auth.tokens import default_token_generator
 from django.contrib.auth.views import PasswordResetConfirmView, PasswordChangeView, LoginView
 from django.core.exceptions import MultipleObjectsReturned, PermissionDenied
-from django.db.models import Q
-from django.http import JsonResponse, HttpResponse, HttpResponseRedirect
+from django.db.models import OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.http import JsonResponse, HttpResponse, HttpResponseRedirect, Http404
 from django.shortcuts import render, redirect
 from django.urls import reverse_lazy, reverse
 from django.utils.decorators import method_decorator
-from django.views.decorators.cache import never_cache
+from django.views.decorators.cache import cache_control, never_cache
 from django.views.decorators.csrf import csrf_protect
 from django.views.decorators.debug import sensitive_post_parameters
+from django.views.decorators.http import etag, require_POST
 
 from Covigo.messages import Messages
 from Covigo.settings import HOST_NAME
+from Covigo.tables import table_response
+from accounts.authorization import get_authorization_context
+from accounts.case_history import record_case_events
 from accounts.forms import *
 from accounts.models import Flag, Staff, Patient, Code
+from accounts.postal_codes import get_postal_code_index, haversine_distances
 from accounts.preferences import SystemMessagesPreference, StatusReminderPreference
+from accounts.qr_codes import get_cached_qr_code, get_or_render_qr_code, get_qr_code_key
+from accounts.quarantine import (
+    QUARANTINE_VIOLATION_DAYS,
+    get_distances_from_home,
+    get_home_postal_codes,
+    get_violating_pings,
+    get_violation_counts,
+    get_violation_summary,
+    parse_location_pings,
+    record_quarantine_violations,
+)
 from accounts.utils import (
+    annotate_group_types,
     convert_dict_of_bools_to_list,
-    dictfetchall,
     get_allowable_patient_permissions,
     get_allowable_staff_permissions,
     get_flag,
-    get_or_generate_patient_profile_qr,
+    get_patient_profile_qr_url,
     get_profile_permissions,
     get_user_from_uidb64,
     return_closest_with_least_patients_doctor,
     send_system_message_to_user, get_group_type,
 )
 from appointments.models import Appointment
-from geopy import distance
 from symptoms.utils import is_symptom_editing_allowed
 
+# Seconds for which browsers may cache a patient's qr code image
+QR_CODE_MAX_AGE = 365 * 24 * 60 * 60
+
 
 class GroupErrors:
     def __init__(self):
@@ -334,24 +355,13 @@ def profile(request, user_id):
 
     usr_is_doctor = not user.is_superuser and user.has_perm("accounts.is_doctor")
 
-    perms_edit_user = (
-        False if user == request.user and not request.user.has_perm("accounts.edit_self") else
-        user == request.user and request.user.has_perm("accounts.edit_self")
-        or request.user.has_perm("accounts.edit_user")
-        or request.user.has_perm("accounts.edit_patient") and not user.is_staff
-        or request.user.has_perm("accounts.edit_assigned") and user in request.user.staff.get_assigned_patient_users()
-    )
-
-    perms_view_appointments = (
-            user == request.user
-            or request.user.has_perm("accounts.view_user_appointment")
-            or request.user.has_perm("accounts.view_patient_appointment") and not user.is_staff
-            or request.user.has_perm("accounts.is_doctor") and user in request.user.staff.get_assigned_patient_users()
-    )
+    authorization = get_authorization_context(request)
+    perms_edit_user = authorization.can_edit(user)
+    perms_view_appointments = authorization.can_view_appointments(user)
 
     # If profile belongs to a patient
     if not user.is_staff:
-        qr = get_or_generate_patient_profile_qr(user_id)
+        qr = get_patient_profile_qr_url(user_id)
         assigned_staff = user.patient.get_assigned_staff_user()
 
         appointments = Appointment.objects.filter(patient=user).filter(all_filter).order_by("start_date")
@@ -373,65 +383,20 @@ def profile(request, user_id):
         is_flagged = False if not request.user.is_staff else flag and flag.is_active
         qr_link = f"{HOST_NAME}{reverse('accounts:profile_from_code', args=[user.patient.code])}"
 
-        perms_flag = (
-            False if not request.user.is_staff else
-            request.user.has_perm("accounts.flag_patients") and not user.is_staff
-            or request.user.has_perm(
-                "accounts.flag_assigned") and user in request.user.staff.get_assigned_patient_users()
-        )
-
-        perms_code = (
-                user == request.user and request.user.has_perm("accounts.view_own_code")
-                or request.user.has_perm("accounts.view_patient_code")
-                or (
-                        request.user.has_perm("accounts.view_assigned_code")
-                        and user in request.user.staff.get_assigned_patient_users()
-                )
-        )
-
-        perms_test_report = (
-                user == request.user
-                or request.user.has_perm("accounts.view_patient_test_report")
-                or (
-                        request.user.has_perm("accounts.view_assigned_test_report")
-                        and user in request.user.staff.get_assigned_patient_users()
-                )
-        )
-
-        perms_assigned_doctor = (
-                user == request.user
-                or request.user.has_perm("accounts.view_assigned_doctor")
-                or user in request.user.staff.get_assigned_patient_users()
-        )
-
+        perms_flag = authorization.can_flag(user)
+        perms_code = authorization.can_view_code(user)
+        perms_test_report = authorization.can_view_test_report(user)
+        perms_assigned_doctor = authorization.can_view_assigned_doctor(user)
         perms_message_doctor = (
-                not user.is_staff and request.user != user.patient.get_assigned_staff_user() and (
-                request.user.has_perm("accounts.message_doctor")
-                or request.user.has_perm("accounts.message_user")
-        )
-        )
-
-        perms_assign_symptoms = (
-                not user.is_staff and (
-                request.user.has_perm("accounts.assign_symptom_patient")
-                or request.user.has_perm(
-            "accounts.assign_symptom_assigned") and user in request.user.staff.get_assigned_patient_users()
-        )
+                request.user != assigned_staff
+                and authorization.has_any_perm("accounts.message_doctor", "accounts.message_user")
         )
+        perms_assign_symptoms = authorization.can_assign_symptoms(user)
+        perms_edit_case = authorization.can_edit_case(user)
 
-        perms_edit_case = (
-                not user.is_staff and (
-                request.user.has_perm("accounts.set_patient_case")
-                or request.user.has_perm("accounts.set_patient_quarantine")
-                or (
-                        request.user.has_perm("accounts.is_doctor")
-                        and user in request.user.staff.get_assigned_patient_users()
-                        and (
-                                request.user.has_perm("accounts.set_assigned_case")
-                                or request.user.has_perm("accounts.set_assigned_quarantine")
-                        )
-                )
-        )
+        # Only the staff are shown whether the patient kept to their quarantine
+        violation_summary = (
+            get_violation_summary(QUARANTINE_VIOLATION_DAYS, [user.id]) if request.user.is_staff else None
         )
 
         return render(request, 'accounts/profile/profile.html', {
@@ -448,6 +413,8 @@ def profile(request, user_id):
             "show_left_side": True,
             "is_flagged": is_flagged,
             "qr_link": qr_link,
+            "violation_summary": violation_summary,
+            "violation_days": QUARANTINE_VIOLATION_DAYS,
 
             "perms_edit_user": perms_edit_user,
             "perms_view_appointments": perms_view_appointments,
@@ -468,13 +435,18 @@ def profile(request, user_id):
         else:
             appointments = []
             appointments_truncated = []
-        assigned_patients = [] if user.is_superuser else user.staff.get_assigned_patient_users()
+        assigned_patients = [] if user.is_superuser else list(user.staff.get_assigned_patient_users())
         issued_flags = Flag.objects.filter(staff=user, is_active=True)
 
-        perms_assigned_patients = (
-                user == request.user
-                or request.user.has_perm("accounts.view_assigned_patients")
-        )
+        perms_assigned_patients = authorization.can_view_assigned_patients(user)
+
+        # The violations of every assigned patient are counted in a single query
+        if usr_is_doctor and perms_assigned_patients and assigned_patients:
+            violation_counts = get_violation_counts(
+                QUARANTINE_VIOLATION_DAYS, [patient_user.id for patient_user in assigned_patients]
+            )
+            for patient_user in assigned_patients:
+                patient_user.violation_count = violation_counts.get(patient_user.id, 0)
 
         show_left_side = (
                 usr_is_doctor and perms_assigned_patients
@@ -489,6 +461,7 @@ def profile(request, user_id):
             "issued_flags": issued_flags,
             "full_view": True,
             "show_left_side": show_left_side,
+            "violation_days": QUARANTINE_VIOLATION_DAYS,
 
             "usr_is_doctor": usr_is_doctor,
             "perms_edit_user": perms_edit_user,
@@ -501,10 +474,32 @@ def profile(request, user_id):
 def profile_from_code(request, code):
     patient = Patient.objects.get(code=code)
     user = User.objects.get(patient=patient)
-    image = get_or_generate_patient_profile_qr(user.id)
+    image = get_patient_profile_qr_url(user.id)
     return render(request, 'accounts/profile/profile.html', {"qr": image, "usr": user, "full_view": False})
 
 
+@cache_control(public=True, max_age=QR_CODE_MAX_AGE, immutable=True)
+@etag(lambda request, code: get_qr_code_key(code))
+def patient_qr_code(request, code):
+    """
+    Serves the qr code image of a patient, which is rendered on the first request and cached on disk and in memory.
+    The image of a code never changes, so browsers may keep it for as long as they want.
+    @param request: http request from the client
+    @param code: the patient's code
+    @return: the png image of the qr code
+    """
+
+    image = get_cached_qr_code(code)
+
+    # A cached image was rendered for an existing patient, so only new images need their code to be checked
+    if image is None:
+        if not Patient.objects.filter(code=code).exists():
+            raise Http404
+        image = get_or_render_qr_code(code)
+
+    return HttpResponse(image, content_type="image/png")
+
+
 @login_required
 @never_cache
 def list_users(request):
@@ -516,7 +511,9 @@ def list_users(request):
             or user.has_perm("accounts.view_flagged_user_list")):
         raise PermissionDenied
 
-    return render(request, 'accounts/list_users.html', )
+    return render(request, 'accounts/list_users.html', {
+        "groups": Group.objects.order_by("name").values_list("name", flat=True),
+    })
 
 
 @login_required
@@ -539,23 +536,28 @@ def list_users_table(request):
     else:
         raise PermissionDenied
 
-    users_table = []
-    for usr in users:
-        group = usr.groups.first()
-        group = str(group) if group else ""
-        users_table.append({
-            "id": usr.id,
-            "username": usr.username,
-            "fname": usr.first_name,
-            "lname": usr.last_name,
-            "email": usr.email,
-            "phone_number": usr.profile.phone_number,
-            "groups": group
-        })
-
-    serialized_users = json.dumps({'data': users_table}, indent=4)
+    # Same group as usr.groups.first(), but computed by the database for every row of the page at once
+    first_group_name = Group.objects.filter(user=OuterRef("pk")).order_by("id").values("name")[:1]
+    users = users.annotate(
+        phone_number=Coalesce("profile__phone_number", Value("")),
+        group_name=Coalesce(Subquery(first_group_name), Value("")),
+    )
 
-    return HttpResponse(serialized_users, content_type='application/json')
+    return table_response(
+        request,
+        users,
+        columns={
+            "id": "id",
+            "username": "username",
+            "fname": "first_name",
+            "lname": "last_name",
+            "email": "email",
+            "phone_number": "phone_number",
+            "groups": "group_name",
+        },
+        search_columns=["username", "fname", "lname", "email", "phone_number", "groups"],
+        default_order=["username"],
+    )
 
 
 @login_required
@@ -660,13 +662,7 @@ def create_user(request):
 def edit_user(request, user_id):
     user = User.objects.get(id=user_id)
 
-    can_view_page = (
-        False if user == request.user and not request.user.has_perm("accounts.edit_self") else
-        user == request.user and request.user.has_perm("accounts.edit_self")
-        or request.user.has_perm("accounts.edit_user")
-        or request.user.has_perm("accounts.edit_patient") and not user.is_staff
-        or request.user.has_perm("accounts.edit_assigned") and user in request.user.staff.get_assigned_patient_users()
-    )
+    can_view_page = get_authorization_context(request).can_edit(user)
 
     if not can_view_page:
         raise PermissionDenied
@@ -823,17 +819,17 @@ def list_groups_table(request):
     if not request.user.has_perm("accounts.manage_groups"):
         raise PermissionDenied
 
-    groups_table = []
-    for grp in Group.objects.all():
-        groups_table.append({
-            "id": grp.id,
-            "name": grp.name,
-            "type": get_group_type(grp)
-        })
-
-    serialized_groups = json.dumps({'data': groups_table}, indent=4)
-
-    return HttpResponse(serialized_groups, content_type='application/json')
+    return table_response(
+        request,
+        annotate_group_types(Group.objects.all()),
+        columns={
+            "id": "id",
+            "name": "name",
+            "type": "group_type",
+        },
+        search_columns=["name", "type"],
+        default_order=["name"],
+    )
 
 
 @login_required
@@ -1046,6 +1042,7 @@ def edit_case(request, user_id):
             patient.is_quarantining = is_quarantining
 
             patient.save()
+            record_case_events([patient])
             messages.success(
                 request,
                 "This patient's case data was edited successfully."
@@ -1082,20 +1079,50 @@ def verify_quarantine_compliance(request, postal_code, current_lat, current_long
     @return: HttpResponse containing the computed distance
     """
 
-    c = connection.cursor()
-    c.execute('SELECT * from postal_codes where POSTAL_CODE = %s', [postal_code])
-    r = dictfetchall(c)
-    patient_postal_code_lat_long = (float(r[0]['LATITUDE']), float(r[0]['LONGITUDE']))
-    distance_patient_to_doctor = distance.distance(patient_postal_code_lat_long, (current_lat, current_long)).m
-    if distance_patient_to_doctor > 1000:
-        array = []
-        if request.user.profile.violation is not None:
-            array = list(json.loads(request.user.profile.violation))
-        array.append({
-            'type': 'quarantine non-compliance',
-            'date-time': datetime.datetime.now()
-        })
-        request.user.profile.violation = json.dumps(array, indent=4, sort_keys=True, default=str)
-        request.user.profile.save()
+    patient_postal_code_lat_long = get_postal_code_index().get(postal_code)
+    if patient_postal_code_lat_long is None:
+        raise Http404
+
+    try:
+        current_lat_long = float(current_lat), float(current_long)
+    except ValueError:
+        raise Http404
 
-    return HttpResponse(distance_patient_to_doctor)
+    distance_patient_to_home = float(haversine_distances(*patient_postal_code_lat_long, *current_lat_long))
+    if get_violating_pings(distance_patient_to_home):
+        record_quarantine_violations([(request.user.id, datetime.datetime.now(), distance_patient_to_home)])
+
+    return HttpResponse(distance_patient_to_home)
+
+
+@login_required
+@require_POST
+def record_location_pings(request):
+    """
+    Records a batch of location pings, of the logged-in user or of the patients whose quarantine they manage, and
+    saves the pings that are too far from their user's home as quarantine violations
+    @param request: Request object of the user, with the JSON body described in parse_location_pings
+    @return: JsonResponse with the distance from home of each ping, which is null when the home is unknown, and the
+    number of violations recorded
+    """
+
+    try:
+        user_ids, latitudes, longitudes, timestamps = parse_location_pings(json.loads(request.body), request.user.id)
+    except ValueError as error:
+        return JsonResponse({"error": str(error)}, status=400)
+
+    authorization = get_authorization_context(request)
+    if not all(authorization.can_submit_location(user_id) for user_id in set(user_ids)):
+        raise PermissionDenied
+
+    distances = get_distances_from_home(user_ids, latitudes, longitudes, get_home_postal_codes(user_ids))
+    violating = get_violating_pings(distances)
+
+    violation_count = record_quarantine_violations(
+        (user_ids[i], timestamps[i], float(distances[i])) for i in np.flatnonzero(violating)
+    )
+
+    return JsonResponse({
+        "distances": [None if np.isnan(distance) else round(float(distance)) for distance in distances],
+        "violations": violation_count,
+    })
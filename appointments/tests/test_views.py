@@ -70,7 +70,7 @@ class AppointmentsTestCase(TransactionTestCase):
         self.assertTrue(Appointment.objects.filter(staff_id=self.doctor1.id).count() == 3)
 
         self.response = self.client.get(reverse('appointments:current_appointments_table', kwargs={'mode': 'Book'}))
-        loaded_response = json.loads(self.response.content)
+        loaded_response = json.loads(self.response.getvalue())
         self.assertEqual(str(self.mocked_appointment_data1.start_date.time())[:5], loaded_response['data'][0]['start'])
         self.assertEqual(str(self.mocked_appointment_data1.start_date.date()), loaded_response['data'][0]['date'])
         self.assertEqual(str(self.mocked_appointment_data1.end_date.time())[:5], loaded_response['data'][0]['end'])
@@ -78,7 +78,7 @@ class AppointmentsTestCase(TransactionTestCase):
 
         self.client.post(reverse('appointments:book_appointments'), {'book_appt': [self.mocked_appointment_data1.id]})
         self.response = self.client.get(reverse('appointments:current_appointments_table', kwargs={'mode': 'Book'}))
-        loaded_response = json.loads(self.response.content)
+        loaded_response = json.loads(self.response.getvalue())
 
         # here, we expect the user patient's id to be added to the patient_id column
         # of this specific appointment to signal that it was indeed properly booked by this
@@ -114,7 +114,7 @@ class AppointmentsTestCase(TransactionTestCase):
         # currently assigned doctor) in the template/page context
         self.assertTrue(Appointment.objects.get(id=2).patient_id == self.patient_user.id)
         self.assertTrue(Appointment.objects.get(id=3).patient_id == self.patient_user.id)
-        self.assertEqual(0, len(json.loads(self.response.content)['data']))
+        self.assertEqual(0, len(json.loads(self.response.getvalue())['data']))
 
     def test_user_can_cancel_appointments(self):
         """
@@ -159,7 +159,7 @@ class AppointmentsTestCase(TransactionTestCase):
         # currently assigned doctor) in the template/page context
         self.assertTrue(Appointment.objects.get(id=2).patient_id is None)
         self.assertTrue(Appointment.objects.get(id=3).patient_id is None)
-        self.assertEqual(0, len(json.loads(self.response.content)['data']))
+        self.assertEqual(0, len(json.loads(self.response.getvalue())['data']))
 
     def test_doctor_can_delete_availabilities(self):
         """
@@ -185,7 +185,7 @@ class AppointmentsTestCase(TransactionTestCase):
         # availability using the "Delete Availability" button), thus, logically, there should be one less open
         # availability (2 remaining availabilities this currently assigned doctor has) in the template/page context
         self.assertTrue(Appointment.objects.filter(staff_id=self.doctor1.id).count() == 2)
-        self.assertEqual(2, len(json.loads(self.response.content)['data']))
+        self.assertEqual(2, len(json.loads(self.response.getvalue())['data']))
 
         delete_selected_availabilities = [self.mocked_appointment_data2.id, self.mocked_appointment_data3.id]
 
@@ -200,7 +200,7 @@ class AppointmentsTestCase(TransactionTestCase):
         # there should be no more open availability (0 remaining availabilities this currently
         # assigned doctor has) in the template/page context
         self.assertTrue(Appointment.objects.filter(staff_id=self.doctor1.id).count() == 0)
-        self.assertEqual(0, len(json.loads(self.response.content)['data']))
+        self.assertEqual(0, len(json.loads(self.response.getvalue())['data']))
 
     def test_appointments_rebooked_with_new_reassigned_doctor(self):
         """
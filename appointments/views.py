@@ -6,11 +6,14 @@ from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.core.exceptions import PermissionDenied
-from django.db.models import Q
+from django.db.models import Case, CharField, Q, Value, When
+from django.db.models.functions import Concat
 from django.http import HttpResponse, Http404
 from django.shortcuts import render, redirect
 from django.views.decorators.cache import never_cache
 
+from Covigo.tables import table_response
+from accounts.authorization import get_authorization_context
 from accounts.utils import get_users_names, get_is_staff
 from appointments.forms import AvailabilityForm
 from appointments.models import Appointment
@@ -18,7 +21,6 @@ from appointments.utils import (
     book_appointment,
     cancel_appointment,
     delete_availability,
-    format_appointments_start_end_times,
 )
 
 from datetime import datetime, timedelta
@@ -63,14 +65,7 @@ def index(request):
 def view_appointments(request, user_id):
     user = User.objects.get(id=user_id)
 
-    perms_view_appointments = (
-            user == request.user
-            or request.user.has_perm("accounts.view_user_appointment")
-            or request.user.has_perm("accounts.view_patient_appointment") and not user.is_staff
-            or request.user.has_perm("accounts.is_doctor") and user in request.user.staff.get_assigned_patient_users()
-    )
-
-    if not perms_view_appointments:
+    if not get_authorization_context(request).can_view_appointments(user):
         raise PermissionDenied
 
     return render(request, 'appointments/list_appointments.html', {
@@ -371,14 +366,7 @@ def current_appointments_table(request, mode=None, user_id=None):
 
     elif mode == "View":
         user = User.objects.get(id=user_id)
-        perms_view_appointments = (
-                user == request.user
-                or request.user.has_perm("accounts.view_user_appointment")
-                or request.user.has_perm("accounts.view_patient_appointment") and not user.is_staff
-                or request.user.has_perm("accounts.is_doctor") and user in request.user.staff.get_assigned_patient_users()
-        )
-
-        if not perms_view_appointments:
+        if not get_authorization_context(request).can_view_appointments(user):
             raise PermissionDenied
 
         if user.is_staff:
@@ -390,35 +378,50 @@ def current_appointments_table(request, mode=None, user_id=None):
     else:
         raise Http404
 
-    times = format_appointments_start_end_times(appointments)
-
-    appointments_table = []
-    for apt, appointment_time in zip(appointments, times):
-        if not mode == "View":
-            other_person = apt.patient if request.user.is_staff else apt.staff
-        else:
-            other_person = apt.patient if user.is_staff else apt.staff
+    if not mode == "View":
+        other_person = "patient" if request.user.is_staff else "staff"
+    else:
+        other_person = "patient" if user.is_staff else "staff"
+
+    appointments = appointments.annotate(with_name=Case(
+        When(**{f"{other_person}__isnull": True}, then=Value(None)),
+        When(**{f"{other_person}__is_staff": True}, then=Concat(Value("Dr. "), f"{other_person}__last_name")),
+        default=Concat(f"{other_person}__first_name", Value(" "), f"{other_person}__last_name"),
+        output_field=CharField(),
+    ))
+
+    min_date = request.GET.get("min_date")
+    if min_date:
+        appointments = appointments.filter(start_date__date__gte=min_date)
+
+    max_date = request.GET.get("max_date")
+    if max_date:
+        appointments = appointments.filter(start_date__date__lte=max_date)
+
+    return table_response(
+        request,
+        appointments,
+        columns={
+            "id": "id",
+            "day": "start_date__week_day",
+            "date": "start_date",
+            "start": "start_date__time",
+            "end": "end_date__time",
+            "with": "with_name",
+        },
+        search_columns=["with"],
+        default_order=["date"],
+        format_row=format_appointment_row,
+    )
 
-        if other_person:
-            if other_person.is_staff:
-                with_name = f"Dr. {other_person.last_name}"
-            else:
-                with_name = f"{other_person.first_name} {other_person.last_name}"
-        else:
-            with_name = None
-
-        appointments_table.append({
-            "id": apt.id,
-            "day": appointment_time["day"],
-            "date": appointment_time["date"],
-            "start": appointment_time["start"],
-            "end": appointment_time["end"],
-            "with": with_name,
-        })
 
-    serialized_appointments = json.dumps({'data': appointments_table}, indent=4)
+def format_appointment_row(row):
+    row["day"] = row["date"].strftime('%A')
+    row["date"] = row["date"].strftime("%Y-%m-%d")
+    row["start"] = row["start"].strftime("%H:%M")
+    row["end"] = row["end"].strftime("%H:%M")
 
-    return HttpResponse(serialized_appointments, content_type='application/json')
+    return row
 
 
 def mass_appointment_booking(request, appointment_ids):
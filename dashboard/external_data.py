@@ -0,0 +1,203 @@
+import datetime
+import json
+import os
+import tempfile
+import threading
+import time
+import urllib.request
+
+from django.conf import settings
+
+# Seconds after which the cached external case data is refreshed, while still being served until the refresh succeeds
+EXTERNAL_CASE_DATA_TTL = 60 * 60
+
+# Seconds a request to the source may take before it is abandoned
+EXTERNAL_CASE_DATA_TIMEOUT = 5
+
+# Number of consecutive failed refreshes after which the source is left alone, and for how many seconds
+CIRCUIT_BREAKER_FAILURES = 3
+CIRCUIT_BREAKER_COOLDOWN = 5 * 60
+
+
+class CircuitBreaker:
+    """
+    Stops calling a source that keeps failing for a while, so that an unavailable source is not waited on over and
+    over
+    """
+
+    def __init__(self, failures=CIRCUIT_BREAKER_FAILURES, cooldown=CIRCUIT_BREAKER_COOLDOWN):
+        self.max_failures = failures
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Checks whether the source may be called. Once the cooldown is over, calls are allowed again until one fails.
+        @return: True if the source may be called
+        """
+
+        with self._lock:
+            return self.opened_at is None or time.monotonic() - self.opened_at >= self.cooldown
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.max_failures:
+                self.opened_at = time.monotonic()
+
+
+circuit_breaker = CircuitBreaker()
+
+_cached_data = None
+_cached_data_version = None
+_refresh_lock = threading.Lock()
+
+
+def parse_opencovid_summary(content):
+    """
+    Reads the latest day of an opencovid.ca summary
+    @param content: the JSON content of the summary
+    @return: dict of the case numbers shown in the dashboard
+    @raise ValueError: if the content is not a summary
+    """
+
+    try:
+        data = json.loads(content)['summary'][-1]
+
+        return {
+            "date": data["date"],
+            "confirmed": data["cumulative_cases"],
+            "daily_confirmed": data["cases"],
+            "current_positives": data["active_cases"],
+            "daily_positives": data["active_cases_change"],
+            "recoveries": data["cumulative_recovered"],
+            "daily_recoveries": data["recovered"],
+            "deaths": data["cumulative_deaths"],
+            "daily_deaths": data["deaths"],
+            "vaccines": data["cumulative_avaccine"],
+            "daily_vaccines": data["avaccine"],
+            "fully_vaccinated": data["cumulative_cvaccine"],
+            "daily_fully_vaccinated": data["cvaccine"],
+        }
+    except (IndexError, KeyError, TypeError) as e:
+        raise ValueError(f"Unexpected summary: {e!r}")
+
+
+def fetch_external_case_data(source=None, timeout=EXTERNAL_CASE_DATA_TIMEOUT):
+    """
+    Fetches the external case data from its source
+    @param source: url of the source, which defaults to the EXTERNAL_CASE_DATA_SOURCE setting
+    @param timeout: seconds the request may take
+    @return: dict of the case numbers
+    @raise OSError: if the source can't be reached in time
+    @raise ValueError: if the source sent something else than a summary
+    """
+
+    with urllib.request.urlopen(source or settings.EXTERNAL_CASE_DATA_SOURCE, timeout=timeout) as response:
+        return parse_opencovid_summary(response.read().decode())
+
+
+def write_cached_external_case_data(data, fetched=None):
+    """
+    Saves the external case data to the cache file. The file is replaced at once, so it is never read half written.
+    @param data: dict of the case numbers
+    @param fetched: datetime the data was fetched at, which defaults to now
+    @return: void
+    """
+
+    file_name = settings.EXTERNAL_CASE_DATA_FILE
+    content = json.dumps({"fetched": (fetched or datetime.datetime.now()).isoformat(), "data": data})
+
+    fd, temporary_file_name = tempfile.mkstemp(dir=os.path.dirname(file_name) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as file:
+            file.write(content)
+        os.replace(temporary_file_name, file_name)
+    except BaseException:
+        os.remove(temporary_file_name)
+        raise
+
+
+def read_cached_external_case_data():
+    """
+    Reads the external case data from the cache file, which is only read again once it changed
+    @return: tuple of the dict of the case numbers and the datetime they were fetched at, which are both None if
+    nothing was cached yet
+    """
+
+    global _cached_data, _cached_data_version
+
+    try:
+        stat = os.stat(settings.EXTERNAL_CASE_DATA_FILE)
+    except FileNotFoundError:
+        return None, None
+
+    version = (str(settings.EXTERNAL_CASE_DATA_FILE), stat.st_mtime_ns, stat.st_size)
+    if version != _cached_data_version:
+        with open(settings.EXTERNAL_CASE_DATA_FILE) as file:
+            cached = json.load(file)
+        _cached_data = cached["data"], datetime.datetime.fromisoformat(cached["fetched"])
+        _cached_data_version = version
+
+    return _cached_data
+
+
+def refresh_external_case_data(current_date=None, **kwargs):
+    """
+    Fetches the external case data and caches it, unless the source failed too many times recently
+    @param current_date: datetime of the refresh, which defaults to now
+    @return: True if the data was refreshed
+    """
+
+    if not circuit_breaker.allow():
+        return False
+
+    try:
+        data = fetch_external_case_data()
+    except (OSError, ValueError):
+        circuit_breaker.record_failure()
+        return False
+
+    circuit_breaker.record_success()
+    write_cached_external_case_data(data, current_date)
+    return True
+
+
+def refresh_external_case_data_in_background():
+    """
+    Refreshes the external case data in a background thread, unless a refresh is already running
+    @return: the thread, or None if a refresh is already running
+    """
+
+    if not _refresh_lock.acquire(blocking=False):
+        return None
+
+    def refresh():
+        try:
+            refresh_external_case_data()
+        finally:
+            _refresh_lock.release()
+
+    thread = threading.Thread(target=refresh, daemon=True)
+    thread.start()
+    return thread
+
+
+def get_external_case_data():
+    """
+    Gets the cached external case data without waiting on the source. Data older than its TTL is still returned, while
+    it is refreshed in the background.
+    @return: dict of the case numbers, or None until they are fetched for the first time
+    """
+
+    data, fetched = read_cached_external_case_data()
+    if fetched is None or datetime.datetime.now() - fetched > datetime.timedelta(seconds=EXTERNAL_CASE_DATA_TTL):
+        refresh_external_case_data_in_background()
+    return data
@@ -0,0 +1,31 @@
+# Generated by Django 4.0.10 on 2026-10-17 17:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CaseSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(unique=True)),
+                ('confirmed', models.PositiveIntegerField()),
+                ('positive', models.PositiveIntegerField()),
+                ('recovered', models.PositiveIntegerField()),
+                ('negative', models.PositiveIntegerField()),
+                ('unconfirmed_negative', models.PositiveIntegerField()),
+                ('unconfirmed_untested', models.PositiveIntegerField()),
+                ('quarantining', models.PositiveIntegerField()),
+            ],
+            options={
+                'get_latest_by': 'timestamp',
+            },
+        ),
+    ]
@@ -1,3 +1,55 @@
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 
-# Create your models here.
+from accounts.models import Patient, Profile
+
+
+class CaseSnapshot(models.Model):
+    """
+    The number of patients of each case status at a point in time, as counted by accounts.utils.get_case_counts. A
+    snapshot is taken every hour by the cronjobs command, so that the current counts are read from the latest snapshot
+    instead of being counted over every patient.
+    """
+    timestamp = models.DateTimeField(unique=True)
+    confirmed = models.PositiveIntegerField()
+    positive = models.PositiveIntegerField()
+    recovered = models.PositiveIntegerField()
+    negative = models.PositiveIntegerField()
+    unconfirmed_negative = models.PositiveIntegerField()
+    unconfirmed_untested = models.PositiveIntegerField()
+    quarantining = models.PositiveIntegerField()
+
+    class Meta:
+        get_latest_by = "timestamp"
+
+    def __str__(self):
+        return f"case_snapshot_{self.timestamp}"
+
+
+@receiver(post_save, sender=Patient)
+def clear_case_heatmap_of_changed_patient(sender, instance, created, **kwargs):
+    # Imported here since the dashboard utils import the models of this module
+    from dashboard.utils import clear_case_heatmap
+
+    # The heatmap only depends on the case status, which a new patient may already have
+    if created or instance.get_case_status() != getattr(instance, "loaded_case_status", None):
+        clear_case_heatmap()
+
+
+@receiver(post_delete, sender=Patient)
+def clear_case_heatmap_of_deleted_patient(sender, **kwargs):
+    from dashboard.utils import clear_case_heatmap
+
+    clear_case_heatmap()
+
+
+@receiver(post_save, sender=Profile)
+def clear_case_heatmap_of_moved_patient(sender, instance, **kwargs):
+    from dashboard.utils import clear_case_heatmap
+
+    # Profiles are saved along with their user, e.g. on every login, so the heatmap is only cleared when the postal code
+    # changed
+    if instance.postal_code != getattr(instance, "loaded_postal_code", ""):
+        clear_case_heatmap()
+        instance.loaded_postal_code = instance.postal_code
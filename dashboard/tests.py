@@ -1,3 +1,586 @@
-from django.test import TestCase
+import datetime
+import json
+import os
+import tempfile
 
-# Create your tests here.
+from unittest import mock
+
+from django.contrib.auth.models import User, Permission
+from django.core.cache import cache
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from accounts.models import DataVersion, Patient, PatientCaseEvent, Staff
+from accounts.postal_codes import PostalCodeIndex
+from appointments.models import Appointment
+from dashboard.external_data import (
+    CircuitBreaker,
+    get_external_case_data,
+    read_cached_external_case_data,
+    refresh_external_case_data,
+)
+from dashboard.models import CaseSnapshot
+from dashboard.utils import (
+    CASE_DATA_FILES,
+    CASE_HEATMAP_VERSION,
+    append_case_data,
+    build_case_heatmap,
+    clear_case_series,
+    get_case_series,
+    get_case_heatmap,
+    get_latest_case_snapshot,
+    rebuild_case_data,
+    take_case_snapshot,
+)
+from dashboard.views import (
+    fetch_appointments_info,
+    fetch_current_case_counts,
+    fetch_data_from_all_files,
+    fetch_messaging_info,
+    fetch_status_updates_info,
+)
+from messaging.models import MessageGroup
+from symptoms.models import PatientSymptom, Symptom
+
+POSTAL_CODE_INDEX = PostalCodeIndex(
+    ["H3G 1M8", "H3G 2A1", "G1R 4P5"],
+    [45.49, 45.51, 46.81],
+    [-73.57, -73.59, -71.21],
+)
+
+
+@mock.patch("dashboard.utils.get_postal_code_index", return_value=POSTAL_CODE_INDEX)
+class CaseHeatmapTests(TestCase):
+    def setUp(self):
+        # The versions of the heatmap start over with the database of each test, unlike the cache
+        cache.clear()
+
+        for i, (postal_code, is_confirmed, is_negative, is_quarantining) in enumerate([
+            ("h3g 1m8", True, False, True),
+            ("H3G 2A1", True, True, False),
+            ("H3G 9Z9", False, False, True),
+            ("G1R 4P5", True, False, False),
+            ("Z9Z 9Z9", True, False, False),
+            ("", False, False, False),
+        ]):
+            user = User.objects.create(username=f"patient{i}")
+            user.profile.postal_code = postal_code
+            user.profile.save()
+            Patient.objects.create(
+                user=user, is_confirmed=is_confirmed, is_negative=is_negative, is_quarantining=is_quarantining
+            )
+
+    def test_build_case_heatmap(self, *mocks):
+        """
+        Test that the patients are counted by forward sortation area, at the center of their area
+        @return: void
+        """
+
+        with self.assertNumQueries(1):
+            heatmap = build_case_heatmap()
+
+        self.assertEqual(2, heatmap["unlocated"])
+        self.assertEqual(["G1R", "H3G"], [area["fsa"] for area in heatmap["areas"]])
+
+        montreal = heatmap["areas"][1]
+        self.assertEqual(
+            {"patients": 3, "positive": 1, "confirmed": 2, "quarantining": 2},
+            {key: montreal[key] for key in ["patients", "positive", "confirmed", "quarantining"]},
+        )
+        self.assertAlmostEqual(45.50, montreal["latitude"], places=4)
+        self.assertAlmostEqual(-73.58, montreal["longitude"], places=4)
+
+    def test_cache_is_cleared_when_a_patient_is_saved(self, *mocks):
+        """
+        Test that the heatmap is cached until a patient changes
+        @return: void
+        """
+
+        get_case_heatmap()
+        # Only the version of the heatmap is read
+        with self.assertNumQueries(1):
+            get_case_heatmap()
+
+        patient = Patient.objects.get(user__username="patient3")
+        patient.is_negative = True
+        with self.captureOnCommitCallbacks(execute=True):
+            patient.save()
+
+        self.assertEqual(0, get_case_heatmap()["areas"][0]["positive"])
+
+    def test_cache_is_kept_when_nothing_it_shows_changed(self, *mocks):
+        """
+        Test that saving a user or patient without changing their case status or postal code keeps the heatmap cached,
+        and that changing a postal code clears it
+        @return: void
+        """
+
+        get_case_heatmap()
+
+        user = User.objects.get(username="patient3")
+        user.last_login = datetime.datetime.now()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            user.save()
+            user.patient.save()
+        self.assertEqual([], callbacks)
+        with self.assertNumQueries(1):
+            get_case_heatmap()
+
+        user.profile.postal_code = "H3G 2A1"
+        with self.captureOnCommitCallbacks(execute=True):
+            user.profile.save()
+        self.assertEqual(["H3G"], [area["fsa"] for area in get_case_heatmap()["areas"]])
+
+    def test_cache_is_cleared_by_another_process(self, *mocks):
+        """
+        Test that the heatmap cached by a process is rebuilt once a patient was changed by another process, which only
+        shares the database with it
+        @return: void
+        """
+
+        get_case_heatmap()
+
+        # The cache of this process is left as it is, and the other process only changes the database
+        Patient.objects.filter(user__username="patient3").update(is_negative=True)
+        DataVersion.bump(CASE_HEATMAP_VERSION)
+
+        self.assertEqual(0, get_case_heatmap()["areas"][0]["positive"])
+
+    def test_cache_is_kept_when_a_change_is_rolled_back(self, *mocks):
+        """
+        Test that a patient change that is rolled back leaves the version of the heatmap as it was
+        @return: void
+        """
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                patient = Patient.objects.get(user__username="patient3")
+                patient.is_negative = True
+                patient.save()
+                transaction.set_rollback(True)
+
+        self.assertEqual([], callbacks)
+        self.assertEqual(0, DataVersion.get(CASE_HEATMAP_VERSION))
+
+    def test_case_heatmap_view(self, *mocks):
+        """
+        Test that only the staff who can see the case data get the heatmap
+        @return: void
+        """
+
+        staff = User.objects.create(username="staff", is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(403, self.client.get(reverse("dashboard:case_heatmap")).status_code)
+
+        staff.user_permissions.add(Permission.objects.get(codename="dashboard_covigo_data"))
+        response = self.client.get(reverse("dashboard:case_heatmap"))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(2, len(response.json()["areas"]))
+
+
+class CaseSnapshotTests(TestCase):
+    def test_take_case_snapshot(self):
+        """
+        Test that a snapshot of the case counts is saved once per time, and that the latest one is read back
+        @return: void
+        """
+
+        self.assertIsNone(get_latest_case_snapshot())
+
+        Patient.objects.create(user=User.objects.create(username="positive"), is_confirmed=True)
+        take_case_snapshot(current_date=datetime.datetime(2022, 4, 1, 10))
+        Patient.objects.create(user=User.objects.create(username="quarantining"), is_quarantining=True)
+        take_case_snapshot(current_date=datetime.datetime(2022, 4, 1, 11))
+        take_case_snapshot(current_date=datetime.datetime(2022, 4, 1, 11))
+
+        self.assertEqual(2, CaseSnapshot.objects.count())
+
+        snapshot = get_latest_case_snapshot()
+        self.assertEqual(datetime.datetime(2022, 4, 1, 11), snapshot.timestamp)
+        self.assertEqual((1, 1, 1), (snapshot.positive, snapshot.quarantining, snapshot.unconfirmed_untested))
+
+    def test_case_data_card_takes_its_counts_from_one_source(self):
+        """
+        Test that the dashboard shows the current counts of the latest snapshot along with their change since the
+        snapshot of the day before, and both from the case data files until a snapshot is taken
+        @return: void
+        """
+
+        case_data = {
+            "confirmed": {"dates": ["2022-03-31", "2022-04-01"], "numbers": [40, 41]},
+            "daily_confirmed": {"dates": ["2022-04-01"], "numbers": [1]},
+            "current_positives": None,
+        }
+
+        case_counts = fetch_current_case_counts(case_data)
+        self.assertEqual(("files", "2022-04-01"), (case_counts["source"], case_counts["date"]))
+        self.assertEqual((41, 1), (case_counts["current"]["confirmed"], case_counts["change"]["confirmed"]))
+        self.assertIsNone(case_counts["current"]["positive"])
+
+        card = render_to_string("dashboard/cards/covigo_data.html", {"case_counts": case_counts})
+        self.assertIn("(Covigo, daily files of 2022-04-01)", card)
+        self.assertIn('<td class="p-1 text-orange-500">41</td>', card)
+        self.assertIn('<td class="p-1 text-red-500">-</td>', card)
+
+        take_case_snapshot(current_date=datetime.datetime(2022, 4, 1, 9))
+        Patient.objects.create(user=User.objects.create(username="positive"), is_confirmed=True)
+        take_case_snapshot(current_date=datetime.datetime(2022, 4, 1, 12))
+
+        # There is no snapshot a day before the latest one yet
+        case_counts = fetch_current_case_counts(case_data)
+        self.assertEqual((1, None), (case_counts["current"]["confirmed"], case_counts["change"]["confirmed"]))
+
+        take_case_snapshot(current_date=datetime.datetime(2022, 4, 2, 10))
+        case_counts = fetch_current_case_counts(case_data)
+        self.assertEqual((1, 1), (case_counts["current"]["confirmed"], case_counts["change"]["confirmed"]))
+
+        card = render_to_string("dashboard/cards/covigo_data.html", {"case_counts": case_counts})
+        self.assertIn("(Covigo, snapshot of 2022-04-02 10:00)", card)
+        self.assertIn('<td class="p-1 text-orange-500">1</td>', card)
+
+class AppendCaseDataTests(TestCase):
+    def setUp(self):
+        self.data_path = tempfile.mkdtemp()
+        Patient.objects.create(user=User.objects.create(username="positive"), is_confirmed=True)
+
+    def tearDown(self):
+        for file_name in os.listdir(self.data_path):
+            os.remove(os.path.join(self.data_path, file_name))
+        os.rmdir(self.data_path)
+        os.remove(f"{self.data_path}.lock")
+
+    def read_file(self, file_name):
+        with open(os.path.join(self.data_path, file_name)) as file:
+            return file.read().splitlines()
+
+    def test_append_case_data(self):
+        """
+        Test that a row is appended to each case data file once a day, after the files' existing rows
+        @return: void
+        """
+
+        with open(os.path.join(self.data_path, "positive_cases.csv"), "w") as file:
+            file.write("Date,Time,Number\n2022-03-31,23:00:00,0\n")
+
+        self.assertFalse(append_case_data(datetime.datetime(2022, 4, 1, 10), self.data_path))
+        with self.assertNumQueries(1):
+            self.assertTrue(append_case_data(datetime.datetime(2022, 4, 1, 23), self.data_path))
+        with self.assertNumQueries(0):
+            self.assertFalse(append_case_data(datetime.datetime(2022, 4, 1, 23), self.data_path))
+
+        self.assertEqual(sorted(CASE_DATA_FILES), sorted(os.listdir(self.data_path)))
+        self.assertEqual(
+            ["Date,Time,Number", "2022-03-31,23:00:00,0", "2022-04-01,23:00:00,1"],
+            self.read_file("positive_cases.csv"),
+        )
+        self.assertEqual(["Date,Time,Number", "2022-04-01,23:00:00,1"], self.read_file("confirmed_cases.csv"))
+        self.assertEqual(["Date,Time,Number", "2022-04-01,23:00:00,0"], self.read_file("recovered_cases.csv"))
+
+        Patient.objects.create(user=User.objects.create(username="negative"), is_confirmed=True, is_negative=True)
+        append_case_data(datetime.datetime(2022, 4, 2, 23), self.data_path)
+
+        case_data = fetch_data_from_all_files(self.data_path)
+        self.assertEqual(["2022-03-31", "2022-04-01", "2022-04-02"], case_data["current_positives"]["dates"])
+        self.assertEqual(["2022-04-02"], case_data["daily_confirmed"]["dates"])
+        self.assertEqual([1], case_data["daily_confirmed"]["numbers"])
+
+    def test_append_case_data_completes_a_partial_day(self):
+        """
+        Test that a run that failed after appending to some of the files is completed without appending twice
+        @return: void
+        """
+
+        with open(os.path.join(self.data_path, "confirmed_cases.csv"), "w") as file:
+            file.write("Date,Time,Number\n2022-04-01,23:00:00,1\n")
+
+        self.assertTrue(append_case_data(datetime.datetime(2022, 4, 1, 23), self.data_path))
+        self.assertEqual(["Date,Time,Number", "2022-04-01,23:00:00,1"], self.read_file("confirmed_cases.csv"))
+        self.assertEqual(["Date,Time,Number", "2022-04-01,23:00:00,1"], self.read_file("positive_cases.csv"))
+
+    def test_append_case_data_backfills_the_previous_day(self):
+        """
+        Test that a day whose row failed to be appended is appended by the next day's runs, with the counts of its last
+        snapshot
+        @return: void
+        """
+
+        self.assertTrue(append_case_data(datetime.datetime(2022, 4, 1, 23), self.data_path))
+
+        # The run of 2022-04-02 at 23:00 failed after its snapshot was taken
+        take_case_snapshot(current_date=datetime.datetime(2022, 4, 2, 23))
+        Patient.objects.create(user=User.objects.create(username="negative"), is_confirmed=True, is_negative=True)
+
+        self.assertTrue(append_case_data(datetime.datetime(2022, 4, 3, 0), self.data_path))
+        self.assertFalse(append_case_data(datetime.datetime(2022, 4, 3, 1), self.data_path))
+        self.assertTrue(append_case_data(datetime.datetime(2022, 4, 3, 23), self.data_path))
+
+        self.assertEqual(
+            ["Date,Time,Number", "2022-04-01,23:00:00,1", "2022-04-02,23:00:00,1", "2022-04-03,23:00:00,2"],
+            self.read_file("confirmed_cases.csv"),
+        )
+
+        # New files are started with a whole day
+        os.remove(os.path.join(self.data_path, "negative_cases.csv"))
+        self.assertFalse(append_case_data(datetime.datetime(2022, 4, 4, 0), self.data_path))
+        self.assertFalse(os.path.exists(os.path.join(self.data_path, "negative_cases.csv")))
+
+    def test_rebuild_case_data(self):
+        """
+        Test that the rows of a date range are replaced by the counts rebuilt from the case events, except for the days
+        before the first event and the statuses that are not logged
+        @return: void
+        """
+
+        user = User.objects.get(username="positive")
+        PatientCaseEvent.objects.bulk_create([
+            PatientCaseEvent(patient=user, timestamp=datetime.datetime(2022, 4, 2, 9), is_confirmed=True,
+                             is_negative=False, is_quarantining=False),
+            PatientCaseEvent(patient=user, timestamp=datetime.datetime(2022, 4, 4, 9), is_confirmed=True,
+                             is_negative=True, is_quarantining=False),
+        ])
+        for file_name in ["positive_cases.csv", "unconfirmed_untested.csv"]:
+            with open(os.path.join(self.data_path, file_name), "w") as file:
+                file.write("Date,Time,Number\n2022-04-01,23:00:00,0\n2022-04-02,23:00:00,7\n2022-04-05,23:00:00,3\n")
+
+        self.assertEqual(
+            ["2022-04-02", "2022-04-03", "2022-04-04"],
+            rebuild_case_data(datetime.date(2022, 4, 1), datetime.date(2022, 4, 4), self.data_path),
+        )
+
+        self.assertEqual([
+            "Date,Time,Number",
+            "2022-04-01,23:00:00,0",
+            "2022-04-02,23:59:59,1",
+            "2022-04-03,23:59:59,1",
+            "2022-04-04,23:59:59,0",
+            "2022-04-05,23:00:00,3",
+        ], self.read_file("positive_cases.csv"))
+        self.assertEqual(
+            ["Date,Time,Number", "2022-04-02,23:59:59,0", "2022-04-03,23:59:59,0", "2022-04-04,23:59:59,1"],
+            self.read_file("recovered_cases.csv"),
+        )
+        self.assertEqual(3, len(self.read_file("unconfirmed_untested.csv")) - 1)
+        self.assertEqual([0, 1], fetch_data_from_all_files(self.data_path)["daily_recoveries"]["numbers"])
+
+        self.assertEqual([], rebuild_case_data(datetime.date(2022, 3, 1), datetime.date(2022, 3, 31), self.data_path))
+
+
+class CaseSeriesTests(TestCase):
+    def setUp(self):
+        clear_case_series()
+        self.addCleanup(clear_case_series)
+
+        file = tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False)
+        self.addCleanup(os.remove, file.name)
+        self.file_name = file.name
+
+        file.write("Date,Time,Number\n")
+        for day, number in enumerate([0, 1, 3, 3, 7, 8, 8, 9, 15, 16], start=1):
+            file.write(f"2022-04-{day:02d},23:00:00,{number}\n")
+        file.close()
+
+    def test_get_case_series(self):
+        """
+        Test that the daily numbers and their 7 day rolling average are computed from the cumulative numbers
+        @return: void
+        """
+
+        series = get_case_series(self.file_name)
+
+        self.assertEqual([0, 1, 3, 3, 7, 8, 8, 9, 15, 16], series["cumulative"]["numbers"])
+        self.assertEqual("2022-04-02", series["daily"]["dates"][0])
+        self.assertEqual([1, 2, 0, 4, 1, 0, 1, 6, 1], series["daily"]["numbers"])
+        self.assertEqual([1, 1.5, 1], list(series["rolling_average"][:3]))
+        self.assertAlmostEqual(13 / 7, series["rolling_average"][-1])
+
+    def test_get_case_series_is_read_again_when_the_file_changes(self):
+        """
+        Test that a file is only read again after it changed
+        @return: void
+        """
+
+        series = get_case_series(self.file_name)
+        with mock.patch("dashboard.utils.read_case_series") as read_case_series:
+            self.assertIs(series, get_case_series(self.file_name))
+            read_case_series.assert_not_called()
+
+        with open(self.file_name, "a") as file:
+            file.write("2022-04-11,23:00:00,20\n")
+
+        self.assertEqual(20, get_case_series(self.file_name)["cumulative"]["numbers"][-1])
+        self.assertIsNone(get_case_series(f"{self.file_name}.missing"))
+
+
+class ExternalCaseDataTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.source = os.path.join(directory.name, "summary.json")
+        self.cache_file = os.path.join(directory.name, "external_case_data.json")
+
+        summary = {
+            "date": "2022-04-01", "cumulative_cases": 900000, "cases": 3000, "active_cases": 40000,
+            "active_cases_change": -200, "cumulative_recovered": 850000, "recovered": 3200, "cumulative_deaths": 14500,
+            "deaths": 10, "cumulative_avaccine": 19000000, "avaccine": 20000, "cumulative_cvaccine": 7000000,
+            "cvaccine": 1000,
+        }
+        with open(self.source, "w") as file:
+            json.dump({"summary": [summary]}, file)
+
+        # The source is a local file, and the breaker starts closed
+        self.settings = override_settings(
+            EXTERNAL_CASE_DATA_SOURCE=f"file://{self.source}", EXTERNAL_CASE_DATA_FILE=self.cache_file
+        )
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+        breaker = mock.patch("dashboard.external_data.circuit_breaker", CircuitBreaker(failures=2, cooldown=60))
+        self.circuit_breaker = breaker.start()
+        self.addCleanup(breaker.stop)
+
+    def test_refresh_external_case_data(self):
+        """
+        Test that the external case data is fetched into the cache, and served from it
+        @return: void
+        """
+
+        self.assertEqual((None, None), read_cached_external_case_data())
+        self.assertTrue(refresh_external_case_data(current_date=datetime.datetime(2022, 4, 1, 10)))
+        os.remove(self.source)
+
+        data, fetched = read_cached_external_case_data()
+        self.assertEqual(datetime.datetime(2022, 4, 1, 10), fetched)
+        self.assertEqual({"date": "2022-04-01", "confirmed": 900000, "daily_positives": -200},
+                         {key: data[key] for key in ["date", "confirmed", "daily_positives"]})
+
+        # The stale data is served while it is refreshed in the background
+        with mock.patch("dashboard.external_data.refresh_external_case_data_in_background") as refresh:
+            self.assertEqual(data, get_external_case_data())
+            refresh.assert_called_once()
+
+    def test_circuit_breaker(self):
+        """
+        Test that a failing source is left alone after too many failures, and the cached data is kept
+        @return: void
+        """
+
+        refresh_external_case_data()
+        os.remove(self.source)
+
+        with mock.patch("dashboard.external_data.fetch_external_case_data", side_effect=OSError) as fetch:
+            self.assertFalse(refresh_external_case_data())
+            self.assertFalse(refresh_external_case_data())
+            self.assertFalse(refresh_external_case_data())
+            self.assertEqual(2, fetch.call_count)
+
+        self.assertFalse(self.circuit_breaker.allow())
+        self.assertEqual("2022-04-01", read_cached_external_case_data()[0]["date"])
+
+        with mock.patch("time.monotonic", return_value=self.circuit_breaker.opened_at + 61):
+            self.assertTrue(self.circuit_breaker.allow())
+
+
+class DashboardWidgetTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create(username="staff", is_staff=True)
+        self.patient = User.objects.create(username="patient")
+        other = User.objects.create(username="other")
+
+        for author, recipient, priority, author_seen, recipient_seen in [
+            (self.staff, self.patient, 2, True, False),
+            (self.patient, self.staff, 2, True, False),
+            (self.patient, self.staff, 1, True, True),
+            (self.staff, self.patient, 1, False, True),
+            (other, self.patient, 2, False, False),
+        ]:
+            MessageGroup.objects.create(author=author, recipient=recipient, title="Test", type=0, priority=priority,
+                                        author_seen=author_seen, recipient_seen=recipient_seen)
+
+        now = datetime.datetime.now()
+        tomorrow = datetime.datetime.combine(datetime.date.today() + datetime.timedelta(days=1), datetime.time(10))
+        for start_date, patient in [
+            (tomorrow + datetime.timedelta(days=3), self.patient),
+            (tomorrow, self.patient),
+            (tomorrow + datetime.timedelta(hours=2), self.patient),
+            (tomorrow, None),
+            (now - datetime.timedelta(hours=1), self.patient),
+        ]:
+            Appointment.objects.create(staff=self.staff, patient=patient, start_date=start_date,
+                                       end_date=start_date + datetime.timedelta(minutes=30))
+        self.tomorrow = tomorrow
+
+    def test_fetch_messaging_info(self):
+        """
+        Test that the conversations of each kind are counted in a single query
+        @return: void
+        """
+
+        with self.assertNumQueries(1):
+            messages = fetch_messaging_info(self.staff)
+
+        self.assertEqual(
+            {"all": 4, "urgent": 2, "unread": 2, "unread_urgent": 1},
+            {key: messages[key] for key in ["all", "urgent", "unread", "unread_urgent"]},
+        )
+
+        with self.assertNumQueries(1):
+            self.assertEqual(["patient", "patient", "staff", "staff"],
+                             sorted(message.author.username for message in messages["latest"]))
+
+    def test_fetch_appointments_info(self):
+        """
+        Test that the upcoming appointments are counted and the next one is found in a single query
+        @return: void
+        """
+
+        with self.assertNumQueries(1):
+            appointments = fetch_appointments_info(self.patient)
+
+        self.assertEqual(
+            {"all": 3, "today": 0, "tomorrow": 2, "next_start_date": self.tomorrow},
+            appointments,
+        )
+
+
+class StatusUpdatesTests(TestCase):
+    def setUp(self):
+        self.doctor = User.objects.create(username="doctor", is_staff=True)
+        staff = Staff.objects.create(user=self.doctor)
+        symptom = Symptom.objects.create(name="Cough")
+        today = datetime.datetime.combine(datetime.date.today(), datetime.time(10))
+
+        for i in range(3):
+            user = User.objects.create(username=f"patient{i}")
+            # The last patient is assigned to another doctor
+            Patient.objects.create(user=user, assigned_staff=staff if i < 2 else None)
+
+            for days, data, is_viewed, is_reviewed in [
+                (0, "Yes", False, False),
+                (0, "No", True, True),
+                (1, "No", True, True),
+                (1, None, False, False),
+            ]:
+                patient_symptom = PatientSymptom.objects.create(
+                    user=user, symptom=symptom, data=data, is_viewed=is_viewed, is_reviewed=is_reviewed
+                )
+                PatientSymptom.objects.filter(id=patient_symptom.id).update(
+                    date_updated=today - datetime.timedelta(days=days)
+                )
+
+    def test_fetch_status_updates_info(self):
+        """
+        Test that the reports of the assigned patients are counted by day in a single query
+        @return: void
+        """
+
+        doctor = User.objects.select_related("staff").get(id=self.doctor.id)
+        with self.assertNumQueries(1):
+            status_updates = fetch_status_updates_info(doctor)
+
+        first, second = User.objects.filter(username__in=["patient0", "patient1"]).order_by("id")
+        self.assertEqual(2, status_updates["unread_count"])
+        self.assertEqual(
+            [(first.id, 2, True), (first.id, 1, False), (second.id, 2, True), (second.id, 1, False)],
+            [(report["user_id"], report["total_entries"], report["unread"]) for report in status_updates["reports_list"]],
+        )
@@ -6,4 +6,5 @@ urlpatterns = [
     path('', views.index, name='index'),
     path('covigo_case_data/', views.covigo_case_data_graphs, name='covigo_case_data'),
     path('external_case_data/', views.external_case_data_graphs, name='external_case_data'),
+    path('case_heatmap/', views.case_heatmap, name='case_heatmap'),
 ]
@@ -1,24 +1,388 @@
 import csv
+import datetime
+import fcntl
+import os
+import tempfile
 
+import numpy as np
+
+from threading import Lock
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+from django.db.models.functions import Substr, Upper
+
+from accounts.case_history import build_case_series
+from accounts.models import DataVersion, Patient, PatientCaseEvent
+from accounts.postal_codes import get_postal_code_index
+from accounts.utils import CASE_STATUS_FILTERS, get_case_counts
+from dashboard.models import CaseSnapshot
+from manager.utils import CASE_DATA_PATH
+
+# Case status counted in each case data file
+CASE_DATA_FILES = {
+    "confirmed_cases.csv": "confirmed",
+    "negative_cases.csv": "negative",
+    "positive_cases.csv": "positive",
+    "recovered_cases.csv": "recovered",
+    "unconfirmed_negative.csv": "unconfirmed_negative",
+    "unconfirmed_untested.csv": "unconfirmed_untested",
+}
+
+CASE_DATA_HEADER = "Date,Time,Number\n"
+
+# Earliest hour the daily row is appended to the case data files, so that the row counts the whole day. The cronjobs
+# command runs hourly, so this is the only run of the day that appends it, and a row it failed to append is appended by
+# the next day's runs instead.
+CASE_DATA_HOUR = 23
+
+# Time of the rows rebuilt from the case events, whose counts are those at the end of the day
+REBUILT_CASE_DATA_TIME = "23:59:59"
+
+# Number of days averaged by the rolling average of the daily case numbers
+CASE_SERIES_ROLLING_DAYS = 7
+
+# Series of each case data file, keyed by path, along with the version of the file they were read from
+_case_series = {}
+_case_series_lock = Lock()
+
+# Period of the changes of the case counts shown next to the latest snapshot, which matches the daily rows of the case
+# data files
+CASE_SNAPSHOT_CHANGE_PERIOD = datetime.timedelta(days=1)
+
+CASE_HEATMAP_CACHE_KEY = "dashboard:case_heatmap"
+
+# Name of the DataVersion bumped whenever the case heatmap changes. The cache is local to each process, so the heatmap
+# is cached under its version rather than deleted from the cache of the process that changed a patient.
+CASE_HEATMAP_VERSION = "case_heatmap"
+
+# Seconds the case heatmap is cached for, in case patients were changed without their signals being sent (e.g. by a
+# bulk update)
+CASE_HEATMAP_CACHE_TIMEOUT = 10 * 60
+
+
+def read_case_series(file_name, date_header_name="Date", number_header_name="Number"):
+    """
+    Reads a case data file, along with the daily changes of its cumulative numbers and their rolling average
+    @param file_name: path of the csv file
+    @param date_header_name: name of the column of the dates
+    @param number_header_name: name of the column of the cumulative numbers
+    @return: dict with the numpy arrays of the "dates", "numbers", "daily_numbers" and "rolling_average", and the
+    "cumulative" and "daily" dicts of the dates and numbers lists shown in the dashboard
+    """
+
+    with open(file_name, "r", newline="") as file:
+        rows = [(row[date_header_name], row[number_header_name]) for row in csv.DictReader(file)]
+
+    dates = np.array([date for date, _ in rows], dtype=str)
+    numbers = np.array([int(number) for _, number in rows], dtype=np.int64)
+    daily_numbers = np.diff(numbers)
+
+    # Average of the last days, or of every day so far for the first ones
+    sums = np.concatenate([[0], np.cumsum(daily_numbers)])
+    ends = np.arange(1, len(daily_numbers) + 1)
+    starts = np.maximum(ends - CASE_SERIES_ROLLING_DAYS, 0)
+    rolling_average = (sums[ends] - sums[starts]) / (ends - starts)
+
+    return {
+        "dates": dates,
+        "numbers": numbers,
+        "daily_numbers": daily_numbers,
+        "rolling_average": rolling_average,
+        "cumulative": {"dates": dates.tolist(), "numbers": numbers.tolist()},
+        "daily": {
+            "dates": dates[1:].tolist(),
+            "numbers": daily_numbers.tolist(),
+            "rolling_average": np.round(rolling_average, 2).tolist(),
+        },
+    }
+
+
+def get_case_series(file_name):
+    """
+    Gets the series of a case data file, which is only read again once the file changed
+    @param file_name: path of the csv file
+    @return: the series, as returned by read_case_series, or None if the file does not exist. It is shared with the
+    other requests, so it must not be modified.
+    """
 
-def fetch_data_from_file(file_name, date_header_name="Date", number_header_name="Number"):
     try:
-        opened_file = open(file_name, "r")
-        reader = csv.DictReader(opened_file)
-        data = list(reader)
-        opened_file.close()
-        dates = list(map(lambda x: x[date_header_name], data))
-        numbers = list(map(lambda x: x[number_header_name], data))
+        stat = os.stat(file_name)
+    except FileNotFoundError:
+        return None
+
+    # The size changes with each appended row, even when the modification time does not
+    version = (stat.st_mtime_ns, stat.st_size)
+
+    with _case_series_lock:
+        cached = _case_series.get(file_name)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    series = read_case_series(file_name)
+    with _case_series_lock:
+        _case_series[file_name] = (version, series)
+    return series
 
-        return {"dates": dates, "numbers": numbers}
 
+def clear_case_series():
+    with _case_series_lock:
+        _case_series.clear()
+
+
+def read_last_line(file_name):
+    """
+    Reads the last line of a file without reading the rest of it
+    @param file_name: path of the file
+    @return: the last line, or an empty string if the file is empty or does not exist
+    """
+
+    try:
+        with open(file_name, "rb") as file:
+            file.seek(0, os.SEEK_END)
+            size = file.tell()
+
+            # Rows are short, so looking further back is only needed for a file that ends with a long line
+            position = size
+            tail = b""
+            while position > 0 and tail.rstrip(b"\n").count(b"\n") == 0:
+                position = max(0, position - 256)
+                file.seek(position)
+                tail = file.read(size - position)
     except FileNotFoundError:
-        # TODO: Handle no data yet existing.
-        pass
+        return ""
+
+    lines = tail.decode().splitlines()
+    return lines[-1] if lines else ""
+
+
+def append_line(file_name, line, header=""):
+    """
+    Appends a line to a file in a single write, so that readers never see part of it. The file is never rewritten.
+    @param file_name: path of the file, which is created with the header if it does not exist
+    @param line: the line to append, without its line break
+    @param header: first line of a new file, with its line break
+    @return: void
+    """
+
+    fd = os.open(file_name, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        content = f"{line}\n"
+        if os.fstat(fd).st_size == 0:
+            content = header + content
+        os.write(fd, content.encode())
+    finally:
+        os.close(fd)
+
+
+def append_case_data(current_date=None, data_path=CASE_DATA_PATH, **kwargs):
+    """
+    Appends the number of patients of each case status to the case data files, once a day. The runs before
+    CASE_DATA_HOUR append the previous day's row instead if it is missing, with the counts of the last snapshot of that
+    day, or the current counts if none was taken. A lock file keeps concurrent runs from appending the same day twice.
+    @param current_date: datetime the counts are appended for, which defaults to now
+    @param data_path: folder of the case data files
+    @return: True if the counts were appended, False if they already were
+    """
+
+    current_date = current_date or datetime.datetime.now()
+    backfill = current_date.hour < CASE_DATA_HOUR
+    date = (current_date.date() - datetime.timedelta(days=1) if backfill else current_date.date()).isoformat()
+
+    os.makedirs(data_path, exist_ok=True)
+
+    # The lock file is next to the folder, so that it is not listed with the case data files
+    with open(f"{os.path.normpath(data_path)}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        # A file that already has the day's row was appended to by a run that failed on a later file. The previous day
+        # is only appended after the rows of the days before it, so that new files start with a whole day.
+        file_names = [
+            file_name for file_name in (f"{data_path}/{file_name}" for file_name in CASE_DATA_FILES)
+            if _is_missing_case_data_row(read_last_line(file_name), date, backfill)
+        ]
+        if not file_names:
+            return False
+
+        counts, time = _get_case_data_counts(current_date, date, backfill)
+        for file_name in file_names:
+            status = CASE_DATA_FILES[os.path.basename(file_name)]
+            append_line(file_name, f"{date},{time},{counts[status]}", CASE_DATA_HEADER)
+
+    return True
+
+
+def _is_missing_case_data_row(last_line, date, backfill):
+    last_date = last_line.split(",")[0]
+    if backfill:
+        # The header, or a row from before the day
+        return last_date != "Date" and bool(last_date) and last_date < date
+    return last_date != date
+
+
+def _get_case_data_counts(current_date, date, backfill):
+    """
+    Counts the patients of each case status for the row of a day
+    @return: tuple of the counts of each status and the time they were counted at
+    """
+
+    if backfill:
+        snapshot = CaseSnapshot.objects.filter(timestamp__date=date).order_by("-timestamp").first()
+        if snapshot:
+            return {status: getattr(snapshot, status) for status in CASE_DATA_FILES.values()}, snapshot.timestamp.time()
+
+    return get_case_counts(), current_date.time()
+
+
+def rebuild_case_data(start_date, end_date, data_path=CASE_DATA_PATH):
+    """
+    Replaces the rows of a date range in the case data files with the counts at the end of each day, as rebuilt from
+    the case events, e.g. to restore the rows of days the cronjobs command missed. Only the files of the statuses the
+    events can be counted into are rebuilt, and the days before the first event are left as they are, since the status
+    of the patients was not logged yet. Each file is replaced at once, so that readers never see part of it.
+    @param start_date: first date to rebuild
+    @param end_date: last date to rebuild
+    @param data_path: folder of the case data files
+    @return: list of the rebuilt dates, as ISO strings
+    """
+
+    first_event = PatientCaseEvent.objects.order_by("timestamp").values_list("timestamp", flat=True).first()
+    if first_event is None or max(start_date, first_event.date()) > end_date:
+        return []
+
+    series = build_case_series(max(start_date, first_event.date()), end_date)
+    dates = [str(date) for date in series["dates"]]
+
+    os.makedirs(data_path, exist_ok=True)
+
+    with open(f"{os.path.normpath(data_path)}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        for file_name, status in CASE_DATA_FILES.items():
+            if status not in series:
+                continue
+            file_name = f"{data_path}/{file_name}"
+
+            rows = {date: f"{date},{REBUILT_CASE_DATA_TIME},{count}" for date, count in zip(dates, series[status])}
+            try:
+                with open(file_name, "r") as file:
+                    for line in file.read().splitlines()[1:]:
+                        rows.setdefault(line.split(",")[0], line)
+            except FileNotFoundError:
+                pass
+
+            # The temporary file is next to the folder, so that it is not listed with the case data files
+            fd, temporary_file_name = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(data_path)))
+            with os.fdopen(fd, "w") as file:
+                file.write(CASE_DATA_HEADER + "".join(f"{rows[date]}\n" for date in sorted(rows)))
+            os.chmod(temporary_file_name, 0o644)
+            os.replace(temporary_file_name, file_name)
+
+    return dates
+
+
+def get_case_counts_by_fsa():
+    """
+    Counts the patients of each case status by forward sortation area, which is the first three characters of their
+    postal code, in a single query
+    @return: list of dicts with the "fsa" and the number of "patients", "positive", "confirmed" and "quarantining"
+    patients of each area
+    """
+
+    return list(
+        Patient.objects.annotate(fsa=Upper(Substr("user__profile__postal_code", 1, 3)))
+        .values("fsa")
+        .annotate(
+            patients=Count("id"),
+            positive=Count("id", filter=Q(is_confirmed=True, is_negative=False)),
+            confirmed=Count("id", filter=Q(is_confirmed=True)),
+            quarantining=Count("id", filter=Q(is_quarantining=True)),
+        )
+        .order_by("fsa")
+    )
+
+
+def build_case_heatmap(postal_code_index=None):
+    """
+    Builds the case heatmap, which places the case counts of each forward sortation area at the center of the area
+    @param postal_code_index: index the centers of the areas are computed from, which defaults to the process' index
+    @return: dict with the list of "areas" and the number of "unlocated" patients, whose area is unknown
+    """
+
+    if postal_code_index is None:
+        postal_code_index = get_postal_code_index()
+
+    areas = []
+    unlocated = 0
+
+    for counts in get_case_counts_by_fsa():
+        centroid = postal_code_index.get_fsa_centroid(counts["fsa"]) if counts["fsa"] else None
+        if centroid is None:
+            unlocated += counts["patients"]
+            continue
+        areas.append({**counts, "latitude": centroid[0], "longitude": centroid[1]})
+
+    return {"areas": areas, "unlocated": unlocated}
+
+
+def get_case_heatmap():
+    """
+    Gets the case heatmap from the cache, or builds and caches it. The cached heatmap of every process is cleared
+    whenever the case status or the postal code of a patient changes.
+    @return: the case heatmap, as built by build_case_heatmap
+    """
+
+    key = f"{CASE_HEATMAP_CACHE_KEY}:{DataVersion.get(CASE_HEATMAP_VERSION)}"
+    heatmap = cache.get(key)
+    if heatmap is None:
+        heatmap = build_case_heatmap()
+        cache.set(key, heatmap, CASE_HEATMAP_CACHE_TIMEOUT)
+    return heatmap
+
+
+def clear_case_heatmap():
+    # Bumped once the change is committed, so that the version row isn't locked for the rest of the transaction and a
+    # rolled back change leaves the version as it was
+    transaction.on_commit(lambda: DataVersion.bump(CASE_HEATMAP_VERSION))
+
+
+def take_case_snapshot(current_date=None, **kwargs):
+    """
+    Saves the current number of patients of each case status. Taking the snapshot of the same time again replaces it,
+    so the command running this job can safely be rerun.
+    @param current_date: datetime of the snapshot, which defaults to now
+    @return: the CaseSnapshot
+    """
+
+    snapshot, _ = CaseSnapshot.objects.update_or_create(
+        timestamp=current_date or datetime.datetime.now(),
+        defaults=get_case_counts(),
+    )
+    return snapshot
+
+
+def get_latest_case_snapshot():
+    """
+    Gets the latest number of patients of each case status
+    @return: the latest CaseSnapshot, or None if no snapshot was taken yet
+    """
+
+    return CaseSnapshot.objects.order_by("-timestamp").first()
+
 
+def get_case_snapshot_changes(snapshot, period=CASE_SNAPSHOT_CHANGE_PERIOD):
+    """
+    Computes the change of the number of patients of each case status over a period before a snapshot, from the latest
+    snapshot taken at least that long before it
+    @param snapshot: the CaseSnapshot the changes lead to
+    @param period: timedelta of the period of the changes
+    @return: dict of the change of each count, keyed by status, or None if no snapshot was taken that long before
+    """
 
-def extract_daily_data(data):
-    dates = data["dates"]
-    cumulative_numbers = data["numbers"]
-    daily_numbers = list(map(lambda n1, n2: str(int(n2)-int(n1)), cumulative_numbers[:-1], cumulative_numbers[1:]))
-    return {"dates": dates[1:], "numbers": daily_numbers}
+    previous = (
+        CaseSnapshot.objects.filter(timestamp__lte=snapshot.timestamp - period).order_by("-timestamp").first()
+    )
+    if previous is None:
+        return None
+    return {status: getattr(snapshot, status) - getattr(previous, status) for status in CASE_STATUS_FILTERS}
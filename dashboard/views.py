@@ -1,17 +1,21 @@
 import datetime
-import json
-import urllib.request
 
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q
+from django.core.exceptions import PermissionDenied
+from django.db.models import Count, Min, Q
+from django.http import JsonResponse
 from django.shortcuts import render
 from django.views.decorators.cache import never_cache
 
 from appointments.models import Appointment
-from dashboard.utils import fetch_data_from_file, extract_daily_data
-from manager.views import CASE_DATA_PATH
+from dashboard.external_data import get_external_case_data
+from dashboard.utils import get_case_heatmap, get_case_series, get_case_snapshot_changes, get_latest_case_snapshot
+from manager.utils import CASE_DATA_PATH
 from messaging.models import MessageGroup
-from status.utils import return_symptoms_for_today, is_requested, get_reports_by_patient, get_report_unread_status
+from status.utils import return_symptoms_for_today, is_requested, get_report_summaries
+
+# Number of items of the lists shown in the dashboard widgets
+DASHBOARD_LIST_SIZE = 5
 
 
 @login_required
@@ -31,7 +35,9 @@ def index(request):
             status_updates = []
 
         covigo_case_data = fetch_data_from_all_files()
-        external_case_data = fetch_data_from_opencovid()
+        case_counts = fetch_current_case_counts(covigo_case_data)
+        # Served from the cache, which is refreshed in the background once it is stale
+        external_case_data = get_external_case_data()
 
         return render(request, 'dashboard/index.html', {
             "messages": messages,
@@ -39,6 +45,7 @@ def index(request):
             "status_updates": status_updates,
             "assigned_patients": assigned_patients,
             "covigo_case_data": covigo_case_data,
+            "case_counts": case_counts,
             "external_case_data": external_case_data
         })
 
@@ -68,26 +75,55 @@ def external_case_data_graphs(request):
     return render(request, 'dashboard/external_case_data.html')
 
 
+@login_required
+def case_heatmap(request):
+    """
+    Serves the number of patients of each case status in every forward sortation area, placed at the center of the area
+    @param request: http request from the client
+    @return: JsonResponse with the case heatmap
+    """
+
+    if not request.user.has_perm("accounts.dashboard_covigo_data"):
+        raise PermissionDenied
+
+    return JsonResponse(get_case_heatmap())
+
+
 def fetch_messaging_info(user):
+    """
+    Counts the conversations of a user shown in the dashboard, in a single query
+    @param user: the user
+    @return: dict of the number of "all", "urgent", "unread" and "unread_urgent" conversations, and a queryset of the
+    "latest" ones
+    """
+
     msg_group_filter = Q(type=0) & (Q(author=user) | Q(recipient=user))
     all_messages = MessageGroup.objects.filter(msg_group_filter)
 
-    urgent_msg_group_filter = msg_group_filter & Q(priority=2)
-    urgent = all_messages.filter(urgent_msg_group_filter)
+    urgent_filter = Q(priority=2)
+    unread_filter = (Q(author=user) & Q(author_seen=False)) | (Q(recipient=user) & Q(recipient_seen=False))
 
-    unread_msg_group_filter = Q(type=0) & ((Q(author=user) & Q(author_seen=False)) | (Q(recipient=user) & Q(recipient_seen=False)))
-    unread = all_messages.filter(unread_msg_group_filter)
-    unread_urgent = urgent.filter(unread_msg_group_filter)
+    counts = all_messages.aggregate(
+        all=Count("id"),
+        urgent=Count("id", filter=urgent_filter),
+        unread=Count("id", filter=unread_filter),
+        unread_urgent=Count("id", filter=unread_filter & urgent_filter),
+    )
 
     return {
-        "all": all_messages,
-        "urgent": urgent,
-        "unread": unread,
-        "unread_urgent": unread_urgent,
+        **counts,
+        # Only queried if the template shows them
+        "latest": all_messages.select_related("author", "recipient").order_by("-date_updated")[:DASHBOARD_LIST_SIZE],
     }
 
 
 def fetch_appointments_info(user):
+    """
+    Counts the upcoming appointments of a user shown in the dashboard, and finds the next one, in a single query
+    @param user: the user
+    @return: dict of the number of "all", "today" and "tomorrow" appointments, and the "next_start_date"
+    """
+
     now = datetime.datetime.now()
     today = datetime.date.today()
     tomorrow = today + datetime.timedelta(days=1)
@@ -98,47 +134,76 @@ def fetch_appointments_info(user):
     tomorrow_filter = Q(start_date__gte=tomorrow) & Q(start_date__lt=in_two_days)
 
     if user.is_staff:
-        all_appointments = Appointment.objects.filter(staff=user).filter(all_filter).order_by("start_date")
+        all_appointments = Appointment.objects.filter(staff=user).filter(all_filter)
     else:
         all_appointments = Appointment.objects.filter(patient=user).filter(all_filter)
 
-    today_appointments = all_appointments.filter(today_filter)
-    tomorrow_appointments = all_appointments.filter(tomorrow_filter)
-
-    return {
-        "all": all_appointments,
-        "today": today_appointments,
-        "tomorrow": tomorrow_appointments,
-    }
+    return all_appointments.aggregate(
+        all=Count("id"),
+        today=Count("id", filter=today_filter),
+        tomorrow=Count("id", filter=tomorrow_filter),
+        next_start_date=Min("start_date"),
+    )
 
 
 def fetch_data_from_all_files(data_path=CASE_DATA_PATH):
-    confirmed = fetch_data_from_file(f"{data_path}/confirmed_cases.csv")
-    daily_confirmed = extract_daily_data(confirmed)
-
-    current_positives = fetch_data_from_file(f"{data_path}/positive_cases.csv")
-    daily_positives = extract_daily_data(current_positives)
-
-    recoveries = fetch_data_from_file(f"{data_path}/recovered_cases.csv")
-    daily_recoveries = extract_daily_data(recoveries)
-
-    unconfirmed_negative = fetch_data_from_file(f"{data_path}/unconfirmed_negative.csv")
-    daily_unconfirmed_negative = extract_daily_data(unconfirmed_negative)
-
-    unconfirmed_untested = fetch_data_from_file(f"{data_path}/unconfirmed_untested.csv")
-    daily_unconfirmed_untested = extract_daily_data(unconfirmed_untested)
-
+    case_data = {}
+
+    for name, daily_name, file_name in [
+        ("confirmed", "daily_confirmed", "confirmed_cases.csv"),
+        ("current_positives", "daily_positives", "positive_cases.csv"),
+        ("recoveries", "daily_recoveries", "recovered_cases.csv"),
+        ("unconfirmed_negative", "daily_unconfirmed_negative", "unconfirmed_negative.csv"),
+        ("unconfirmed_untested", "daily_unconfirmed_untested", "unconfirmed_untested.csv"),
+    ]:
+        # The files are only read again when they changed
+        series = get_case_series(f"{data_path}/{file_name}")
+        case_data[name] = series and series["cumulative"]
+        case_data[daily_name] = series and series["daily"]
+
+    return case_data
+
+
+# Names of the series of fetch_data_from_all_files that the current case counts and their daily changes are read from,
+# keyed by the case status they count
+CASE_COUNT_SERIES = {
+    "confirmed": ("confirmed", "daily_confirmed"),
+    "positive": ("current_positives", "daily_positives"),
+    "recovered": ("recoveries", "daily_recoveries"),
+    "unconfirmed_negative": ("unconfirmed_negative", "daily_unconfirmed_negative"),
+    "unconfirmed_untested": ("unconfirmed_untested", "daily_unconfirmed_untested"),
+}
+
+
+def fetch_current_case_counts(case_data):
+    """
+    Gets the current number of patients of each case status and their change over the last day, both from the same
+    source. They are read from the latest hourly snapshot rather than counted over every patient, or from the last rows
+    of the case data files until the first snapshot is taken.
+    @param case_data: the case data files, as read by fetch_data_from_all_files
+    @return: dict with the "source" of the counts, either "snapshot" or "files", the datetime or date they were taken
+    at, and the "current" counts and their "change" keyed by status, which are None when unknown
+    """
+
+    snapshot = get_latest_case_snapshot()
+    if snapshot is not None:
+        changes = get_case_snapshot_changes(snapshot) or {}
+        return {
+            "source": "snapshot",
+            "date": snapshot.timestamp,
+            "current": {status: getattr(snapshot, status) for status in CASE_COUNT_SERIES},
+            "change": {status: changes.get(status) for status in CASE_COUNT_SERIES},
+        }
+
+    def last(series):
+        return series["numbers"][-1] if series and series["numbers"] else None
+
+    dates = (case_data.get("confirmed") or {}).get("dates")
     return {
-        "confirmed": confirmed,
-        "daily_confirmed": daily_confirmed,
-        "current_positives": current_positives,
-        "daily_positives": daily_positives,
-        "recoveries": recoveries,
-        "daily_recoveries": daily_recoveries,
-        "unconfirmed_negative": unconfirmed_negative,
-        "daily_unconfirmed_negative": daily_unconfirmed_negative,
-        "unconfirmed_untested": unconfirmed_untested,
-        "daily_unconfirmed_untested": daily_unconfirmed_untested,
+        "source": "files",
+        "date": dates[-1] if dates else None,
+        "current": {status: last(case_data.get(name)) for status, (name, _) in CASE_COUNT_SERIES.items()},
+        "change": {status: last(case_data.get(daily_name)) for status, (_, daily_name) in CASE_COUNT_SERIES.items()},
     }
 
 
@@ -153,20 +218,19 @@ def fetch_status_reminder_info(user):
 
 
 def fetch_status_updates_info(user):
-    reports_list = []
-    unread_count = 0
+    """
+    Gets the status reports of the patients assigned to a doctor, and how many are unread, in a single query
+    @param user: the doctor user
+    @return: dict of the "reports_list" and the "unread_count"
+    """
 
-    for patient in user.staff.get_assigned_patient_users():
-        report_set = get_reports_by_patient(patient.id)
-
-        for report in report_set:
-            if get_report_unread_status(report):
-                unread_count += 1
-        reports_list.append(report_set)
+    reports_list = list(get_report_summaries(user.staff.get_assigned_patient_users().values("id")))
+    for report in reports_list:
+        report["unread"] = report["unread_entries"] > 0
 
     return {
         "reports_list": reports_list,
-        "unread_count": unread_count,
+        "unread_count": sum(report["unread"] for report in reports_list),
     }
 
 
@@ -176,24 +240,3 @@ def fetch_own_case_info(user):
         "is_positive": user.patient.is_confirmed and not user.patient.is_negative,
         "is_negative": user.patient.is_negative,
     }
-
-
-def fetch_data_from_opencovid(opencovid_url="https://api.opencovid.ca/summary?loc=QC"):
-    with urllib.request.urlopen(opencovid_url) as url:
-        data = json.loads(url.read().decode())['summary'][-1]
-
-    return {
-        "date": data["date"],
-        "confirmed": data["cumulative_cases"],
-        "daily_confirmed": data["cases"],
-        "current_positives": data["active_cases"],
-        "daily_positives": data["active_cases_change"],
-        "recoveries": data["cumulative_recovered"],
-        "daily_recoveries": data["recovered"],
-        "deaths": data["cumulative_deaths"],
-        "daily_deaths": data["deaths"],
-        "vaccines": data["cumulative_avaccine"],
-        "daily_vaccines": data["avaccine"],
-        "fully_vaccinated": data["cumulative_cvaccine"],
-        "daily_fully_vaccinated": data["cvaccine"],
-    }
\ No newline at end of file
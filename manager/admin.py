@@ -1,3 +1,6 @@
 from django.contrib import admin
 
+from manager.models import ImportJob
 # Register your models here.
+
+admin.site.register(ImportJob)
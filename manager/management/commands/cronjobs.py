@@ -2,6 +2,9 @@ import datetime
 
 from django.core.management.base import BaseCommand, CommandError
 
+from dashboard.external_data import refresh_external_case_data
+from dashboard.utils import append_case_data, take_case_snapshot
+from manager.utils import start_stalled_import_job_workers
 from status.utils import send_status_reminders
 
 
@@ -44,10 +47,24 @@ class Command(BaseCommand):
         # Run each function
         jobs_to_run = [
             send_status_reminders,
+            # Resumes contact tracing imports whose worker died, in their own processes so that they don't hold up the
+            # other jobs
+            start_stalled_import_job_workers,
+            # Saves the number of patients of each case status, which the dashboards read
+            take_case_snapshot,
+            # Appends the day's case counts to the case data files shown in the dashboard
+            append_case_data,
+            # Keeps the external case data shown in the dashboard fresh, so that it rarely needs a background refresh
+            refresh_external_case_data,
         ]
 
+        # A failed job does not stop the next ones from running
+        failed_jobs = []
         for job in jobs_to_run:
             try:
                 job(current_date=current_date)
-            except:
-                raise CommandError(f"Job {job} failed to run at {datetime.datetime.now()}")
+            except Exception as e:
+                failed_jobs.append(f"{job.__name__} ({e!r})")
+
+        if failed_jobs:
+            raise CommandError(f"Job(s) {', '.join(failed_jobs)} failed to run at {datetime.datetime.now()}")
@@ -0,0 +1,42 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from manager.utils import find_duplicate_user_clusters
+
+
+class Command(BaseCommand):
+    """
+    This command lists the clusters of users that are likely to be the same person, such as traced contacts that were
+    imported more than once with differently formatted phone numbers or emails.
+    """
+    help = 'Lists clusters of users sharing a normalized email or phone number'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            # Names that sound alike are far more common than shared contact details, so this is opt-in
+            '--by-name',
+            action='store_true',
+            help='Also cluster users whose first and last names sound alike',
+        )
+
+    def handle(self, *args, **options):
+        """
+        Find and print the duplicate clusters.
+        @param args: None for now
+        @param options: Whether to also cluster by name.
+        @return: None
+        """
+
+        keys = ["email_key", "phone_number_key"]
+        if options['by_name']:
+            keys.append("name_key")
+
+        clusters = find_duplicate_user_clusters(keys)
+
+        user_ids = [user_id for cluster in clusters for user_id in cluster]
+        usernames = dict(User.objects.filter(id__in=user_ids).values_list("id", "username"))
+
+        for cluster in clusters:
+            self.stdout.write(", ".join(f"{usernames[user_id]} ({user_id})" for user_id in cluster))
+
+        self.stdout.write(f"Found {len(clusters)} duplicate cluster(s)")
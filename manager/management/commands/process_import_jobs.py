@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from manager.utils import process_import_jobs
+
+
+class Command(BaseCommand):
+    """
+    This command imports queued contact tracing files outside the web server.
+    It is started by the contact tracing page for every upload, and also resumes stalled jobs when run without a job id.
+    """
+    help = 'Imports pending or stalled contact tracing files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--job',
+            type=int,
+            help='Specify the id of the import job to run instead of running every pending or stalled job',
+            required=False
+        )
+
+    def handle(self, *args, **options):
+        """
+        Run the import jobs.
+        @param args: None for now
+        @param options: The specified job id, if it exists.
+        @return: None
+        """
+
+        job_ids = [options['job']] if options['job'] else None
+        jobs_run = process_import_jobs(job_ids)
+
+        self.stdout.write(f"Ran {jobs_run} import job(s)")
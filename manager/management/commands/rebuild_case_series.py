@@ -0,0 +1,44 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.utils import rebuild_case_data
+
+
+def parse_date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Invalid date: {value}, expected YYYY-MM-DD")
+
+
+class Command(BaseCommand):
+    """
+    This command rebuilds the rows of the case data files shown in the dashboard from the log of the case status
+    changes of the patients, e.g. for the days the cronjobs command missed or appended wrong counts for.
+    The unconfirmed untested patients are not logged, so their file is left as it is.
+    """
+    help = 'Rebuilds the daily case data files of a date range from the case status history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('start', help='First date to rebuild, as YYYY-MM-DD')
+        parser.add_argument('end', help='Last date to rebuild, as YYYY-MM-DD')
+
+    def handle(self, *args, **options):
+        """
+        Rebuild the case data files.
+        @param args: None for now
+        @param options: The first and last dates to rebuild.
+        @return: None
+        """
+
+        start_date, end_date = parse_date(options['start']), parse_date(options['end'])
+        if start_date > end_date:
+            raise CommandError("The start date must not be after the end date")
+
+        dates = rebuild_case_data(start_date, end_date)
+
+        if dates:
+            self.stdout.write(f"Rebuilt {len(dates)} day(s), from {dates[0]} to {dates[-1]}")
+        else:
+            self.stdout.write("No day was rebuilt, since the case status history starts after the end date")
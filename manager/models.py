@@ -1,3 +1,46 @@
+from django.contrib.auth.models import User
 from django.db import models
 
-# Create your models here.
+
+class ImportJob(models.Model):
+    """
+    A contact tracing csv file queued for import. Jobs are processed outside the web server by the
+    process_import_jobs management command, which records its progress here as it goes.
+    """
+
+    PENDING = "Pending"
+    RUNNING = "Running"
+    SUCCESS = "Success"
+    FAILURE = "Failure"
+    EMPTY = "Empty"
+
+    STATUS_CHOICES = (
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (SUCCESS, "Success"),
+        (FAILURE, "Failure"),
+        (EMPTY, "Empty"),
+    )
+
+    ACTIVE_STATUSES = (PENDING, RUNNING)
+
+    user = models.ForeignKey(
+        User,
+        related_name="import_jobs",
+        on_delete=models.CASCADE,
+    )
+    file_name = models.CharField(max_length=255)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    rows_total = models.IntegerField(blank=True, null=True)
+    rows_done = models.IntegerField(default=0)
+    failed_entries = models.JSONField(default=list, blank=True)
+    # Whether the outcome of the job was shown to its user on the contact tracing page
+    is_reported = models.BooleanField(default=False)
+    date_created = models.DateTimeField(auto_now_add=True)
+    # Updated after every imported batch, which lets stalled jobs be detected and resumed
+    date_updated = models.DateTimeField(auto_now=True)
+    date_started = models.DateTimeField(blank=True, null=True)
+    date_finished = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"import_{self.file_name}_{self.status}"
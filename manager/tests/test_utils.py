@@ -0,0 +1,366 @@
+import os
+import tempfile
+
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+
+from accounts.models import Patient
+from manager.models import ImportJob
+from manager.utils import STALE_IMPORT_JOB_TIMEOUT, claim_import_job, find_duplicate_user_clusters, \
+    import_contact_tracing_batches, import_contact_tracing_data, keep_import_job_alive, read_contact_tracing_csv, \
+    run_import_job, start_import_job_worker, start_stalled_import_job_workers
+
+
+def make_row(first_name="", last_name="", email="", phone=""):
+    return {"First Name": first_name, "Last Name": last_name, "Email": email, "Phone Number": phone}
+
+
+class ImportContactTracingDataTests(TestCase):
+    def setUp(self):
+        self.existing_user = User.objects.create(username="john@doe.com", email="john@doe.com", first_name="John",
+                                                 last_name="Doe")
+        self.existing_user.profile.phone_number = "5145550000"
+        self.existing_user.profile.save()
+
+    def test_no_rows_returns_empty(self):
+        """
+        Test that importing no rows is reported as an empty file
+        @return: void
+        """
+
+        self.assertEqual("Empty", import_contact_tracing_data([]))
+
+    def test_missing_columns_returns_failure(self):
+        """
+        Test that rows without the expected csv headers are reported as a failure
+        @return: void
+        """
+
+        self.assertEqual("Failure", import_contact_tracing_data([{"First Name": "Jane", "Last Name": "Doe"}]))
+
+    def test_valid_rows_create_traced_patients(self):
+        """
+        Test that valid rows create a user, a profile with the phone number and a patient with a traced code
+        @return: void
+        """
+
+        # Act
+        failed_entries = import_contact_tracing_data([
+            make_row("Jane", "Doe", "jane@doe.com", "5145551111"),
+            make_row("Jim", "Doe", "", "5145552222"),
+        ])
+
+        # Assert
+        self.assertEqual([], failed_entries)
+
+        jane = User.objects.get(username="jane@doe.com")
+        self.assertEqual("5145551111", jane.profile.phone_number)
+        self.assertTrue(jane.patient.code.startswith("T"))
+
+        jim = User.objects.get(username="5145552222")
+        self.assertEqual("", jim.email)
+        self.assertEqual(2, Patient.objects.count())
+
+    def test_invalid_rows_are_reported_by_line(self):
+        """
+        Test that each kind of invalid row is reported with its line number, across chunks
+        @return: void
+        """
+
+        # Act
+        failed_entries = import_contact_tracing_data([
+            make_row(),
+            make_row("Jane", "Doe"),
+            make_row("John", "Doe", "john@doe.com", "5145550000"),
+            make_row("Johnny", "Doe", "john@doe.com"),
+            make_row("Jane", "Doe", "jane@doe.com"),
+            make_row("", "", "jane@doe.com"),
+        ], chunk_size=4)
+
+        # Assert
+        self.assertEqual([
+            "Line 1: First name: , Last name: , Email: , Phone number:  -- Failed: This entry contains no data.",
+            "Line 2: First name: Jane, Last name: Doe, Email: , Phone number:  -- Failed: Entry lacks both email and phone number.",
+            "Line 3: First name: John, Last name: Doe, Email: john@doe.com, Phone number: 5145550000 -- Failed: A user with the exact same entry data already exists.",
+            "Line 4: First name: Johnny, Last name: Doe, Email: john@doe.com, Phone number:  -- Failed: Email address in email already in use.",
+            "Line 6: First name: , Last name: , Email: jane@doe.com, Phone number:  -- Failed: A user with the exact same entry data already exists.",
+        ], failed_entries)
+
+    def test_taken_usernames_get_a_suffix(self):
+        """
+        Test that rows whose username is already taken, in the database or earlier in the file, get a numbered suffix
+        @return: void
+        """
+
+        # Act
+        import_contact_tracing_data([
+            make_row("Jane", "Doe", "", "5145550000"),
+            make_row("Jim", "Doe", "", "5145550000"),
+        ])
+
+        # Assert
+        self.assertTrue(User.objects.filter(username="5145550000", first_name="Jane").exists())
+        self.assertTrue(User.objects.filter(username="5145550000-2", first_name="Jim").exists())
+
+    def test_differently_formatted_duplicates_are_rejected(self):
+        """
+        Test that entries only differing from an existing user by the formatting of their phone number or the case of
+        their name or email are rejected
+        @return: void
+        """
+
+        # Act
+        failed_entries = import_contact_tracing_data([
+            make_row("JOHN", "doe", "", "+1 (514) 555-0000"),
+            make_row("Johnny", "Doe", "John@Doe.com "),
+            make_row("Jane", "Doe", "", "514-555-1111"),
+            make_row("Jane", "Doe", "", "(514) 555 1111"),
+        ])
+
+        # Assert
+        self.assertEqual([
+            "Line 1: First name: JOHN, Last name: doe, Email: , Phone number: +1 (514) 555-0000 -- Failed: A user with the exact same entry data already exists.",
+            "Line 2: First name: Johnny, Last name: Doe, Email: John@Doe.com , Phone number:  -- Failed: Email address in email already in use.",
+            "Line 4: First name: Jane, Last name: Doe, Email: , Phone number: (514) 555 1111 -- Failed: A user with the exact same entry data already exists.",
+        ], failed_entries)
+        self.assertEqual("5145551111", User.objects.get(username="514-555-1111").profile.phone_number_key)
+
+
+class FindDuplicateUserClustersTests(TestCase):
+    def test_users_sharing_any_key_are_clustered(self):
+        """
+        Test that users linked through a shared email or phone number end up in one cluster
+        @return: void
+        """
+
+        # Arrange
+        users = [
+            User.objects.create(username=f"user{i}", email=email, first_name="Jane", last_name="Doe")
+            for i, email in enumerate(["jane@doe.com", "JANE@doe.com", "", "", "other@doe.com"])
+        ]
+        for user, phone in zip(users, ["", "514 555 1111", "5145551111", "5145552222", "5145553333"]):
+            user.profile.phone_number = phone
+            user.profile.save()
+
+        # Act & Assert
+        self.assertEqual([[users[0].id, users[1].id, users[2].id]], find_duplicate_user_clusters())
+        self.assertEqual([[u.id for u in users]], find_duplicate_user_clusters(["name_key"]))
+
+
+class ReadContactTracingCsvTests(TestCase):
+    def test_file_is_streamed_in_batches_with_progress(self):
+        """
+        Test that a csv file is read in batches of the given size and that progress is reported after each batch
+        @return: void
+        """
+
+        # Arrange
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as csv_file:
+            csv_file.write("First Name,Last Name,Email,Phone Number\n")
+            for i in range(5):
+                csv_file.write(f"Jane,Doe{i},jane{i}@doe.com,\n")
+        self.addCleanup(os.remove, csv_file.name)
+        progress = []
+
+        # Act
+        batches = read_contact_tracing_csv(csv_file.name, batch_size=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            failed_entries = import_contact_tracing_batches(
+                batches,
+                on_progress=lambda rows_done, failed: progress.append(rows_done)
+            )
+
+        # Assert
+        self.assertEqual([], failed_entries)
+        self.assertEqual([2, 4, 5], progress)
+        self.assertEqual(5, Patient.objects.count())
+
+
+    @mock.patch("manager.utils.send_system_message_to_user")
+    @mock.patch("manager.utils.FeatureToggles")
+    def test_messages_are_only_sent_once_the_batch_is_committed(self, mock_feature_toggles, mock_send):
+        """
+        Test that the new users of a batch are only sent their registration message once the batch is committed
+        @return: void
+        """
+
+        # Arrange
+        mock_feature_toggles.SEND_SYSTEM_MESSAGES_TO_NEW_TRACED_USERS.value = True
+        batches = [[{"First Name": "Jane", "Last Name": f"Doe{i}", "Email": f"jane{i}@doe.com", "Phone Number": ""}]
+                   for i in range(2)]
+
+        # Act
+        with self.captureOnCommitCallbacks() as callbacks:
+            import_contact_tracing_batches(batches)
+
+        # Assert
+        mock_send.assert_not_called()
+        for callback in callbacks:
+            callback()
+        self.assertEqual(2, mock_send.call_count)
+
+class ImportJobTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="manager", is_staff=True)
+
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(os.rmdir, self.directory)
+        patcher = mock.patch("manager.utils.CONTACT_TRACING_PATH", self.directory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write_csv(self, file_name, rows):
+        file_path = os.path.join(self.directory, file_name)
+        with open(file_path, "w") as csv_file:
+            csv_file.write("First Name,Last Name,Email,Phone Number\n")
+            for row in rows:
+                csv_file.write(row + "\n")
+        self.addCleanup(os.remove, file_path)
+
+    def test_job_can_only_be_claimed_once(self):
+        """
+        Test that a pending job can be claimed by one worker only
+        @return: void
+        """
+
+        job = ImportJob.objects.create(user=self.user, file_name="tracing.csv")
+
+        self.assertTrue(claim_import_job(job.id))
+        self.assertFalse(claim_import_job(job.id))
+
+    def test_stalled_job_can_be_claimed_again(self):
+        """
+        Test that a running job which stopped saving its progress can be claimed again
+        @return: void
+        """
+
+        # Arrange
+        job = ImportJob.objects.create(user=self.user, file_name="tracing.csv", status=ImportJob.RUNNING)
+        ImportJob.objects.filter(id=job.id).update(date_updated=timezone.now() - timedelta(hours=1))
+
+        # Act & Assert
+        self.assertTrue(claim_import_job(job.id))
+
+    def test_job_imports_file_and_records_progress(self):
+        """
+        Test that running a job imports its file and records its row counts, failed entries and final status
+        @return: void
+        """
+
+        # Arrange
+        self.write_csv("tracing.csv", ["Jane,Doe,jane@doe.com,", "Jim,Doe,,", "Jill,Doe,,5145551111"])
+        job = ImportJob.objects.create(user=self.user, file_name="tracing.csv")
+        claim_import_job(job.id)
+
+        # Act
+        run_import_job(ImportJob.objects.get(id=job.id))
+
+        # Assert
+        job.refresh_from_db()
+        self.assertEqual(ImportJob.SUCCESS, job.status)
+        self.assertEqual(3, job.rows_total)
+        self.assertEqual(3, job.rows_done)
+        self.assertEqual(1, len(job.failed_entries))
+        self.assertTrue(job.failed_entries[0].startswith("Line 2:"))
+        self.assertEqual(2, Patient.objects.count())
+        self.assertIsNotNone(job.date_finished)
+
+    def test_interrupted_job_resumes_after_saved_progress(self):
+        """
+        Test that a job which already imported some rows skips them when it is run again
+        @return: void
+        """
+
+        # Arrange
+        self.write_csv("tracing.csv", ["Jane,Doe,jane@doe.com,", "Jim,Doe,jim@doe.com,"])
+        job = ImportJob.objects.create(user=self.user, file_name="tracing.csv", rows_done=1)
+        claim_import_job(job.id)
+
+        # Act
+        run_import_job(ImportJob.objects.get(id=job.id))
+
+        # Assert
+        self.assertFalse(User.objects.filter(username="jane@doe.com").exists())
+        self.assertTrue(User.objects.filter(username="jim@doe.com").exists())
+        self.assertEqual(2, ImportJob.objects.get(id=job.id).rows_done)
+
+    def test_missing_file_fails_job(self):
+        """
+        Test that a job whose file cannot be read is marked as failed
+        @return: void
+        """
+
+        # Arrange
+        job = ImportJob.objects.create(user=self.user, file_name="missing.csv")
+        claim_import_job(job.id)
+
+        # Act
+        run_import_job(ImportJob.objects.get(id=job.id))
+
+        # Assert
+        self.assertEqual(ImportJob.FAILURE, ImportJob.objects.get(id=job.id).status)
+
+    def test_running_job_is_kept_alive(self):
+        """
+        Test that a running job that records its heartbeat is not claimed again
+        @return: void
+        """
+
+        # Arrange
+        job = ImportJob.objects.create(user=self.user, file_name="slow.csv", status=ImportJob.RUNNING)
+        ImportJob.objects.filter(id=job.id).update(
+            date_updated=timezone.now() - STALE_IMPORT_JOB_TIMEOUT - timedelta(minutes=1)
+        )
+
+        # Act
+        stop = mock.Mock(wait=mock.Mock(side_effect=[False, True]))
+        keep_import_job_alive(job.id, stop)
+
+        # Assert
+        self.assertFalse(claim_import_job(job.id))
+
+    @mock.patch("manager.utils.subprocess.Popen")
+    def test_worker_process_is_reaped(self, mock_popen):
+        """
+        Test that the worker of a job is started in its own session and waited for, so that it leaves no zombie
+        process behind
+        @return: void
+        """
+
+        # Arrange
+        job = ImportJob.objects.create(user=self.user, file_name="pending.csv")
+
+        # Act
+        start_import_job_worker(job).join(timeout=5)
+
+        # Assert
+        self.assertEqual(["process_import_jobs", "--job", str(job.id)], mock_popen.call_args.args[0][-3:])
+        self.assertTrue(mock_popen.call_args.kwargs["start_new_session"])
+        mock_popen.return_value.wait.assert_called_once_with()
+
+    @mock.patch("manager.utils.start_import_job_worker")
+    def test_stalled_jobs_are_started_in_their_own_process(self, mock_start_worker):
+        """
+        Test that the scheduled jobs only start a worker for the pending and stalled jobs, without running them
+        @return: void
+        """
+
+        # Arrange
+        pending = ImportJob.objects.create(user=self.user, file_name="pending.csv")
+        stalled = ImportJob.objects.create(user=self.user, file_name="stalled.csv", status=ImportJob.RUNNING)
+        ImportJob.objects.create(user=self.user, file_name="running.csv", status=ImportJob.RUNNING)
+        ImportJob.objects.filter(id=stalled.id).update(
+            date_updated=timezone.now() - STALE_IMPORT_JOB_TIMEOUT - timedelta(minutes=1)
+        )
+
+        # Act
+        started = start_stalled_import_job_workers()
+
+        # Assert
+        self.assertEqual(2, started)
+        self.assertEqual({pending.id, stalled.id}, {call.args[0].id for call in mock_start_worker.call_args_list})
+        self.assertEqual(ImportJob.PENDING, ImportJob.objects.get(id=pending.id).status)
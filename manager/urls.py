@@ -7,7 +7,7 @@ urlpatterns = [
     path('contact_tracing/', views.contact_tracing, name='contact_tracing'),
     path('contact_tracing_table/', views.contact_tracing_table, name='contact_tracing_table'),
     path('contact_tracing/<str:file_name>/', views.download_contact_tracing_file, name='download_contact_tracing_file'),
-    path('tracing_uploads_in_progress/', views.check_tracing_uploads_in_progress, name='tracing_uploads_in_progress'),
+    path('import_jobs_progress/', views.import_jobs_progress, name='import_jobs_progress'),
     path('case_data/', views.case_data, name='case_data'),
     path('case_data/<str:file_name>/', views.download_case_data_file, name='download_case_data_file'),
     path('doctors/', views.doctor_patient_list, name='doctors'),
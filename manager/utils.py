@@ -0,0 +1,531 @@
+import csv
+
+import subprocess
+import sys
+import threading
+
+from collections import Counter, defaultdict
+from datetime import timedelta
+from functools import partial, reduce
+from itertools import islice
+from operator import or_
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.contrib.auth.tokens import default_token_generator
+from django.db import connection, transaction
+from django.conf import settings
+from django.db.models import Count, Q
+from django.urls import reverse
+from django.utils import timezone
+
+from Covigo.feature_toggles import FeatureToggles
+from Covigo.messages import Messages
+from accounts.models import Patient, Profile
+from accounts.normalization import get_phonetic_name_key, normalize_email, normalize_phone_number
+from accounts.utils import generate_unique_patient_codes, send_system_message_to_user
+from manager.models import ImportJob
+from messaging.utils import send_notification
+
+CASE_DATA_PATH = "static/Covigo/data/case_data"
+CONTACT_TRACING_PATH = "static/Covigo/data/contact_tracing"
+
+# Number of csv rows imported per transaction
+CONTACT_TRACING_CHUNK_SIZE = 500
+
+# Number of username prefixes looked up per query when resolving username collisions
+USERNAME_PREFIX_BATCH_SIZE = 100
+
+# A running import job that has not saved any progress for this long is assumed to have died and may be resumed
+STALE_IMPORT_JOB_TIMEOUT = timedelta(minutes=10)
+
+# How often a running import job records that it is still alive, so that a slow batch never makes it look stalled
+IMPORT_JOB_HEARTBEAT_INTERVAL = STALE_IMPORT_JOB_TIMEOUT / 5
+
+
+class ContactTracingIndex:
+    """
+    In-memory view of the existing users that a chunk of contact tracing entries could collide with.
+    Users are blocked by their normalized email and phone number keys, which are loaded with a handful of set-based
+    queries. Every per-entry question is then answered with dictionary probes without touching the database, and the
+    index is kept up to date with the users created from the chunk itself.
+    """
+
+    def __init__(self, entries):
+        email_keys = {e["email_key"] for e in entries if e["email_key"]}
+        phone_keys = {e["phone_key"] for e in entries if e["phone_key"]}
+        base_counts = Counter(e["email"] or e["phone"] for e in entries if e["email"] or e["phone"])
+
+        self.users_by_email_key = defaultdict(list)
+        self.users_by_phone_key = defaultdict(list)
+
+        existing_users = Profile.objects.filter(
+            Q(email_key__in=email_keys) | Q(phone_number_key__in=phone_keys)
+        ).values_list("user__first_name", "user__last_name", "email_key", "phone_number_key")
+
+        for first_name, last_name, email_key, phone_key in existing_users:
+            self._index_user(first_name, last_name, email_key, phone_key)
+
+        self.usernames = set(User.objects.filter(username__in=base_counts).values_list("username", flat=True))
+
+        # Collided usernames get a "-<count>" suffix, so every username sharing their prefix is needed to count them
+        prefixes = [base for base in base_counts if base in self.usernames or base_counts[base] > 1]
+        for i in range(0, len(prefixes), USERNAME_PREFIX_BATCH_SIZE):
+            prefix_filter = reduce(or_, (Q(username__startswith=p) for p in prefixes[i:i + USERNAME_PREFIX_BATCH_SIZE]))
+            self.usernames.update(User.objects.filter(prefix_filter).values_list("username", flat=True))
+
+    def _index_user(self, first_name, last_name, email_key, phone_key):
+        user = (first_name.casefold(), last_name.casefold(), email_key, phone_key)
+        if email_key:
+            self.users_by_email_key[email_key].append(user)
+        if phone_key:
+            self.users_by_phone_key[phone_key].append(user)
+
+    def has_exact_match(self, first_name, last_name, email_key, phone_key):
+        """
+        Checks if a user matches every non-blank field of an entry, ignoring the case of names and the formatting of
+        emails and phone numbers
+        @return: true if such a user exists otherwise false
+        """
+
+        if email_key:
+            candidates = self.users_by_email_key.get(email_key, [])
+        else:
+            candidates = self.users_by_phone_key.get(phone_key, [])
+        wanted = (first_name.casefold(), last_name.casefold(), email_key, phone_key)
+
+        return any(
+            all(not value or value == existing for value, existing in zip(wanted, user))
+            for user in candidates
+        )
+
+    def is_email_in_use(self, email_key):
+        return email_key in self.users_by_email_key
+
+    def get_new_username(self, base):
+        """
+        Returns the username to give a new user, suffixing the base username with a count if it is already taken
+        @param base: the email or phone number the username is derived from
+        @return: a username that is not in use
+        """
+
+        if base not in self.usernames:
+            return base
+
+        suffix = 1 + sum(1 for username in self.usernames if username.startswith(base))
+        while f"{base}-{suffix}" in self.usernames:
+            suffix += 1
+        return f"{base}-{suffix}"
+
+    def add(self, first_name, last_name, email_key, phone_key, username):
+        self._index_user(first_name, last_name, email_key, phone_key)
+        self.usernames.add(username)
+
+
+def chunk_rows(rows, chunk_size=CONTACT_TRACING_CHUNK_SIZE):
+    """
+    Splits an iterable of rows into lists of at most chunk_size rows
+    @param rows: any iterable of rows
+    @param chunk_size: the maximum size of a chunk
+    @return: generator of row lists
+    """
+
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+
+def format_failed_entry(entry, reason):
+    return (
+        f"Line {entry['line']}: First name: {entry['first_name']}, Last name: {entry['last_name']}, "
+        f"Email: {entry['email']}, Phone number: {entry['phone']} -- Failed: {reason}"
+    )
+
+
+def import_contact_tracing_chunk(rows, first_line):
+    """
+    Validates a chunk of contact tracing csv rows and creates a patient user for every valid one.
+    Users, profiles and patients are inserted with one bulk query each, inside a single transaction.
+    @param rows: list of csv rows (dicts with the "First Name", "Last Name", "Email" and "Phone Number" keys)
+    @param first_line: the line number of the first row of the chunk
+    @return: list of failed entry messages for the chunk
+    """
+
+    entries = [
+        {
+            "line": first_line + i,
+            "first_name": row["First Name"] or "",
+            "last_name": row["Last Name"] or "",
+            "email": row["Email"] or "",
+            "phone": row["Phone Number"] or "",
+        }
+        for i, row in enumerate(rows)
+    ]
+
+    for entry in entries:
+        entry["email_key"] = normalize_email(entry["email"])
+        entry["phone_key"] = normalize_phone_number(entry["phone"])
+
+    failed_entries = []
+    new_entries = []
+    index = ContactTracingIndex(entries)
+
+    for entry in entries:
+        first_name, last_name, email, phone = entry["first_name"], entry["last_name"], entry["email"], entry["phone"]
+        email_key, phone_key = entry["email_key"], entry["phone_key"]
+
+        if first_name == "" and last_name == "" and email == "" and phone == "":
+            failed_entries.append(format_failed_entry(entry, "This entry contains no data."))
+            continue
+
+        if email == "" and phone == "":
+            failed_entries.append(format_failed_entry(entry, "Entry lacks both email and phone number."))
+            continue
+
+        if index.has_exact_match(first_name, last_name, email_key, phone_key):
+            failed_entries.append(format_failed_entry(entry, "A user with the exact same entry data already exists."))
+            continue
+
+        if email_key != "" and index.is_email_in_use(email_key):
+            failed_entries.append(format_failed_entry(entry, "Email address in email already in use."))
+            continue
+
+        entry["username"] = index.get_new_username(email or phone)
+        index.add(first_name, last_name, email_key, phone_key, entry["username"])
+        new_entries.append(entry)
+
+    if not new_entries:
+        return failed_entries
+
+    with transaction.atomic():
+        User.objects.bulk_create([
+            User(username=e["username"], first_name=e["first_name"], last_name=e["last_name"], email=e["email"])
+            for e in new_entries
+        ])
+
+        # Not every database backend returns the primary keys of bulk inserted rows, so fetch them by username
+        user_ids = dict(
+            User.objects.filter(username__in=[e["username"] for e in new_entries]).values_list("username", "id")
+        )
+        codes = generate_unique_patient_codes(len(new_entries), prefix="T")
+
+        # Bulk inserts skip the post_save signals, so profiles are created here directly
+        Profile.objects.bulk_create([
+            Profile(
+                user_id=user_ids[e["username"]],
+                phone_number=e["phone"],
+                phone_number_key=e["phone_key"],
+                email_key=e["email_key"],
+                name_key=get_phonetic_name_key(e["first_name"], e["last_name"]),
+            )
+            for e in new_entries
+        ])
+        Patient.objects.bulk_create([
+            Patient(user_id=user_ids[e["username"]], code=code) for e, code in zip(new_entries, codes)
+        ])
+
+        if FeatureToggles.SEND_SYSTEM_MESSAGES_TO_NEW_TRACED_USERS.value:
+            # The messages are only sent once the users are committed, which is after the whole batch when the chunk
+            # is imported as part of one, so that a batch that is rolled back and retried never sends them twice
+            transaction.on_commit(lambda: send_registration_messages(user_ids.values()))
+
+    return failed_entries
+
+
+def send_registration_messages(user_ids):
+    """
+    Sends the registration message to new contact traced users
+    @param user_ids: ids of the users
+    @return: void
+    """
+
+    template = Messages.REGISTER_USER.value
+    for u in User.objects.filter(id__in=user_ids).select_related("profile"):
+        c = {
+            'token': default_token_generator.make_token(u),
+        }
+        send_system_message_to_user(u, template=template, c=c)
+
+
+def read_contact_tracing_csv(file_path, batch_size=CONTACT_TRACING_CHUNK_SIZE, skip_rows=0):
+    """
+    Streams a contact tracing csv file in batches of rows, so that only one batch is held in memory at a time
+    @param file_path: path to the csv file
+    @param batch_size: the maximum number of rows per batch
+    @param skip_rows: the number of rows at the start of the file that were already imported
+    @return: generator of row batches
+    """
+
+    with open(file_path, "r", newline="") as contact_tracing_file:
+        rows = islice(csv.DictReader(contact_tracing_file), skip_rows, None)
+        yield from chunk_rows(rows, batch_size)
+
+
+def count_contact_tracing_csv_rows(file_path):
+    """
+    Counts the data rows of a contact tracing csv file without holding it in memory
+    @param file_path: path to the csv file
+    @return: the number of rows, excluding the header and blank lines
+    """
+
+    with open(file_path, "r", newline="") as contact_tracing_file:
+        return max(sum(1 for row in csv.reader(contact_tracing_file) if row) - 1, 0)
+
+
+def import_contact_tracing_batches(batches, on_progress=None, save_progress=None, first_line=1, failed_entries=None):
+    """
+    Imports batches of contact tracing csv rows, one transaction per batch.
+    @param batches: any iterable of row lists
+    @param on_progress: optional callback called with the number of rows processed so far and the failed entries once
+    each batch is committed
+    @param save_progress: optional callback called with the same arguments inside the batch's transaction, so that the
+    progress it saves in the database never disagrees with the imported rows. It must not have any other side effect.
+    @param first_line: the line number of the first row, when resuming an import
+    @param failed_entries: the failed entries of the rows imported before first_line, when resuming an import
+    @return: "Empty" if there are no rows, "Failure" if the data could not be read, else the list of failed entries
+    """
+
+    failed_entries = list(failed_entries or [])
+    line = first_line
+
+    try:
+        for batch in batches:
+            with transaction.atomic():
+                failed_entries += import_contact_tracing_chunk(batch, line)
+                line += len(batch)
+
+                if save_progress:
+                    save_progress(line - 1, failed_entries)
+                if on_progress:
+                    transaction.on_commit(partial(on_progress, line - 1, list(failed_entries)))
+
+    except Exception:
+        return "Failure"
+
+    if line == 1:
+        return "Empty"
+
+    return failed_entries
+
+
+def import_contact_tracing_data(rows, chunk_size=CONTACT_TRACING_CHUNK_SIZE):
+    """
+    Imports contact tracing csv rows chunk by chunk.
+    @param rows: any iterable of csv rows
+    @param chunk_size: the number of rows imported per transaction
+    @return: "Empty" if there are no rows, "Failure" if the data could not be read, else the list of failed entries
+    """
+
+    return import_contact_tracing_batches(chunk_rows(rows, chunk_size))
+
+
+def find_duplicate_user_clusters(keys=("email_key", "phone_number_key")):
+    """
+    Finds groups of users that are likely to be the same person. Users sharing a value for any of the given
+    deduplication keys are linked, and linked users are merged into clusters, so that e.g. a user sharing a phone
+    number with a second user and an email with a third ends up in one cluster with both.
+    Every key is resolved with one grouped query and one query fetching the profiles sharing a duplicated value.
+    @param keys: the Profile deduplication key fields to block users by
+    @return: list of clusters, each a sorted list of at least two user ids
+    """
+
+    parents = {}
+
+    def find(user_id):
+        parents.setdefault(user_id, user_id)
+        while parents[user_id] != user_id:
+            parents[user_id] = parents[parents[user_id]]
+            user_id = parents[user_id]
+        return user_id
+
+    for key in keys:
+        duplicated_values = (
+            Profile.objects.exclude(**{key: ""})
+            .values(key)
+            .annotate(user_count=Count("id"))
+            .filter(user_count__gt=1)
+            .values(key)
+        )
+        profiles = Profile.objects.filter(**{f"{key}__in": duplicated_values}).values_list(key, "user_id")
+
+        first_user_with_value = {}
+        for value, user_id in profiles:
+            first_user_id = first_user_with_value.setdefault(value, user_id)
+            parents[find(user_id)] = find(first_user_id)
+
+    clusters = defaultdict(list)
+    for user_id in parents:
+        clusters[find(user_id)].append(user_id)
+
+    return sorted(sorted(cluster) for cluster in clusters.values() if len(cluster) > 1)
+
+
+def start_import_job_worker(job):
+    """
+    Starts a separate process that runs an import job, so that the import survives the request that queued it. The
+    process is waited for by a daemon thread, so that it does not linger as a zombie once it exits.
+    @param job: the pending import job
+    @return: the thread waiting for the process
+    """
+
+    process = subprocess.Popen(
+        [sys.executable, str(settings.BASE_DIR / "manage.py"), "process_import_jobs", "--job", str(job.id)],
+        cwd=settings.BASE_DIR,
+        start_new_session=True,
+    )
+
+    reaper = threading.Thread(target=process.wait, name=f"import-job-{job.id}-worker", daemon=True)
+    reaper.start()
+    return reaper
+
+
+def claim_import_job(job_id):
+    """
+    Marks an import job as running if it is pending or stalled. The check and the update happen in one query, so two
+    workers can never claim the same job.
+    @param job_id: the id of the job to claim
+    @return: true if the job was claimed otherwise false
+    """
+
+    now = timezone.now()
+    claimable = (
+        Q(status=ImportJob.PENDING)
+        | Q(status=ImportJob.RUNNING, date_updated__lt=now - STALE_IMPORT_JOB_TIMEOUT)
+    )
+
+    return ImportJob.objects.filter(claimable, id=job_id).update(status=ImportJob.RUNNING, date_updated=now) == 1
+
+
+def keep_import_job_alive(job_id, stop, interval=IMPORT_JOB_HEARTBEAT_INTERVAL):
+    """
+    Updates the date_updated of a running import job every interval until stopped, so that it is not claimed again
+    while one of its batches takes long to import or to send its messages. It is run by a thread of the process that
+    runs the job, so it stops when that process dies.
+    @param job_id: the id of the running job
+    @param stop: event that is set once the job is done
+    @param interval: time between two updates
+    @return: void
+    """
+
+    while not stop.wait(interval.total_seconds()):
+        ImportJob.objects.filter(id=job_id, status=ImportJob.RUNNING).update(date_updated=timezone.now())
+
+
+def run_import_job(job):
+    """
+    Imports the csv file of a claimed import job, saving its progress after every batch. A job that was interrupted
+    resumes after the last batch it saved.
+    @param job: the claimed import job
+    @return: void
+    """
+
+    file_path = Path(CONTACT_TRACING_PATH) / job.file_name
+    now = timezone.now()
+
+    if job.date_started is None:
+        job.date_started = now
+    if job.rows_total is None:
+        try:
+            job.rows_total = count_contact_tracing_csv_rows(file_path)
+        except (OSError, csv.Error):
+            pass
+    job.save(update_fields=["date_started", "rows_total", "date_updated"])
+
+    def save_progress(rows_done, failed_entries):
+        ImportJob.objects.filter(id=job.id).update(
+            rows_done=rows_done,
+            failed_entries=failed_entries,
+            date_updated=timezone.now(),
+        )
+
+    stop_heartbeat = threading.Event()
+
+    def run_heartbeat():
+        try:
+            keep_import_job_alive(job.id, stop_heartbeat)
+        finally:
+            # The thread has its own database connection
+            connection.close()
+
+    heartbeat = threading.Thread(target=run_heartbeat, daemon=True)
+    heartbeat.start()
+
+    try:
+        result = import_contact_tracing_batches(
+            read_contact_tracing_csv(file_path, skip_rows=job.rows_done),
+            save_progress=save_progress,
+            first_line=job.rows_done + 1,
+            failed_entries=job.failed_entries,
+        )
+    finally:
+        stop_heartbeat.set()
+        heartbeat.join()
+
+    job.refresh_from_db()
+    if result == "Empty":
+        job.status = ImportJob.EMPTY
+    elif result == "Failure":
+        job.status = ImportJob.FAILURE
+    else:
+        job.status = ImportJob.SUCCESS
+        job.failed_entries = result
+    job.date_finished = timezone.now()
+    job.save()
+
+    send_notification(
+        job.user_id,
+        job.user_id,
+        f"Your contact tracing file {job.file_name} has finished importing",
+        href=reverse("manager:contact_tracing")
+    )
+
+
+def get_claimable_import_jobs():
+    """
+    Gets the import jobs that are pending, or running but stalled
+    @return: queryset of the jobs, from the oldest
+    """
+
+    stale_before = timezone.now() - STALE_IMPORT_JOB_TIMEOUT
+    return ImportJob.objects.filter(
+        Q(status=ImportJob.PENDING) | Q(status=ImportJob.RUNNING, date_updated__lt=stale_before)
+    ).order_by("date_created")
+
+
+def start_stalled_import_job_workers(**kwargs):
+    """
+    Starts a separate process for every pending or stalled import job, without waiting for the imports. Each process
+    claims its job before running it, so a job is never run twice.
+    @return: the number of processes started
+    """
+
+    jobs = list(get_claimable_import_jobs())
+    for job in jobs:
+        start_import_job_worker(job)
+
+    return len(jobs)
+
+
+def process_import_jobs(job_ids=None, **kwargs):
+    """
+    Runs every given import job that can be claimed, by default every pending or stalled one
+    @param job_ids: optional list of job ids to run
+    @return: the number of jobs that were run
+    """
+
+    if job_ids is None:
+        job_ids = get_claimable_import_jobs().values_list("id", flat=True)
+
+    jobs_run = 0
+    for job_id in list(job_ids):
+        if claim_import_job(job_id):
+            run_import_job(ImportJob.objects.get(id=job_id))
+            jobs_run += 1
+
+    return jobs_run
@@ -1,7 +1,4 @@
-import csv
 import json
-import threading
-import time
 
 from datetime import timedelta, date
 from os import listdir, path
@@ -11,23 +8,18 @@ from pathlib import Path
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User, Permission
-from django.contrib.auth.tokens import default_token_generator
 from django.core.exceptions import PermissionDenied
-from django.db.models import Q, Count
+from django.db.models import Count
 from django.http import HttpResponse, Http404
 from django.shortcuts import render
-from django.urls import reverse
 from django.views.decorators.cache import never_cache
 
-from Covigo.feature_toggles import FeatureToggles
-from Covigo.messages import Messages
-from accounts.models import Patient, Staff, Profile
-from accounts.utils import get_or_generate_patient_code, send_system_message_to_user, get_distance_of_all_doctors_to_postal_code
+from Covigo.tables import table_response
+from accounts.models import Staff
+from accounts.utils import get_distance_of_all_doctors_to_postal_code
 from appointments.utils import rebook_appointment_with_new_doctor
-from messaging.utils import send_notification
-
-CASE_DATA_PATH = "static/Covigo/data/case_data"
-CONTACT_TRACING_PATH = "static/Covigo/data/contact_tracing"
+from manager.models import ImportJob
+from manager.utils import CASE_DATA_PATH, CONTACT_TRACING_PATH, start_import_job_worker
 
 
 @login_required
@@ -78,18 +70,24 @@ def contact_tracing(request):
     ensure_path_exists(contact_tracing_path)
     failed_entries = []
 
-    if "tracing_uploads" in request.session:
-        uploads = request.session.pop("tracing_uploads")
-        for i in uploads:
-            if uploads[i] == "Success":
-                messages.success(request, f"All entries in file {i} were entered successfully!")
-            elif uploads[i] == "Failure":
-                messages.error(request, f"Failed to process file {i}: Some or all of the data could not be read. You may try again; if the problem persists, the file may be corrupted.")
-            elif uploads[i] == "Empty":
-                messages.error(request, f"Failed to process file {i}: The file is empty. If this is not the case, you may try again; if the problem persists, the file may be corrupted.")
-            else:
-                failed_entries = uploads[i]
-                messages.warning(request, f"The following {len(failed_entries)} entries in file {i} failed to import:")
+    finished_jobs = list(
+        ImportJob.objects.filter(user=request.user, is_reported=False)
+        .exclude(status__in=ImportJob.ACTIVE_STATUSES)
+        .order_by("date_finished")
+    )
+
+    for job in finished_jobs:
+        if job.status == ImportJob.SUCCESS and not job.failed_entries:
+            messages.success(request, f"All entries in file {job.file_name} were entered successfully!")
+        elif job.status == ImportJob.FAILURE:
+            messages.error(request, f"Failed to process file {job.file_name}: Some or all of the data could not be read. You may try again; if the problem persists, the file may be corrupted.")
+        elif job.status == ImportJob.EMPTY:
+            messages.error(request, f"Failed to process file {job.file_name}: The file is empty. If this is not the case, you may try again; if the problem persists, the file may be corrupted.")
+        else:
+            failed_entries = job.failed_entries
+            messages.warning(request, f"The following {len(failed_entries)} entries in file {job.file_name} failed to import:")
+
+    ImportJob.objects.filter(id__in=[job.id for job in finished_jobs]).update(is_reported=True)
 
     if request.method == "POST" and request.FILES["contact_tracing_file"]:
         f = request.FILES["contact_tracing_file"]
@@ -97,12 +95,8 @@ def contact_tracing(request):
         if f.name[-4:] == ".csv":
             file_name = save_contact_tracing_csv_file(f)
 
-            with open(Path(join(CONTACT_TRACING_PATH, file_name)), "r") as contact_tracing_file:
-                reader = csv.DictReader(contact_tracing_file)
-                data = list(reader)
-                t = threading.Thread(target=process_contact_tracing_csv, args=[request, data, file_name])
-                t.daemon = True
-                t.start()
+            job = ImportJob.objects.create(user=request.user, file_name=file_name)
+            start_import_job_worker(job)
 
             if file_name == f.name:
                 messages.success(request, f"File {f.name} uploaded successfully!")
@@ -140,9 +134,13 @@ def contact_tracing_table(request):
 
     files_table = list(map(lambda x: {"name": x}, data_files))
 
-    serialized_files = json.dumps({'data': files_table}, indent=4)
-
-    return HttpResponse(serialized_files, content_type='application/json')
+    return table_response(
+        request,
+        files_table,
+        columns={"name": "name"},
+        search_columns=["name"],
+        default_order=["name"],
+    )
 
 
 @login_required
@@ -209,9 +207,10 @@ def save_contact_tracing_csv_file(f):
             i += 1
         file_name = Path(f"{old_name[:-4]}__{i}{old_name[-4:]}")
 
+    # Write the upload in chunks so that large files are never held in memory all at once
     with open(file_name, 'wb') as file_to_save:
-        file_to_save.write(f.file.read())
-        file_to_save.close()
+        for chunk in f.chunks():
+            file_to_save.write(chunk)
 
     if file_existed:
         return f"{f.name[:-4]}__{i}{f.name[-4:]}"
@@ -219,97 +218,6 @@ def save_contact_tracing_csv_file(f):
         return f.name
 
 
-def create_users_from_csv_date(request, data):
-    if not data:
-        return "Empty"
-
-    failed_entries = []
-    line = 0
-
-    try:
-        for entry in data:
-            line += 1
-            first_name = entry["First Name"]
-            last_name = entry["Last Name"]
-            email = entry["Email"]
-            phone = entry["Phone Number"]
-
-            existing_filter = Q()
-
-            if not first_name:
-                first_name = ""
-            else:
-                existing_filter &= Q(first_name=first_name)
-
-            if not last_name:
-                last_name = ""
-            else:
-                existing_filter &= Q(last_name=last_name)
-
-            if not email:
-                email = ""
-            else:
-                existing_filter &= Q(email=email)
-
-            if not phone:
-                phone = ""
-            else:
-                existing_filter &= Q(profile__phone_number=phone)
-
-            if first_name == "" and last_name == "" and email == "" and phone == "":
-                failed_entry = f"Line {line}: First name: {first_name}, Last name: {last_name}, Email: {email}, Phone number: {phone} -- Failed: This entry contains no data."
-                failed_entries.append(failed_entry)
-                continue
-
-            if email == "" and phone == "":
-                failed_entry = f"Line {line}: First name: {first_name}, Last name: {last_name}, Email: {email}, Phone number: {phone} -- Failed: Entry lacks both email and phone number."
-                failed_entries.append(failed_entry)
-                continue
-
-            if User.objects.filter(existing_filter).exists():
-                failed_entry = f"Line {line}: First name: {first_name}, Last name: {last_name}, Email: {email}, Phone number: {phone} -- Failed: A user with the exact same entry data already exists."
-                failed_entries.append(failed_entry)
-                continue
-
-            if email != "" and User.objects.filter(email=email).exists():
-                failed_entry = f"Line {line}: First name: {first_name}, Last name: {last_name}, Email: {email}, Phone number: {phone} -- Failed: Email address in email already in use."
-                failed_entries.append(failed_entry)
-                continue
-
-            if email != "":
-                if not User.objects.filter(username=email).exists():
-                    new_username = email
-                else:
-                    new_username = f"{email}-{1 + User.objects.filter(username__startswith=email).count()}"
-
-            elif phone != "":
-                if not User.objects.filter(username=phone).exists():
-                    new_username = phone
-                else:
-                    new_username = f"{phone}-{1 + User.objects.filter(username__startswith=phone).count()}"
-
-            else:
-                continue
-
-            u = User.objects.create(username=new_username, first_name=first_name, last_name=last_name, email=email)
-            Profile.objects.filter(user=u).update(phone_number=phone)
-            p = Patient.objects.create(user=u)
-            get_or_generate_patient_code(p, prefix="T")
-
-            if FeatureToggles.SEND_SYSTEM_MESSAGES_TO_NEW_TRACED_USERS.value:
-                template = Messages.REGISTER_USER.value
-                c = {
-                    'token': default_token_generator.make_token(u),
-                }
-
-                send_system_message_to_user(u, template=template, c=c)
-
-    except Exception:
-        return "Failure"
-
-    return failed_entries
-
-
 def ensure_path_exists(path_to_check):
     if not Path.exists(path_to_check):
         Path.mkdir(path_to_check, exist_ok=True)
@@ -321,46 +229,19 @@ def ensure_path_exists(path_to_check):
         Path.mkdir(path_to_check, exist_ok=True)
 
 
-def process_contact_tracing_csv(request, data, filename):
-    request.session["tracing_uploads_in_progress"] = True
-    request.session.modified = True
-    request.session.save()
-
-    # If the upload happens too quick the window won't refresh when the processing completes.
-    time.sleep(1.0)
-
-    failed_entries = create_users_from_csv_date(request, data)
-
-    if "tracing_uploads" not in request.session:
-        request.session["tracing_uploads"] = {}
+@login_required
+@never_cache
+def import_jobs_progress(request):
+    if not request.user.is_staff or not request.user.has_perm("accounts.manage_contact_tracing"):
+        raise PermissionDenied
 
-    if failed_entries:
-        if failed_entries == "Empty":
-            request.session["tracing_uploads"][filename] = "Empty"
-        elif failed_entries == "Failure":
-            request.session["tracing_uploads"][filename] = "Failure"
-        else:
-            request.session["tracing_uploads"][filename] = failed_entries
-    else:
-        request.session["tracing_uploads"][filename] = "Success"
-
-    del request.session["tracing_uploads_in_progress"]
-    request.session.modified = True
-    request.session.save()
-
-    href = reverse('manager:contact_tracing')
-    send_notification(
-        request.user.id,
-        request.user.id,
-        f"Your contact tracing file {filename} has finished importing",
-        href=href
+    jobs = list(
+        ImportJob.objects.filter(user=request.user, status__in=ImportJob.ACTIVE_STATUSES)
+        .order_by("date_created")
+        .values("id", "file_name", "status", "rows_total", "rows_done")
     )
 
-
-def check_tracing_uploads_in_progress(request):
-    locked = ("tracing_uploads_in_progress" in request.session and request.session["tracing_uploads_in_progress"] == True)
-
-    return HttpResponse(locked)
+    return HttpResponse(json.dumps({"data": jobs}), content_type='application/json')
 
 
 def doctor_patient_list(request):
@@ -375,12 +256,19 @@ def doctor_patient_list_table(request):
     if not request.user.has_perm("accounts.edit_assigned_doctor"):
         raise PermissionDenied
 
-    query = get_doctors_list()
-
-    # Serialize the JSON from the query
-    serialized_reports = json.dumps({'data': query}, indent=4)
-
-    return HttpResponse(serialized_reports, content_type='application/json')
+    return table_response(
+        request,
+        get_doctors_list(),
+        columns={
+            "id": "id",
+            "first_name": "first_name",
+            "last_name": "last_name",
+            "username": "username",
+            "patient_count": "patient_count",
+        },
+        search_columns=["first_name", "last_name", "username"],
+        default_order=["last_name", "first_name"],
+    )
 
 
 def reassign_doctor(request, user_id):
@@ -451,12 +339,21 @@ def reassign_doctor_list_table(request, user_id):
                 "distance": None,
                 "patient_count": i['patient_count'],
             })
-    print(docs_list)
 
-    # Serialize the JSON from the query
-    serialized_docs = json.dumps({'data': docs_table}, indent=4)
-
-    return HttpResponse(serialized_docs, content_type='application/json')
+    return table_response(
+        request,
+        docs_table,
+        columns={
+            "doc_id": "doc_id",
+            "first_name": "first_name",
+            "last_name": "last_name",
+            "username": "username",
+            "distance": "distance",
+            "patient_count": "patient_count",
+        },
+        search_columns=["first_name", "last_name", "username"],
+        default_order=["distance", "patient_count", "last_name", "first_name"],
+    )
 
 
 def get_doctors_list():
@@ -481,4 +378,4 @@ def get_doctors_list():
         "staff__id",
     ).annotate(patient_count=Count("staff__assigned_patients"))
 
-    return list(query)
+    return query
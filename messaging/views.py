@@ -12,9 +12,11 @@ from django.urls import reverse
 from django.views.decorators.cache import never_cache
 
 from messaging.forms import ReplyForm, CreateMessageContentForm, CreateMessageGroupForm
-from django.db.models import Q
+from django.db.models import BooleanField, Case, Q, Value, When
 
 from Covigo.messages import Messages
+from Covigo.tables import table_response
+from accounts.authorization import get_authorization_context
 from accounts.utils import send_system_message_to_user
 from messaging.models import MessageGroup, MessageContent
 from messaging.utils import send_notification
@@ -38,66 +40,81 @@ def list_messages(request):
 @never_cache
 def list_messages_table(request):
     current_user = request.user
+    my_patients = get_authorization_context(request).assigned_patient_ids
 
     filter1 = (Q(author_id=current_user.id) | Q(recipient_id=current_user.id))
-
-    my_patients = None
-    try:
-        my_patients = request.user.staff.assigned_patients.all().values_list('user', flat=True)
-        doctor_permission = Permission.objects.get(codename="is_doctor")
-        filter1 |= (Q(author_id__in=my_patients) & Q(recipient__user_permissions=doctor_permission)) | (
-                Q(recipient_id__in=my_patients) & Q(author__user_permissions=doctor_permission))
-    except:
-        pass
+    if my_patients:
+        filter1 |= get_assigned_patient_messages_filter(my_patients)
     filter2 = Q(type=0)
 
-    message_group = MessageGroup.objects.filter(filter1 & filter2).all()
+    # Whether the message is seen from the point of view of the logged-in user, or of their patient's doctor
+    seen_whens = [
+        When(author_id=current_user.id, then="author_seen"),
+        When(recipient_id=current_user.id, then="recipient_seen"),
+    ]
+    if my_patients:
+        seen_whens += [
+            When(author_id__in=my_patients, then="recipient_seen"),
+            When(recipient_id__in=my_patients, then="author_seen"),
+        ]
+
+    # The permission joins of a doctor's filter can return a message once per permission of its author or recipient
+    message_groups = MessageGroup.objects.filter(filter1 & filter2).distinct().annotate(
+        seen=Case(*seen_whens, default=Value(False), output_field=BooleanField())
+    )
+
+    return table_response(
+        request,
+        message_groups,
+        columns={
+            "id": "id",
+            "priority": "priority",
+            "author_fname": "author__first_name",
+            "author_lname": "author__last_name",
+            "recipient_fname": "recipient__first_name",
+            "recipient_lname": "recipient__last_name",
+            "title": "title",
+            "date_created": "date_created",
+            "date_updated": "date_updated",
+            "seen": "seen",
+        },
+        search_columns=["author_fname", "author_lname", "recipient_fname", "recipient_lname", "title"],
+        default_order=["seen", "priority"],
+        format_row=format_message_group_row,
+    )
+
+
+def format_message_group_row(row):
+    if row["priority"] == 0:
+        priority_display = "Low"
+    elif row["priority"] == 1:
+        priority_display = "Medium"
+    elif row["priority"] == 2:
+        priority_display = "High"
+    else:
+        priority_display = None
 
-    message_groups = []
-    for mg in message_group:
-        if mg.author.id == current_user.id:
-            seen = mg.author_seen
-        elif mg.recipient.id == current_user.id:
-            seen = mg.recipient_seen
-        else:
-            try:
-                if mg.author.id in my_patients:
-                    seen = mg.recipient_seen
-                elif mg.recipient.id in my_patients:
-                    seen = mg.author_seen
-                else:
-                    # TODO: Proper exception handling
-                    raise Exception(
-                        "Logged in user isn't the author or recipient, nor is either of them an assigned patient of the logged in user.")
-            except Exception as e:
-                print(e)
-
-        if mg.priority == 0:
-            priority_display = "Low"
-        elif mg.priority == 1:
-            priority_display = "Medium"
-        elif mg.priority == 2:
-            priority_display = "High"
-
-        message_groups.append({
-            "id": mg.id,
-            "priority": {
-                "display": priority_display,
-                "value": mg.priority,
-            },
-            "author_fname": mg.author.first_name,
-            "author_lname": mg.author.last_name,
-            "recipient_fname": mg.recipient.first_name,
-            "recipient_lname": mg.recipient.last_name,
-            "title": mg.title,
-            "date_created": mg.date_created.strftime("%B %d, %Y, at %I:%M %p"),
-            "date_updated": mg.date_updated.strftime("%B %d, %Y, at %I:%M %p"),
-            "seen": seen,
-        })
+    row["priority"] = {
+        "display": priority_display,
+        "value": row["priority"],
+    }
+    row["date_created"] = row["date_created"].strftime("%B %d, %Y, at %I:%M %p")
+    row["date_updated"] = row["date_updated"].strftime("%B %d, %Y, at %I:%M %p")
+
+    return row
 
-    serialized_message_groups = json.dumps({'data': message_groups}, indent=4)
 
-    return HttpResponse(serialized_message_groups, content_type='application/json')
+def get_assigned_patient_messages_filter(patient_ids):
+    """
+    Builds the filter of the messages between a doctor and the given patients, which are visible to the staff member
+    the patients are assigned to
+    @param patient_ids: ids of the patients assigned to the logged-in user
+    @return: the filter of the patients' messages with doctors
+    """
+
+    doctor_permission = Permission.objects.get(codename="is_doctor")
+    return (Q(author_id__in=patient_ids) & Q(recipient__user_permissions=doctor_permission)) | (
+            Q(recipient_id__in=patient_ids) & Q(author__user_permissions=doctor_permission))
 
 
 @login_required
@@ -108,14 +125,9 @@ def view_message(request, message_group_id):
     filter1 = Q(id=message_group_id)
     filter2 = Q(author_id=current_user.id) | Q(recipient_id=current_user.id)
 
-    my_patients = None
-    try:
-        my_patients = request.user.staff.assigned_patients.values_list('user', flat=True)
-        doctor_permission = Permission.objects.get(codename="is_doctor")
-        filter2 |= (Q(author_id__in=my_patients) & Q(recipient__user_permissions=doctor_permission)) | (
-                Q(recipient_id__in=my_patients) & Q(author__user_permissions=doctor_permission))
-    except:
-        pass
+    my_patients = get_authorization_context(request).assigned_patient_ids
+    if my_patients:
+        filter2 |= get_assigned_patient_messages_filter(my_patients)
 
     filter3 = Q(type=0)
 
@@ -263,7 +275,7 @@ def compose_message(request, user_id):
     # To prevent users from being able to send messages to themselves
     recipient_user = User.objects.get(id=user_id)
 
-    can_compose_message = (request.user.id != user_id and (request.user.has_perm("accounts.message_user") or request.user.has_perm("accounts.message_patient") and not recipient_user.is_staff or request.user.has_perm("accounts.message_assigned") and recipient_user in request.user.staff.get_assigned_patient_users() or request.user.has_perm("accounts.message_doctor") and recipient_user == request.user.patient.get_assigned_staff_user()))
+    can_compose_message = get_authorization_context(request).can_message(recipient_user)
     if can_compose_message:
         if recipient_user.first_name == "" and recipient_user.last_name == "":
             recipient_name = recipient_user
@@ -348,11 +360,7 @@ def toggle_read(request, message_group_id):
     current_user = request.user
     message_group = MessageGroup.objects.get(id=message_group_id)
 
-    my_patients = None
-    try:
-        my_patients = request.user.staff.assigned_patients.values_list('user', flat=True)
-    except:
-        pass
+    my_patients = get_authorization_context(request).assigned_patient_ids
 
     # Check if we are author or recipient
     if message_group.author.id == current_user.id:
@@ -426,28 +434,30 @@ def list_notifications_table(request):
     # Fetch received notifications
     filter1 = Q(recipient_id=current_user.id) & Q(type=1)
 
-    message_group = list(MessageGroup.objects.filter(filter1).all().values())
-
+    return table_response(
+        request,
+        MessageGroup.objects.filter(filter1),
+        columns={
+            "id": "id",
+            "title": "title",
+            "date_created": "date_created",
+            "seen": "recipient_seen",
+        },
+        search_columns=["title"],
+        default_order=["-seen", "-date_created"],
+        format_row=format_notification_row,
+    )
+
+
+def format_notification_row(row):
     # Only for the notifications list, reformat the message groups titles to not include the hrefs
-    notifications_table = []
-    for i in message_group:
-        a = re.sub("<span class='notification-link cursor-pointer' data-href=", "", i['title'])
-        a = re.sub(">.*", "", a)
-
-        i['title'] = re.sub("<span class='notification-link cursor-pointer' data-href=[^>]*>", "", i['title'])
-        i['title'] = re.sub("</span>", "", i['title'])
-
-        notifications_table.append({
-            "id": i["id"],
-            "title": i['title'],
-            "date_created": i["date_created"].strftime("%B %d, %Y, at %I:%M %p"),
-            "seen": i["recipient_seen"],
-            "link": a,
-        })
+    row["link"] = re.sub(">.*", "", re.sub("<span class='notification-link cursor-pointer' data-href=", "", row["title"]))
 
-    serialized_notifications = json.dumps({'data': notifications_table}, indent=4)
+    row["title"] = re.sub("<span class='notification-link cursor-pointer' data-href=[^>]*>", "", row["title"])
+    row["title"] = re.sub("</span>", "", row["title"])
+    row["date_created"] = row["date_created"].strftime("%B %d, %Y, at %I:%M %p")
 
-    return HttpResponse(serialized_notifications, content_type='application/json')
+    return row
 
 
 @login_required
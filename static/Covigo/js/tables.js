@@ -0,0 +1,33 @@
+/**
+ * Builds the "ajax" option of a DataTable whose rows are paged, searched and ordered by the server.
+ * When the table requests the page that follows the last one it received, with the same search, filters and order,
+ * the cursor returned with that page is sent back, which lets the server seek to the next page instead of counting
+ * past every row before it.
+ * @param url the url of the table endpoint
+ * @param addParameters optional function adding extra request parameters, such as custom filters, to the request
+ * @returns the ajax option of the DataTable
+ */
+function serverSideTable(url, addParameters) {
+    let nextPage = null;
+    let lastQuery = null;
+
+    return {
+        "url": url,
+        "data": function (d) {
+            if (addParameters) {
+                addParameters(d);
+            }
+
+            // Everything but the draw counter and the start of the page must match for the cursor to apply
+            let query = JSON.stringify(Object.assign({}, d, {draw: null, start: null}));
+            if (nextPage && nextPage.start === d.start && query === lastQuery) {
+                d.cursor = nextPage.cursor;
+            }
+            lastQuery = query;
+        },
+        "dataSrc": function (json) {
+            nextPage = json.next;
+            return json.data;
+        }
+    };
+}
@@ -84,6 +84,26 @@ def get_reports_for_doctor(patient_ids):
     return filtered_reports
 
 
+def get_report_summaries(patient_ids):
+    """
+    Gets the reports of many patients in a single grouped query, one per patient and day, with their number of entries
+    and whether any of them is unread.
+    @param patient_ids: list of patient user ids
+    @return: queryset of reports, from the latest of each patient
+    """
+    criteria = Q(user_id__in=patient_ids) & ~Q(data=None) & (Q(status=0) | Q(status=3))
+
+    return PatientSymptom.objects.filter(criteria).values(
+        'date_updated__date',
+        'user_id',
+        'user__first_name',
+        'user__last_name',
+    ).annotate(
+        total_entries=Count("id"),
+        unread_entries=Count("id", filter=Q(is_reviewed=False) | Q(is_viewed=False)),
+    ).order_by('user_id', '-date_updated__date')
+
+
 def check_report_exist(user_id, date):
     """
     Checks if the report exists based on the user id and date.
@@ -1,20 +1,20 @@
 import datetime as dt
-import json
 import os
 
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.core.exceptions import PermissionDenied
-from django.core.serializers.json import DjangoJSONEncoder
-from django.db.models import Q
+from django.db.models import Case, Exists, Max, OuterRef, Q, When
 from django.http import HttpResponse, Http404
 from django.shortcuts import render, redirect
 from django.template.loader import render_to_string
 from django.urls import reverse
 from django.views.decorators.cache import never_cache
 
-from accounts.models import Staff, Patient
+from Covigo.tables import table_response
+from accounts.case_history import record_case_events
+from accounts.models import Flag, Staff, Patient
 from accounts.utils import get_assigned_staff_id_by_patient_id, get_flag
 from messaging.utils import send_notification
 from status.forms import TestResultForm
@@ -104,19 +104,36 @@ def patient_reports_table(request):
     # list of patient ids for the doctor
     patient_ids = list(doctor.staff.get_assigned_patient_users().values_list("id", flat=True))
 
-    # Return a query set of reports for the patient for their assigned doctor
-    reports = get_reports_for_doctor(patient_ids)
+    # Return a query set of reports for the patient for their assigned doctor, with whether each report has unread
+    # entries and whether its patient is flagged by the doctor
+    reports = get_reports_for_doctor(patient_ids).annotate(
+        unread=Max(Case(When(Q(is_reviewed=False) | Q(is_viewed=False), then=1), default=0)),
+        flagged=Exists(Flag.objects.filter(staff=doctor, patient=OuterRef("user_id"), is_active=True)),
+    )
 
-    reports = list(reports)
-    for report in reports:
-        flag = get_flag(request.user, User.objects.get(id=report["user_id"]))
-        report["unread"] = get_report_unread_status(report)
-        report["flagged"] = True if flag and flag.is_active else False
+    return table_response(
+        request,
+        reports,
+        columns={
+            "flagged": "flagged",
+            "user__first_name": "user__first_name",
+            "user_id": "user_id",
+            "unread": "unread",
+            "date_updated__date": "date_updated__date",
+            "user__last_name": "user__last_name",
+            "is_viewed": "is_viewed",
+            "total_entries": "total_entries",
+        },
+        search_columns=["user__first_name", "user__last_name"],
+        default_order=["-unread", "-flagged", "-date_updated__date"],
+        key=None,
+        format_row=format_patient_report_row,
+    )
 
-    # Serialize it in a JSON format for the datatable to parse
-    serialized_reports = json.dumps({'data': reports}, cls=DjangoJSONEncoder, default=str)
 
-    return HttpResponse(serialized_reports, content_type='application/json')
+def format_patient_report_row(row):
+    row["unread"] = bool(row["unread"])
+    return row
 
 
 @login_required
@@ -179,10 +196,19 @@ def patient_reports_modal_table(request, user_id, date_updated):
     # Return a query set of all symptoms for the patient
     report_symptom_list = get_patient_report_information(user_id, request.user, date_updated)
 
-    # Serialize it in a JSON format for the datatable to parse
-    serialized_reports = json.dumps({'data': list(report_symptom_list)}, cls=DjangoJSONEncoder, default=str)
-
-    return HttpResponse(serialized_reports, content_type='application/json')
+    return table_response(
+        request,
+        report_symptom_list,
+        columns={
+            "id": "id",
+            "symptom__name": "symptom__name",
+            "data": "data",
+            "date_updated": "date_updated",
+            "status": "status",
+            "due_date": "due_date",
+        },
+        default_order=["symptom__name"],
+    )
 
 
 @login_required
@@ -486,6 +512,7 @@ def test_report(request, user_id):
             elif test_result_form.cleaned_data.get("test_result") == '2':
                 patient_object.is_negative = False
             patient_object.save()
+            record_case_events([patient_object])
 
         messages.success(request, 'Your test report has been uploaded successfully.')
         return redirect('status:test_results', user_id=user_id)
@@ -506,14 +533,20 @@ def test_results_table(request, user_id):
     @param user_id: the user ID of the patient that uploaded the test report
     """
     existing_results = Patient.objects.get(user_id=user_id).test_results
-
-    if existing_results is not None:
-        serialized_reports = json.dumps({'data': list(existing_results['all_results'])}, cls=DjangoJSONEncoder, default=str)
-
-        return HttpResponse(serialized_reports, content_type='application/json')
-    else:
-        serialized_reports = json.dumps({'data': list({})}, cls=DjangoJSONEncoder, default=str)
-        return HttpResponse(serialized_reports, content_type='application/json')
+    results = list(existing_results['all_results']) if existing_results is not None else []
+
+    return table_response(
+        request,
+        results,
+        columns={
+            "test_date": "test_date",
+            "test_result": "test_result",
+            "test_type": "test_type",
+            "test_file": "test_file",
+        },
+        search_columns=["test_date", "test_result", "test_type"],
+        default_order=["-test_date"],
+    )
 
 
 @login_required
@@ -113,7 +113,7 @@ class SymptomsTestCase(TransactionTestCase):
         # the two posted symptoms in its context
         self.response = self.client.get(reverse('symptoms:list_symptoms_table'))
         self.assertEqual(
-            list(map(lambda x: x["description"], json.loads(self.response.content)["data"])),
+            list(map(lambda x: x["description"], json.loads(self.response.getvalue())["data"])),
             list(Symptom.objects.values_list("description", flat=True))
         )
 
@@ -205,11 +205,56 @@ class SymptomsTestCase(TransactionTestCase):
         # the two posted symptoms with changes in its context
         self.response = self.client.get(reverse('symptoms:list_symptoms_table'))
         self.assertEqual(
-            list(map(lambda x: x["description"], json.loads(self.response.content)["data"])),
+            list(map(lambda x: x["description"], json.loads(self.response.getvalue())["data"])),
             list(Symptom.objects.values_list("description", flat=True))
         )
 
 
+class ListSymptomsTableTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(is_superuser=True, username="admin")
+        for name in ["Fever", "Cough", "Chills", "Fatigue"]:
+            Symptom.objects.create(name=name, description=f"{name} description", is_active=name != "Cough")
+
+    def get_table(self, **params):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('symptoms:list_symptoms_table'), {
+            "draw": 1, "columns[0][data]": "id", "columns[1][data]": "name", "columns[3][data]": "enabled", **params
+        })
+        return json.loads(response.getvalue())
+
+    def test_enabled_filter_and_search(self):
+        """
+        Test that the enabled column filter and the search box are applied by the database
+        @return: void
+        """
+
+        disabled = self.get_table(**{"columns[3][search][value]": "0"})
+        searched = self.get_table(**{"search[value]": "F", "order[0][column]": 1})
+
+        self.assertEqual(["Cough"], [row["name"] for row in disabled["data"]])
+        self.assertEqual(4, disabled["recordsTotal"])
+        self.assertEqual(1, disabled["recordsFiltered"])
+        self.assertEqual(["Fatigue", "Fever"], [row["name"] for row in searched["data"]])
+
+    def test_pages_follow_cursor(self):
+        """
+        Test that every symptom is returned once when following the cursor of each page
+        @return: void
+        """
+
+        names = []
+        table = self.get_table(length=3)
+        while True:
+            names += [row["name"] for row in table["data"]]
+            if not table["next"]:
+                break
+            table = self.get_table(length=3, start=table["next"]["start"], cursor=table["next"]["cursor"])
+
+        self.assertEqual(list(Symptom.objects.order_by("id").values_list("name", flat=True)), names)
+
+
 class ToggleSymptomTests(TestCase):
     @classmethod
     def setUpTestData(cls):
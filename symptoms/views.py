@@ -1,14 +1,14 @@
-import json
-
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.core.exceptions import PermissionDenied
 from django.db.models import Q
-from django.http import HttpResponse
 from django.shortcuts import render, redirect
 from django.views.decorators.cache import never_cache
 
+from Covigo.tables import table_response
+from accounts.authorization import get_authorization_context
+from accounts.case_history import record_case_events
 from symptoms.forms import CreateSymptomForm
 from symptoms.models import Symptom, PatientSymptom
 from symptoms.utils import (
@@ -48,18 +48,18 @@ def list_symptoms_table(request):
     if not request.user.has_perm("accounts.manage_symptoms"):
         raise PermissionDenied
 
-    symptoms_table = []
-    for symptom in Symptom.objects.all():
-        symptoms_table.append({
-            "id": symptom.id,
-            "name": symptom.name,
-            "description": symptom.description,
-            "enabled": symptom.is_active,
-        })
-
-    serialized_symptoms = json.dumps({'data': symptoms_table}, indent=4)
-
-    return HttpResponse(serialized_symptoms, content_type='application/json')
+    return table_response(
+        request,
+        Symptom.objects.all(),
+        columns={
+            "id": "id",
+            "name": "name",
+            "description": "description",
+            "enabled": "is_active",
+        },
+        search_columns=["name", "description"],
+        default_order=["id"],
+    )
 
 
 # this function allows form data from the "Create Symptom" page to be submitted and handled properly
@@ -148,7 +148,7 @@ def edit_symptom(request, symptom_id):
 def assign_symptom(request, user_id):
     patient = User.objects.get(pk=user_id)
 
-    can_assign_symptom = (not patient.is_staff and (request.user.has_perm("accounts.assign_symptom_patient") or request.user.has_perm("accounts.assign_symptom_assigned") and patient in request.user.staff.get_assigned_patient_users()))
+    can_assign_symptom = get_authorization_context(request).can_assign_symptoms(patient)
 
     if not can_assign_symptom:
         raise PermissionDenied
@@ -236,6 +236,7 @@ def assign_symptom(request, user_id):
                 if patient_information.is_quarantining is not quarantine_status_changed:
                     patient_information.is_quarantining = quarantine_status_changed
                     patient_information.save()
+                    record_case_events([patient_information])
 
         return redirect('accounts:profile', user_id=user_id)
 